@@ -0,0 +1,83 @@
+"""
+WebSocket 連接准入控制（每個 worker 各自統計）
+- 每個 IP 的建立連接速率（令牌桶），在查詢資料庫驗證 token 之前檢查
+- 每個 worker 的連接總數上限，同樣在查詢資料庫之前檢查
+- 每個用戶在本 worker 的連接數上限（驗證 token 之後）
+超出限制的連接先 accept 再以關閉碼關閉，客戶端可以區分原因：
+- 1013 Try Again Later：IP 連接過於頻繁、worker 已滿，客戶端應退避後重試
+- 1008 Policy Violation：同一用戶打開的連接過多
+限制值和拒絕次數記錄在 metrics（websocket.admission.*）
+"""
+from typing import Optional, Tuple
+
+from fastapi import WebSocket
+
+from app.config import settings
+from app.metrics import metrics
+from app.ratelimit import MemoryRateLimitBackend
+
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        max_per_user: int,
+        max_per_worker: int,
+        connect_rate_per_ip: float,
+        connect_burst_per_ip: int,
+        max_tracked_ips: int
+    ):
+        self.max_per_user = max_per_user
+        self.max_per_worker = max_per_worker
+        self.rate = connect_rate_per_ip
+        self.burst = connect_burst_per_ip
+        self.max_tracked_ips = max_tracked_ips
+        # 每個 IP 的令牌桶（LRU，最多 max_tracked_ips 個）
+        self._ip_buckets = MemoryRateLimitBackend(max_tracked_ips)
+        metrics.set_gauge("websocket.admission.max_per_user", max_per_user)
+        metrics.set_gauge("websocket.admission.max_per_worker", max_per_worker)
+        metrics.set_gauge("websocket.admission.connect_rate_per_ip", connect_rate_per_ip)
+        metrics.set_gauge("websocket.admission.connect_burst_per_ip", connect_burst_per_ip)
+
+    def allow_ip(self, ip: str) -> bool:
+        """消耗 IP 的一個令牌，令牌不足時返回 False（速率為 0 表示不限制）"""
+        if self.rate <= 0 or not ip:
+            return True
+        return not self._ip_buckets.take(ip, self.rate, self.burst)
+
+    def check_before_auth(self, ip: str, connection_count: int) -> Optional[Tuple[int, str, str]]:
+        """查詢資料庫之前的檢查，返回 (關閉碼, 原因, 指標名) 或 None"""
+        if not self.allow_ip(ip):
+            return CLOSE_TRY_AGAIN_LATER, "Too many connection attempts", "ip_rate"
+        if self.max_per_worker > 0 and connection_count >= self.max_per_worker:
+            return CLOSE_TRY_AGAIN_LATER, "Server at capacity", "worker_full"
+        return None
+
+    def check_user(self, user_connections: int) -> Optional[Tuple[int, str, str]]:
+        """驗證 token 之後檢查用戶在本 worker 的連接數"""
+        if self.max_per_user > 0 and user_connections >= self.max_per_user:
+            return CLOSE_POLICY_VIOLATION, "Too many connections for this user", "user_limit"
+        return None
+
+    async def reject(self, websocket: WebSocket, rejection: Tuple[int, str, str]):
+        """accept 後立即以關閉碼關閉（未 accept 就關閉時客戶端只能看到 HTTP 403）"""
+        code, reason, name = rejection
+        metrics.inc(f"websocket.admission.rejected.{name}")
+        metrics.set_gauge("websocket.admission.tracked_ips", self._ip_buckets.size)
+        try:
+            await websocket.accept()
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+# 全局准入控制
+admission_control = AdmissionControl(
+    max_per_user=settings.WS_MAX_CONNECTIONS_PER_USER,
+    max_per_worker=settings.WS_MAX_CONNECTIONS_PER_WORKER,
+    connect_rate_per_ip=settings.WS_CONNECT_RATE_PER_IP,
+    connect_burst_per_ip=settings.WS_CONNECT_BURST_PER_IP,
+    max_tracked_ips=settings.WS_CONNECT_RATE_MAX_TRACKED_IPS
+)
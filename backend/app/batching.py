@@ -0,0 +1,84 @@
+"""
+WebSocket 事件合併發送（per-tick batching）
+繁忙房間和在線狀態抖動時，每個事件單獨一幀、一次 send 調用，幀頭和系統調用開銷遠大於事件本身。
+開啟後（WS_BATCH_WINDOW_MS > 0 且客戶端連接時帶 ?batch=1）：
+- 事件先序列化（同一次扇出每種編碼只序列化一次），放入連接的優先級通道（app.outbound）
+- 每個 worker 只有一個計時任務：第一個事件入隊後等待一個窗口，再把所有連接的待發送事件各自拼成一個數組幀發送，
+  數組內按優先級排列（消息、房間事件、在線狀態）
+- 同一用戶的 USER_UPDATE / USER_LEFT 在窗口內合併為最終狀態（欄位取並集，後到的值優先）
+- 窗口內只有一個事件時按原格式發送單個對象，客戶端需同時支持對象和數組
+"""
+import asyncio
+from typing import List, Optional
+
+from app.config import settings
+from app.connections import ConnectionRecord
+from app.outbound import clear, drain, queue_event
+
+
+class EventBatcher:
+    def __init__(self, window_ms: int):
+        self.window = window_ms / 1000
+        # 本窗口內有待發送事件的連接
+        self._dirty: List[ConnectionRecord] = []
+        self._manager = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def enqueue(self, record: ConnectionRecord, message: dict, frame):
+        """將已序列化的事件放入連接的待發送通道；正在發送的連接由當前發送者接著發送"""
+        if record.pending is None and not record.sending:
+            self._dirty.append(record)
+            if self._task is None:
+                self._task = asyncio.create_task(self._flush_later())
+        queue_event(record, message, frame)
+
+    def discard(self, record: ConnectionRecord):
+        """連接斷開時丟棄待發送事件"""
+        clear(record)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """發送所有連接的待發送事件，每個連接一幀"""
+        dirty, self._dirty = self._dirty, []
+        failed = []
+        for record in dirty:
+            # 已斷開、或正在發送（發送者會接著發送積壓事件）的連接跳過
+            if record.pending is None or record.sending:
+                continue
+            try:
+                await drain(record)
+            except Exception as e:
+                print(f"[WebSocket] Error sending batch to user {record.user_id}: {e}")
+                failed.append(record)
+        if self._manager is not None:
+            for record in failed:
+                self._manager.disconnect(record)
+
+    def start(self, manager):
+        """綁定 ConnectionManager（發送失敗時用於移除連接）"""
+        self._manager = manager
+
+    async def stop(self):
+        """取消計時任務並立即發送剩餘事件"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# 全局事件合併器
+event_batcher = EventBatcher(window_ms=settings.WS_BATCH_WINDOW_MS)
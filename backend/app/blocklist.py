@@ -0,0 +1,189 @@
+"""
+用戶封鎖列表快取
+每個用戶封鎖的用戶 ID 集合快取在記憶體中（LRU + TTL）：
+- 查詢歷史/搜索/輪詢時不必每次查詢 user_relationships
+- 房間扇出時以 O(1) 判斷接收者是否封鎖了發送者
+
+跨 worker 失效：block_user / unblock_user / toggle_favorite 在同一事務內更新 users.blocklist_changed_at，
+快取條目記錄載入時的該值（版本）：
+- HTTP 請求傳入 get_current_user 從主庫讀取的版本，不一致時重新載入，修改立即對所有 worker 生效
+- 後台任務每 BLOCKED_CACHE_SYNC_SECONDS 查詢最近變化的用戶，丟棄版本過期的條目（用於 WebSocket 扇出）
+TTL 只作為兜底。
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User, UserRelationship
+
+EMPTY: FrozenSet[str] = frozenset()
+
+# 查詢最近變化時往前多看的時間，容忍 worker 之間的時鐘偏差（重複查到的用戶版本一致時不受影響）
+SYNC_CLOCK_SKEW_SECONDS = 5.0
+
+
+def mark_changed(db: Session, user_id: str):
+    """在當前事務內更新用戶封鎖列表的版本（在 commit 之前調用），不改變 updated_at"""
+    users = User.__table__
+    db.execute(
+        update(users).where(users.c.id == user_id).values(blocklist_changed_at=time.time(), updated_at=users.c.updated_at)
+    )
+
+
+class BlockedCache:
+    def __init__(self, max_users: int, ttl_seconds: float, sync_interval_seconds: float = 1.0):
+        self.max_users = max_users
+        self.ttl = ttl_seconds
+        self.sync_interval = sync_interval_seconds
+        # {user_id: (blocked_ids, loaded_at, version)}
+        self._entries: "OrderedDict[str, Tuple[FrozenSet[str], float, Optional[float]]]" = OrderedDict()
+        self._synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _store(self, user_id: str, blocked_ids: FrozenSet[str], version: Optional[float] = None):
+        self._entries[user_id] = (blocked_ids, time.monotonic(), version)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def peek(self, user_id: str) -> Optional[FrozenSet[str]]:
+        """只讀快取，不查詢資料庫；未快取或已過期返回 None"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        blocked_ids, loaded_at, _ = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return blocked_ids
+
+    def get(self, db: Session, user_id: str, version: Optional[float]) -> FrozenSet[str]:
+        """
+        獲取用戶封鎖的用戶 ID 集合
+        version 為從主庫讀取的 users.blocklist_changed_at（通常是 current_user 的），與快取不一致時重新載入
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[2] != version:
+            self.invalidate(user_id)
+        blocked_ids = self.peek(user_id)
+        if blocked_ids is None:
+            blocked_ids = self.load_many(db, [user_id])[user_id]
+        return blocked_ids
+
+    def load_many(self, db: Session, user_ids: Iterable[str]) -> Dict[str, FrozenSet[str]]:
+        """一次查詢載入多個用戶中尚未快取的封鎖列表（連同版本）"""
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            blocked_ids = self.peek(user_id)
+            if blocked_ids is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = blocked_ids
+        if missing:
+            loaded: Dict[str, set] = {user_id: set() for user_id in missing}
+            versions: Dict[str, Optional[float]] = {}
+            rows = db.execute(
+                select(User.id, User.blocklist_changed_at, UserRelationship.target_id)
+                .outerjoin(UserRelationship, and_(
+                    UserRelationship.user_id == User.id,
+                    UserRelationship.relationship_type == "blocked"
+                ))
+                .where(User.id.in_(missing))
+            ).all()
+            for user_id, version, target_id in rows:
+                versions[user_id] = version
+                if target_id is not None:
+                    loaded[user_id].add(target_id)
+            for user_id, blocked_ids in loaded.items():
+                frozen = frozenset(blocked_ids) if blocked_ids else EMPTY
+                self._store(user_id, frozen, versions.get(user_id))
+                result[user_id] = frozen
+        return result
+
+    def ensure_loaded(self, user_ids: Iterable[str]) -> Dict[str, FrozenSet[str]]:
+        """同 load_many，但只在有未快取的用戶時才打開資料庫會話（用於 WebSocket 扇出）"""
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            blocked_ids = self.peek(user_id)
+            if blocked_ids is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = blocked_ids
+        if missing:
+            db = SessionLocal()
+            try:
+                result.update(self.load_many(db, missing))
+            finally:
+                db.close()
+        return result
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    def load_changes(self, since: float) -> Dict[str, Optional[float]]:
+        """查詢 since（epoch 秒）之後封鎖列表有變化的用戶及其當前版本"""
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(User.id, User.blocklist_changed_at).where(User.blocklist_changed_at >= since)
+            ).all()
+        finally:
+            db.close()
+        return {user_id: version for user_id, version in rows}
+
+    def apply_changes(self, changes: Dict[str, Optional[float]]) -> int:
+        """丟棄版本與資料庫不一致的條目，返回丟棄數"""
+        dropped = 0
+        for user_id, version in changes.items():
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[2] != version:
+                del self._entries[user_id]
+                dropped += 1
+        return dropped
+
+    async def sync(self):
+        """查詢上次同步之後其他 worker 修改過的封鎖列表並使本地快取失效"""
+        started = time.time()
+        since = (self._synced_at if self._synced_at is not None else started) - SYNC_CLOCK_SKEW_SECONDS
+        changes = await asyncio.to_thread(self.load_changes, since)
+        self.apply_changes(changes)
+        self._synced_at = started
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"[BlockedCache] Error syncing block list changes: {e}")
+
+    def start(self):
+        """啟動後台同步任務（在事件循環中調用；sync_interval 為 0 時不啟動）"""
+        if self._task is None and self.sync_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局封鎖列表快取
+blocked_cache = BlockedCache(
+    max_users=settings.BLOCKED_CACHE_MAX_USERS,
+    ttl_seconds=settings.BLOCKED_CACHE_TTL_SECONDS,
+    sync_interval_seconds=settings.BLOCKED_CACHE_SYNC_SECONDS
+)
@@ -0,0 +1,50 @@
+"""
+WebSocket 事件編碼
+- json（默認）：文本幀
+- msgpack：二進制幀，需要安裝 msgpack（pip install msgpack）
+客戶端通過 /ws?encoding=msgpack 選擇；客戶端發往服務端的消息仍使用 JSON 文本。
+"""
+import json
+import time
+from typing import List, Union
+
+from app.metrics import metrics
+
+try:
+    import msgpack
+except ImportError:  # 可選依賴
+    msgpack = None
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+
+def negotiate_encoding(requested: str | None) -> str:
+    """根據客戶端請求選擇編碼，不支持時回退到 JSON"""
+    if requested == ENCODING_MSGPACK:
+        if msgpack is not None:
+            return ENCODING_MSGPACK
+        print("[WebSocket] msgpack encoding requested but msgpack is not installed, falling back to json")
+    return ENCODING_JSON
+
+
+def encode_event(message: dict, encoding: str) -> Union[str, bytes]:
+    """序列化事件，記錄耗時和輸出字節數"""
+    start = time.perf_counter()
+    if encoding == ENCODING_MSGPACK:
+        frame = msgpack.packb(message, use_bin_type=True)
+        size = len(frame)
+    else:
+        # 與 Starlette send_json 保持一致的格式
+        frame = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        size = len(frame.encode("utf-8"))
+    metrics.observe(f"websocket.encode_seconds.{encoding}", time.perf_counter() - start)
+    metrics.inc(f"websocket.encoded_bytes.{encoding}", size)
+    return frame
+
+
+def join_frames(frames: List[Union[str, bytes]], encoding: str) -> Union[str, bytes]:
+    """將多個已序列化的事件拼接為一個數組幀，無需重新序列化"""
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.Packer().pack_array_header(len(frames)) + b"".join(frames)
+    return "[" + ",".join(frames) + "]"
@@ -12,6 +12,27 @@ class Settings(BaseSettings):
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
     DB_NAME: str = "chat-react-fastapi"
+    DATABASE_URL: str = ""  # 設置後覆蓋上面的 MySQL 配置（例如 sqlite:///./chat.db）
+    
+    DB_ID_STORAGE: str = "char36"  # 主鍵存儲方式：char36（VARCHAR(36)）或 binary16（MySQL BINARY(16)，切換後需執行 migrate.py 轉換現有資料庫，見 m0011_ids_binary16）
+    
+    # 連接池配置（每個 worker 各自一個連接池，總連接數 = worker 數 ×（POOL_SIZE + MAX_OVERFLOW））
+    DB_POOL_SIZE: int = 5  # 每個 worker 常駐連接數
+    DB_MAX_OVERFLOW: int = 10  # 每個 worker 臨時額外連接數
+    DB_POOL_TIMEOUT_SECONDS: float = 5.0  # 等待空閒連接的超時時間，超時返回錯誤而非長時間掛起
+    DB_POOL_RECYCLE_SECONDS: int = 3600
+    DB_WORKERS: int = 8  # gunicorn worker 數，用於按預算分配每個 worker 的連接數
+    DB_CONNECTION_BUDGET: int = 0  # 所有 worker 合計的連接上限（如 MySQL max_connections 減去預留），0 表示不限制
+    DB_POOL_HOLD_WARN_SECONDS: float = 1.0  # 單次持有連接超過此時間記錄警告
+    DB_POOL_TRACK_STACKS: bool = False  # 記錄借出連接時的調用棧（調試用，有額外開銷）
+    DB_SLOW_QUERY_MS: float = 200.0  # 單條語句超過此時間打印慢查詢日誌（含所屬路由）
+    DB_SERVER_TIMING: bool = True  # 響應頭 Server-Timing 中返回本次請求的查詢次數和資料庫時間
+    
+    # 讀寫分離配置
+    DATABASE_READ_URLS: str = ""  # 只讀副本連接字符串，多個用逗號分隔；為空時所有讀取走主庫
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0  # 用戶寫入後多久內其讀取仍走主庫
+    DB_REPLICA_MAX_LAG_SECONDS: float = 2.0  # 副本延遲超過此值時回退到主庫
+    DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = 5.0  # 每個 worker 後台測量副本延遲的間隔（請求路由只讀取測量結果）
     
     # JWT 配置
     SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -27,6 +48,86 @@ class Settings(BaseSettings):
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_IMAGE_TYPES: list = ["image/jpeg", "image/png", "image/webp", "image/gif"]
     
+    # 在線狀態配置
+    PRESENCE_GRACE_SECONDS: float = 15.0  # 最後一個連接斷開後多久才視為離線
+    PRESENCE_FLUSH_INTERVAL_MS: int = 250  # 狀態變化合併後批量廣播的間隔
+    PRESENCE_PERSIST_INTERVAL_SECONDS: float = 5.0  # 狀態變化批量寫入資料庫的間隔
+    PRESENCE_WORKER_STALE_SECONDS: float = 30.0  # worker 心跳超過此時間未更新視為已停止，其連接不再計入在線（需大於 PRESENCE_PERSIST_INTERVAL_SECONDS）
+    
+    # 關閉/重啟配置（使用 app.workers.ChatUvicornWorker 時生效）
+    SHUTDOWN_RECONNECT_MIN_MS: int = 2000  # 重連提示的最小延遲
+    SHUTDOWN_RECONNECT_MAX_MS: int = 15000  # 重連提示的最大延遲，客戶端重連均勻分散在此區間內
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS: float = 10.0  # 發送重連提示並關閉連接的最長時間，需小於 gunicorn --graceful-timeout
+    
+    # WebSocket 心跳配置
+    HEARTBEAT_INTERVAL_SECONDS: float = 30.0  # 閒置超過此時間服務端發送 ping
+    HEARTBEAT_TIMEOUT_SECONDS: float = 75.0  # 閒置超過此時間視為失聯並關閉
+    HEARTBEAT_WHEEL_SLOTS: int = 30  # 時間輪槽位數，每個 tick 只檢查一個槽位
+    
+    # WebSocket 連接准入配置（每個 worker 各自計算，0 表示不限制）
+    WS_MAX_CONNECTIONS_PER_USER: int = 20  # 同一用戶在一個 worker 上的最大連接數（多分頁/多設備）
+    WS_MAX_CONNECTIONS_PER_WORKER: int = 20000  # 每個 worker 的最大連接數
+    WS_CONNECT_RATE_PER_IP: float = 5.0  # 每個 IP 每秒可建立的連接數（令牌補充速率；公司 NAT 後多個用戶共用 IP，不宜過小）
+    WS_CONNECT_BURST_PER_IP: int = 50  # 每個 IP 可瞬間建立的連接數（令牌桶容量）
+    WS_CONNECT_RATE_MAX_TRACKED_IPS: int = 100000  # 最多記錄多少個 IP 的令牌桶（LRU）
+    
+    # HTTP 接口限流配置（令牌桶，每個用戶 × 每個路由一個桶；速率為 0 表示不限制）
+    RATE_LIMIT_BACKEND: str = "memory"  # memory（每個 worker 各自計數）或 database（所有 worker 共用 rate_limit_buckets 表）
+    RATE_LIMIT_MESSAGES_PER_SECOND: float = 2.0  # 發送消息：每秒補充令牌數
+    RATE_LIMIT_MESSAGES_BURST: int = 20  # 發送消息：桶容量（可連續發送的條數）
+    RATE_LIMIT_SEARCH_PER_SECOND: float = 0.5  # 搜索消息
+    RATE_LIMIT_SEARCH_BURST: int = 10
+    RATE_LIMIT_UPLOAD_PER_SECOND: float = 0.2  # 上傳頭像和消息圖片（共用一個桶）
+    RATE_LIMIT_UPLOAD_BURST: int = 10
+    RATE_LIMIT_MAX_TRACKED_KEYS: int = 100000  # memory 後端最多記錄多少個桶（LRU）
+    RATE_LIMIT_STALE_SECONDS: int = 3600  # database 後端刪除超過此時間未使用的桶
+    
+    # 事件循環延遲監控和負載削減
+    LOOP_LAG_INTERVAL_SECONDS: float = 0.5  # 採樣間隔，0 表示關閉採樣
+    LOAD_SHED_ENABLED: bool = False  # 過載時對搜索、調試端點、完整用戶列表返回 503
+    LOAD_SHED_LAG_MS: float = 200.0  # 事件循環延遲超過此值視為過載
+    LOAD_SHED_HOLD_SECONDS: float = 5.0  # 過載後持續削減的時間（也作為 Retry-After）
+    
+    # WebSocket 事件合併發送配置（客戶端通過 /ws?batch=1 選擇）
+    WS_BATCH_WINDOW_MS: int = 0  # 合併窗口（建議 10-25），窗口內的事件合併為一個數組幀發送，0 表示關閉
+    
+    # WebSocket 出站優先級通道配置（連接正在發送時，新事件按 消息 > 房間事件 > 在線狀態 排隊）
+    WS_OUTBOUND_MAX_QUEUED: int = 1000  # 每個連接積壓的消息/房間事件上限，超出時關閉連接（客戶端重連補發）
+    WS_OUTBOUND_MAX_LOW_PRIORITY: int = 500  # 每個連接積壓的在線狀態事件上限（合併後），超出時丟棄
+    
+    # WebSocket 壓縮配置（permessage-deflate，需使用 app.workers.ChatUvicornWorker）
+    WS_COMPRESSION_ENABLED: bool = True
+    WS_COMPRESSION_LEVEL: int = 6  # zlib 壓縮等級 1-9
+    WS_COMPRESSION_MEM_LEVEL: int = 5  # zlib memLevel 1-9，越小每個連接佔用記憶體越少
+    WS_COMPRESSION_SERVER_MAX_WINDOW_BITS: int = 12  # 服務端滑動窗口 8-15
+    WS_COMPRESSION_CLIENT_MAX_WINDOW_BITS: int = 12  # 客戶端滑動窗口 8-15
+    WS_COMPRESSION_SERVER_NO_CONTEXT_TAKEOVER: bool = False  # True 時每條消息重置壓縮上下文（省記憶體、壓縮率較低）
+    WS_COMPRESSION_CLIENT_NO_CONTEXT_TAKEOVER: bool = False
+    
+    # 封鎖列表快取配置
+    BLOCKED_CACHE_MAX_USERS: int = 50000  # 最多快取多少個用戶的封鎖列表（LRU）
+    BLOCKED_CACHE_TTL_SECONDS: float = 60.0  # 快取有效期（兜底，修改通過 users.blocklist_changed_at 跨 worker 失效）
+    BLOCKED_CACHE_SYNC_SECONDS: float = 1.0  # 查詢其他 worker 修改的間隔，WebSocket 扇出最遲在此時間後使用新的封鎖列表；0 表示不同步
+    
+    # 房間刪除配置
+    ROOM_PURGE_BATCH_SIZE: int = 500  # 後台清理每批刪除的消息數
+    ROOM_PURGE_BATCH_PAUSE_SECONDS: float = 0.05  # 批次之間的間隔，讓出資料庫和事件循環
+    ROOM_PURGE_CLAIM_STALE_SECONDS: float = 60.0  # 清理認領超過此時間未續期時由其他 worker 接管，也是掃描未完成清理的間隔
+    
+    # 房間最近消息快取配置
+    MESSAGE_CACHE_ROOM_CAPACITY: int = 100  # 每個房間快取最近多少條消息
+    MESSAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 所有房間共享的記憶體預算（估算值）
+    MESSAGE_CACHE_TTL_SECONDS: float = 30.0  # 快取條目最長保留時間（讀取時已按房間最新消息 ID 校驗，其他 worker 的消息立即可見）
+    
+    # 按需採樣分析（未設置 PROFILING_TOKEN 時完全關閉）
+    PROFILING_TOKEN: str = ""  # 請求頭 X-Profile-Token 的值，設置後才能觸發分析
+    PROFILING_SAMPLE_INTERVAL_MS: float = 5.0  # 採樣間隔
+    PROFILING_MAX_SECONDS: float = 60.0  # 整個 worker 分析的最長時間
+    PROFILING_OUTPUT_DIR: str = "profiles"  # 輸出目錄（folded stacks），相對路徑基於後端目錄
+    
+    # 調試端點（/api/debug/metrics 等，未設置 DEBUG_TOKEN 時返回 404）
+    DEBUG_TOKEN: str = ""  # 請求頭 X-Debug-Token 的值
+    
     class Config:
         env_file = ".env"
     
@@ -39,7 +140,13 @@ class Settings(BaseSettings):
         else:
             # 相對路徑，基於後端目錄
             return (BACKEND_DIR / upload_dir).resolve()
+    
+    @property
+    def profile_dir_absolute(self) -> Path:
+        """獲取分析輸出目錄的絕對路徑"""
+        if os.path.isabs(self.PROFILING_OUTPUT_DIR):
+            return Path(self.PROFILING_OUTPUT_DIR).resolve()
+        return (BACKEND_DIR / self.PROFILING_OUTPUT_DIR).resolve()
 
 
 settings = Settings()
-
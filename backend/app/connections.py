@@ -0,0 +1,64 @@
+"""
+WebSocket 連接記錄
+每個連接一個 ConnectionRecord（__slots__，沒有實例 __dict__），集中保存原本分散在
+ConnectionManager 和心跳調度器多個字典中的狀態：編碼、最後活動時間、所在容器的位置。
+
+記錄存放在普通列表中，並記住自己在列表中的下標，移除時用最後一個元素填補空位（swap-remove），
+添加和移除都是 O(1)，且不需要為每個用戶或每個連接額外建立字典。
+"""
+import time
+from typing import List
+
+from fastapi import WebSocket
+
+from app.codec import ENCODING_JSON
+
+
+class ConnectionRecord:
+    __slots__ = (
+        "websocket", "user_id", "encoding", "last_seen", "index", "slot", "slot_index",
+        "batched", "sending", "pending", "pending_keys",
+    )
+
+    def __init__(self, websocket: WebSocket, user_id: str, encoding: str = ENCODING_JSON, batched: bool = False):
+        self.websocket = websocket
+        self.user_id = user_id
+        # 事件編碼（json / msgpack）
+        self.encoding = encoding
+        # 最後收到客戶端消息的時間（monotonic），心跳調度器用於判斷閒置
+        self.last_seen = time.monotonic()
+        # 在用戶連接列表中的下標，不在列表中時為 -1
+        self.index = -1
+        # 所在的心跳時間輪槽位及槽位中的下標，未註冊時為 -1
+        self.slot = -1
+        self.slot_index = -1
+        # 是否按 tick 合併發送（客戶端 ?batch=1 且服務端開啟 WS_BATCH_WINDOW_MS）
+        self.batched = batched
+        # 是否有協程正在向該連接發送（同一時間只有一個發送者，其他事件進入待發送通道）
+        self.sending = False
+        # 待發送的已序列化事件，按優先級分通道（app.outbound），沒有待發送事件時為 None
+        self.pending = None
+        # 待發送通道中可合併的事件：{user_id: [key, 事件, 幀]}
+        self.pending_keys = None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
+def append_record(records: List[ConnectionRecord], record: ConnectionRecord):
+    """添加到用戶連接列表"""
+    record.index = len(records)
+    records.append(record)
+
+
+def remove_record(records: List[ConnectionRecord], record: ConnectionRecord) -> bool:
+    """從用戶連接列表移除（swap-remove），記錄不在列表中時返回 False"""
+    index = record.index
+    if index < 0 or index >= len(records) or records[index] is not record:
+        return False
+    last = records.pop()
+    if last is not record:
+        records[index] = last
+        last.index = index
+    record.index = -1
+    return True
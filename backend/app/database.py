@@ -1,30 +1,252 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import random
+import time
+from typing import List, Optional
+
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
+from app.metrics import metrics
+from app.pool_monitor import InstrumentedQueuePool, instrument_engine, per_worker_pool_limits
+from app.query_stats import instrument_queries
+
+# 創建資料庫連接字符串（設置 DATABASE_URL 時優先使用，例如 sqlite:///./chat.db）
+DATABASE_URL = settings.DATABASE_URL or f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}?charset=utf8mb4"
+
+
+def build_engine(url: str, name: str = "primary"):
+    """按方言創建引擎；SQLite 只用於本地開發和測試"""
+    pool_size, max_overflow = per_worker_pool_limits()
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            connect_args={"check_same_thread": False},
+            echo=False
+        )
+        instrument_engine(engine, name)
+        instrument_queries(engine, name)
+        return engine
+    engine = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,  # 每個 worker 常駐連接數
+        max_overflow=max_overflow,  # 每個 worker 臨時額外連接數
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,  # 連接池超時時間（秒）
+        connect_args={
+            "connect_timeout": 10,  # MySQL 連接超時時間（秒）
+        },
+        echo=False  # 設為 True 可以看到 SQL 語句
+    )
+    instrument_engine(engine, name)
+    instrument_queries(engine, name)
+    return engine
+
+
+# 創建引擎（主庫，所有寫入和默認讀取）
+engine = build_engine(DATABASE_URL)
+
+
+class ReadReplica:
+    """只讀副本及其複製延遲狀態（延遲由 ReplicaLagMonitor 在後台測量，路由時只讀取緩存值）"""
+
+    def __init__(self, name: str, engine, max_lag_seconds: float, check_interval_seconds: float):
+        self.name = name
+        self.engine = engine
+        self.max_lag = max_lag_seconds
+        self.check_interval = check_interval_seconds
+        # 尚未測量過時不可讀
+        self.lag: Optional[float] = None
+        self._checked_at = float("-inf")
+
+    def measure_lag(self) -> Optional[float]:
+        """查詢複製延遲（秒）；複製中斷返回 None。非 MySQL（SQLite 替身）視為無延遲"""
+        if self.engine.dialect.name != "mysql":
+            return 0.0
+        with self.engine.connect() as conn:
+            try:
+                row = conn.exec_driver_sql("SHOW REPLICA STATUS").mappings().first()
+            except Exception:
+                # MySQL 8.0.22 之前的語法
+                row = conn.exec_driver_sql("SHOW SLAVE STATUS").mappings().first()
+        if row is None:
+            # 不是副本（例如直接指向主庫）
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
+
+    def refresh(self):
+        """測量並緩存延遲（阻塞，在線程池中調用）"""
+        try:
+            self.lag = self.measure_lag()
+        except Exception as e:
+            self.lag = None
+            print(f"[Database] Replica lag check failed: {e}")
+        self._checked_at = time.monotonic()
+        metrics.set_gauge(f"db.replica_lag_seconds.{self.name}", -1 if self.lag is None else self.lag)
+
+    def is_usable(self) -> bool:
+        """
+        緩存的延遲在閾值內才可讀（不查詢資料庫）
+        超過 3 個測量間隔沒有更新時（後台任務停止或事件循環停頓）視為不可讀
+        """
+        if time.monotonic() - self._checked_at > self.check_interval * 3:
+            return False
+        return self.lag is not None and self.lag <= self.max_lag
+
+
+read_replicas: List[ReadReplica] = [
+    ReadReplica(
+        f"replica{index}",
+        build_engine(url, f"replica{index}"),
+        max_lag_seconds=settings.DB_REPLICA_MAX_LAG_SECONDS,
+        check_interval_seconds=settings.DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS
+    )
+    for index, url in enumerate(url.strip() for url in settings.DATABASE_READ_URLS.split(",") if url.strip())
+]
+
+
+class ReplicaLagMonitor:
+    """每個 worker 一個後台任務，每隔 DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS 在線程池中測量所有副本的延遲"""
+
+    def __init__(self, replicas: List[ReadReplica], interval_seconds: float):
+        self.replicas = replicas
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        await asyncio.gather(*(asyncio.to_thread(replica.refresh) for replica in self.replicas))
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """啟動測量任務（在事件循環中調用）；未配置副本時不啟動"""
+        if self._task is None and self.replicas:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局副本延遲監控
+replica_lag_monitor = ReplicaLagMonitor(read_replicas, settings.DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS)
+
+
+def dispose_pools_after_fork():
+    """
+    丟棄從父進程繼承的連接池（不關閉父進程的連接），子進程第一次查詢時建立自己的連接
+    gunicorn --preload 時應用在 master 中導入，每個 worker fork 後都會執行一次；
+    create_engine 本身不建立連接，master 只要不查詢資料庫就不會有連接被多個進程共用
+    """
+    engine.dispose(close=False)
+    for replica in read_replicas:
+        replica.engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=dispose_pools_after_fork)
+
+def wrote_recently(last_write_at: Optional[float]) -> bool:
+    """
+    用戶在 READ_YOUR_WRITES 窗口內寫入過（last_write_at 為 users.last_write_at）
+    寫入時間記錄在主庫的用戶行上，而不是進程內：沒有粘性路由時，寫入後的下一個請求通常落在另一個 worker
+    """
+    return last_write_at is not None and time.time() - last_write_at < settings.DB_READ_YOUR_WRITES_SECONDS
+
+
+class RoutingSession(Session):
+    """
+    讀寫分離會話
+    只有標記了 info["replica_ok"] 的會話（get_read_db）才會把 SELECT 發到只讀副本，
+    以下情況仍走主庫：會話已有寫入、當前用戶剛寫入過（read-your-writes）、副本延遲超過閾值
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            read_replicas
+            and self.info.get("replica_ok")
+            and not self._flushing
+            and not self.info.get("wrote")
+            and getattr(clause, "is_select", False)
+        ):
+            if wrote_recently(self.info.get("last_write_at")):
+                metrics.inc("db.reads.sticky_primary")
+                return engine
+            usable = [replica for replica in read_replicas if replica.is_usable()]
+            if usable:
+                metrics.inc("db.reads.replica")
+                return random.choice(usable).engine
+            metrics.inc("db.reads.lag_fallback")
+        return engine
 
-# 創建資料庫連接字符串
-DATABASE_URL = f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}?charset=utf8mb4"
-
-# 創建引擎
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    pool_timeout=20,  # 連接池超時時間（秒）
-    connect_args={
-        "connect_timeout": 10,  # MySQL 連接超時時間（秒）
-    },
-    echo=False  # 設為 True 可以看到 SQL 語句
-)
 
 # 創建 SessionLocal 類
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False：提交後已載入的屬性仍可讀取，不會為了讀屬性重新借出連接
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_session_wrote(session, flush_context):
+    session.info["wrote"] = True
+    session.info["unstamped_write"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state):
+    # query.update() / query.delete() 不經過 flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["wrote"] = True
+        orm_execute_state.session.info["unstamped_write"] = True
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _stamp_user_write(session):
+    """
+    事務中有寫入時，在同一事務內更新當前用戶的 users.last_write_at（每個事務最多一次）
+    用 Core 語句直接執行，不觸發上面的寫入標記，也不改變 updated_at
+    """
+    user_id = session.info.get("user_id")
+    if not user_id:
+        return
+    if not (session.info.get("unstamped_write") or session.new or session.dirty or session.deleted):
+        return
+    from app.models import User
+
+    users = User.__table__
+    session.connection().execute(
+        update(users).where(users.c.id == user_id).values(last_write_at=time.time(), updated_at=users.c.updated_at)
+    )
+    session.info["unstamped_write"] = False
+
 
 # 創建 Base 類
 Base = declarative_base()
 
 
+def release_connection(db: Session):
+    """
+    結束當前事務並將連接歸還連接池，已載入的對象仍可使用
+    在持有會話的協程 await（廣播、發送等）之前調用，避免連接在等待期間被佔用
+    """
+    db.commit()
+
+
 # 依賴注入：獲取資料庫會話
 def get_db():
     db = SessionLocal()
@@ -32,4 +254,3 @@ def get_db():
         yield db
     finally:
         db.close()
-
@@ -1,9 +1,12 @@
-from fastapi import Depends, HTTPException, status
+import hmac
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, SessionLocal, release_connection
 from app.models import User
 from app.auth import decode_access_token
+from app.config import settings
 
 security = HTTPBearer()
 
@@ -39,5 +42,32 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # 認證查詢後立即歸還連接，只讀端點的查詢使用 get_read_db 的會話
+    release_connection(db)
+    # 記錄會話所屬用戶，提交寫入後該用戶短時間內的讀取走主庫（read-your-writes）
+    db.info["user_id"] = user.id
     return user
 
+
+def get_read_db(current_user: User = Depends(get_current_user)):
+    """
+    獲取可讀副本的資料庫會話（僅用於只讀端點）
+    SELECT 會路由到延遲在閾值內的只讀副本；未配置副本時與 get_db 相同
+    """
+    db = SessionLocal()
+    db.info["replica_ok"] = True
+    db.info["user_id"] = current_user.id
+    # get_current_user 從主庫讀取，包含其他 worker 上的寫入
+    db.info["last_write_at"] = current_user.last_write_at
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    """調試端點的訪問控制：未配置 DEBUG_TOKEN 時端點不存在（404），令牌不符時返回 403"""
+    if not settings.DEBUG_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_debug_token is None or not hmac.compare_digest(x_debug_token, settings.DEBUG_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid debug token")
@@ -0,0 +1,121 @@
+"""
+服務端 WebSocket 心跳與閒置連接回收
+每個 worker 只有一個後台任務，用時間輪（timer wheel）分攤檢查：
+連接按註冊時間分散到各個槽位，每次 tick 只檢查一個槽位，
+一輪（HEARTBEAT_INTERVAL_SECONDS）內每個連接恰好被檢查一次。
+- 閒置超過心跳間隔：發送 {"type": "ping"}，客戶端回覆 pong 或任何消息即視為存活
+- 閒置超過超時時間：關閉連接並從 ConnectionManager 移除
+"""
+import asyncio
+import time
+from typing import List, Optional
+
+from app.config import settings
+from app.connections import ConnectionRecord
+from app.metrics import metrics
+
+
+class HeartbeatScheduler:
+    def __init__(self, interval_seconds: float, timeout_seconds: float, wheel_slots: int):
+        self.interval = interval_seconds
+        self.timeout = timeout_seconds
+        self.tick = interval_seconds / wheel_slots
+        # 每個槽位是一個記錄列表；槽位、槽位內下標和最後活動時間保存在 record 上
+        self.slots: List[List[ConnectionRecord]] = [[] for _ in range(wheel_slots)]
+        self.tracked = 0
+        self._cursor = 0
+        self._manager = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, record: ConnectionRecord):
+        """註冊新連接；放在剛檢查過的槽位，一整輪後才會被檢查"""
+        slot = (self._cursor - 1) % len(self.slots)
+        records = self.slots[slot]
+        record.slot = slot
+        record.slot_index = len(records)
+        records.append(record)
+        record.touch()
+        self.tracked += 1
+
+    def unregister(self, record: ConnectionRecord):
+        """從槽位中移除（swap-remove，O(1)）"""
+        if record.slot < 0:
+            return
+        records = self.slots[record.slot]
+        index = record.slot_index
+        if index < len(records) and records[index] is record:
+            last = records.pop()
+            if last is not record:
+                records[index] = last
+                last.slot_index = index
+            self.tracked -= 1
+        record.slot = -1
+        record.slot_index = -1
+
+    def touch(self, record: ConnectionRecord):
+        """收到客戶端任何消息時更新最後活動時間"""
+        record.touch()
+
+    async def _check_slot(self, slot: List[ConnectionRecord]):
+        now = time.monotonic()
+        reaped = 0
+        for record in list(slot):
+            idle = now - record.last_seen
+            if idle >= self.timeout:
+                await self._reap(record)
+                reaped += 1
+            elif idle >= self.interval:
+                try:
+                    await asyncio.wait_for(self._manager.send_event(record, {"type": "ping"}), timeout=self.tick)
+                    metrics.inc("websocket.heartbeat.pings_sent")
+                except Exception:
+                    # 發送失敗說明連接已不可用，直接回收
+                    await self._reap(record)
+                    reaped += 1
+        if reaped:
+            print(f"[Heartbeat] Reaped {reaped} dead connections")
+
+    async def _reap(self, record: ConnectionRecord):
+        """移除失聯的連接；在線狀態由 handle_websocket 在連接結束時處理"""
+        self.unregister(record)
+        if self._manager is not None:
+            self._manager.disconnect(record)
+        metrics.inc("websocket.heartbeat.reaped")
+        try:
+            await asyncio.wait_for(record.websocket.close(code=1001, reason="Heartbeat timeout"), timeout=self.tick)
+        except Exception:
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            slot = self.slots[self._cursor]
+            self._cursor = (self._cursor + 1) % len(self.slots)
+            try:
+                await self._check_slot(slot)
+            except Exception as e:
+                print(f"[Heartbeat] Error checking connections: {e}")
+            metrics.set_gauge("websocket.heartbeat.tracked_connections", self.tracked)
+
+    def start(self, manager):
+        """啟動心跳任務（在事件循環中調用）"""
+        self._manager = manager
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局心跳調度器
+heartbeat_scheduler = HeartbeatScheduler(
+    interval_seconds=settings.HEARTBEAT_INTERVAL_SECONDS,
+    timeout_seconds=settings.HEARTBEAT_TIMEOUT_SECONDS,
+    wheel_slots=settings.HEARTBEAT_WHEEL_SLOTS
+)
@@ -0,0 +1,87 @@
+"""
+時間有序的主鍵 ID（UUIDv7）
+- 前 48 位是毫秒時間戳，新記錄總是追加到 InnoDB 聚簇索引末尾，不再隨機插入造成頁分裂
+- 同一毫秒內用 12 位計數器保證本進程內嚴格遞增，其餘 62 位隨機
+- 字串形式（36 字元，小寫十六進制）的字典序與時間順序一致，可直接作為分頁游標
+- 與舊的 uuid4 ID 格式相同，可以混合存放在同一欄位中
+
+存儲方式由 DB_ID_STORAGE 決定：
+- "char36"（默認）：VARCHAR(36)，與現有資料庫兼容
+- "binary16"：MySQL 上使用 BINARY(16)，主鍵和每個二級索引每行節省 20 字節；
+  現有資料庫由遷移 m0011_ids_binary16 轉換（設置後執行 migrate.py）
+"""
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import String
+from sqlalchemy.dialects.mysql import BINARY
+from sqlalchemy.types import TypeDecorator
+
+from app.config import settings
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """生成 UUIDv7（RFC 9562）；同一毫秒內計數器遞增，溢出時借用下一毫秒"""
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF  # 從較小的隨機值開始，留出遞增空間
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        timestamp_ms = _last_ms
+        counter = _counter
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (timestamp_ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76  # version 7
+    value |= counter << 64
+    value |= 0b10 << 62  # RFC 4122 variant
+    value |= rand_b
+    return uuid.UUID(int=value)
+
+
+def generate_id() -> str:
+    return str(uuid7())
+
+
+class CompactUUID(TypeDecorator):
+    """MySQL 上以 BINARY(16) 存儲的 UUID，應用層仍使用 36 字元字串；其他資料庫使用 VARCHAR(36)"""
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(BINARY(16))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "mysql":
+            return value
+        try:
+            return uuid.UUID(value).bytes
+        except (ValueError, AttributeError, TypeError):
+            # 非法 ID（例如客戶端傳入的任意字串）不會匹配任何記錄
+            return b""
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != "mysql":
+            return value
+        return str(uuid.UUID(bytes=value))
+
+
+def id_type():
+    """主鍵和外鍵欄位的類型"""
+    if settings.DB_ID_STORAGE == "binary16":
+        return CompactUUID()
+    return String(36)
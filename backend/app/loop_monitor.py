@@ -0,0 +1,125 @@
+"""
+事件循環延遲監控和負載削減
+資料庫查詢、bcrypt、Pillow 轉換目前都在事件循環上同步執行，循環可能停頓數秒而沒有任何記錄。
+- 採樣：每個 worker 一個任務，每隔 LOOP_LAG_INTERVAL_SECONDS 休眠一次，實際喚醒時間比預期晚多少即為延遲，
+  記錄在 metrics（gauge loop.lag_ms、summary loop.lag_seconds、超過閾值的次數 loop.stalls）
+- 負載削減（LOAD_SHED_ENABLED）：延遲超過 LOAD_SHED_LAG_MS 後的 LOAD_SHED_HOLD_SECONDS 內，
+  開銷大且非必要的接口（搜索、調試端點、完整用戶列表）直接返回 503，
+  讓出循環給 /ws 推送和發送消息；/api/debug/metrics 保留，用於觀察延遲
+"""
+import asyncio
+import math
+import time
+from typing import Optional
+
+from app.config import settings
+from app.metrics import metrics
+
+# 過載時削減的接口：(方法, 路徑, 是否前綴匹配, 指標名)
+SHED_ROUTES = (
+    ("GET", "/api/messages/search", False, "search"),
+    ("GET", "/api/users", False, "user_list"),
+    ("GET", "/api/debug/", True, "debug"),
+)
+# 過載時仍然保留的接口
+SHED_EXEMPT_PATHS = ("/api/debug/metrics",)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_seconds: float, shed_lag_ms: float, shed_hold_seconds: float):
+        self.interval = interval_seconds
+        self.shed_lag = shed_lag_ms / 1000
+        self.hold = shed_hold_seconds
+        self.lag = 0.0
+        # 下一次採樣的預期喚醒時間（loop.time()），循環正在停頓時可以據此估算當前延遲
+        self._due: Optional[float] = None
+        self._shed_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _record(self, lag: float):
+        self.lag = lag
+        metrics.set_gauge("loop.lag_ms", round(lag * 1000, 1))
+        metrics.observe("loop.lag_seconds", lag)
+        if lag > self.shed_lag:
+            metrics.inc("loop.stalls")
+            self._shed_until = time.monotonic() + self.hold
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - self._due))
+
+    def overloaded(self) -> bool:
+        """最近一次超過閾值的延遲仍在保持期內，或當前採樣已經晚於閾值（循環正在積壓）"""
+        if time.monotonic() < self._shed_until:
+            return True
+        if self._due is None:
+            return False
+        return asyncio.get_running_loop().time() - self._due > self.shed_lag
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.hold))
+
+    def start(self):
+        """啟動採樣任務（在事件循環中調用）"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._due = None
+
+
+def shed_route(method: str, path: str) -> Optional[str]:
+    """可削減的接口返回指標名，其他返回 None"""
+    if path in SHED_EXEMPT_PATHS:
+        return None
+    for route_method, route_path, prefix, name in SHED_ROUTES:
+        if method == route_method and (path.startswith(route_path) if prefix else path.rstrip("/") == route_path):
+            return name
+    return None
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI 中間件：事件循環過載時對可削減的接口返回 503 和 Retry-After
+    只檢查 HTTP 請求，WebSocket 和其他接口直接放行，未開啟時不做任何檢查
+    """
+
+    def __init__(self, app, monitor: LoopLagMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.monitor.overloaded():
+            name = shed_route(scope["method"], scope["path"])
+            if name is not None:
+                metrics.inc(f"loadshed.rejected.{name}")
+                await send({
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(self.monitor.retry_after).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"Server is busy, please retry later"}'})
+                return
+        await self.app(scope, receive, send)
+
+
+# 全局事件循環監控
+loop_monitor = LoopLagMonitor(
+    interval_seconds=settings.LOOP_LAG_INTERVAL_SECONDS,
+    shed_lag_ms=settings.LOAD_SHED_LAG_MS,
+    shed_hold_seconds=settings.LOAD_SHED_HOLD_SECONDS
+)
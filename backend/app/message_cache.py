@@ -0,0 +1,219 @@
+"""
+房間最近消息快取（tail cache）
+每個房間保留最近 MESSAGE_CACHE_ROOM_CAPACITY 條 MessageResponse：
+- send_message 發送成功後追加，冷房間在第一次讀取時從資料庫預熱；
+  追加前核對快取最後一條是否正是資料庫中新消息的前一條，不是（其他 worker 在此之前寫入過消息）時丟棄該房間，
+  否則追加後快取的最新 ID 與資料庫一致，讀取時的校驗無法發現中間缺少的消息
+- 所有房間共享 MESSAGE_CACHE_MAX_BYTES 記憶體預算，超出時按 LRU 淘汰最久未使用的房間
+- 每個 worker 各自快取，其他 worker 發送的消息不會追加到本 worker 的快取：
+  讀取前先查詢房間最新一條消息的 ID（(room_id, timestamp, id) 索引上的一次查找），
+  不在快取中時重新預熱，因此其他 worker 發送的消息立即可見
+- 快取條目最長保留 MESSAGE_CACHE_TTL_SECONDS，之後重新預熱
+  （兜底：時間戳更早但提交更晚的消息不會改變最新 ID）
+快取保存未過濾的消息，封鎖過濾由調用方處理。
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Message
+from app.schemas import MessageResponse
+
+# 每條消息除字串內容外的估算開銷（對象、deque 槽位、datetime 等）
+MESSAGE_OVERHEAD_BYTES = 400
+
+
+def estimate_size(message: MessageResponse) -> int:
+    return (
+        MESSAGE_OVERHEAD_BYTES
+        + len(message.id) + len(message.room_id) + len(message.sender_id)
+        + len(message.sender_name) + len(message.sender_avatar) + len(message.content)
+    )
+
+
+def to_response(message: Message) -> MessageResponse:
+    return MessageResponse(
+        id=message.id,
+        room_id=message.room_id,
+        sender_id=message.sender_id,
+        sender_name=message.sender_name,
+        sender_avatar=message.sender_avatar,
+        content=message.content,
+        type=message.type,
+        timestamp=message.timestamp
+    )
+
+
+class RoomTail:
+    __slots__ = ("messages", "complete", "size", "loaded_at")
+
+    def __init__(self, messages: Deque[MessageResponse], complete: bool):
+        # messages 按時間升序；complete 表示已包含房間的全部歷史
+        self.messages = messages
+        self.complete = complete
+        self.size = sum(estimate_size(msg) for msg in messages)
+        self.loaded_at = time.monotonic()
+
+
+class MessageTailCache:
+    def __init__(self, room_capacity: int, max_bytes: int, ttl_seconds: float):
+        self.room_capacity = room_capacity
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.total_bytes = 0
+        self._rooms: "OrderedDict[str, RoomTail]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 因其他 worker 寫入了新消息而重新預熱的次數
+        self.stale = 0
+
+    def _lookup(self, room_id: str) -> Optional[RoomTail]:
+        tail = self._rooms.get(room_id)
+        if tail is None:
+            return None
+        if time.monotonic() - tail.loaded_at > self.ttl:
+            self.drop_room(room_id)
+            return None
+        self._rooms.move_to_end(room_id)
+        return tail
+
+    @staticmethod
+    def latest_id(db: Session, room_id: str) -> Optional[str]:
+        """房間最新一條消息的 ID（房間沒有消息時為 None）"""
+        return db.query(Message.id).filter(Message.room_id == room_id).order_by(
+            Message.timestamp.desc(), Message.id.desc()
+        ).limit(1).scalar()
+
+    @staticmethod
+    def previous_id(db: Session, message: Message) -> Optional[str]:
+        """房間中按 (timestamp, id) 排在該消息之前的一條消息的 ID"""
+        return db.query(Message.id).filter(
+            Message.room_id == message.room_id,
+            or_(
+                Message.timestamp < message.timestamp,
+                and_(Message.timestamp == message.timestamp, Message.id < message.id)
+            )
+        ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(1).scalar()
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    @staticmethod
+    def _is_current(tail: RoomTail, latest_id: Optional[str]) -> bool:
+        """
+        資料庫中最新的消息已在快取中
+        快取可能比資料庫更新（本 worker 剛追加、唯讀副本尚未同步），此時也直接使用快取
+        """
+        if latest_id is None:
+            return True
+        return any(msg.id == latest_id for msg in reversed(tail.messages))
+
+    @staticmethod
+    def _select(tail: RoomTail, limit: Optional[int], blocked_ids) -> Optional[List[MessageResponse]]:
+        """快取能滿足請求時返回（過濾封鎖用戶後的）消息列表，否則返回 None"""
+        messages = list(tail.messages)
+        if blocked_ids:
+            messages = [msg for msg in messages if msg.sender_id not in blocked_ids]
+        if limit is None:
+            return messages if tail.complete else None
+        if len(messages) >= limit:
+            return messages[-limit:]
+        return messages if tail.complete else None
+
+    def get_recent(
+        self,
+        db: Session,
+        room_id: str,
+        limit: Optional[int] = None,
+        blocked_ids=()
+    ) -> Optional[List[MessageResponse]]:
+        """
+        返回房間最近 limit 條可見消息（limit 為 None 時返回全部歷史）；
+        冷房間和其他 worker 寫入過新消息的房間先從資料庫預熱，快取仍不足以滿足請求時返回 None
+        """
+        tail = self._lookup(room_id)
+        if tail is not None and not self._is_current(tail, self.latest_id(db, room_id)):
+            self.stale += 1
+            tail = None
+        if tail is not None:
+            result = self._select(tail, limit, blocked_ids)
+            if result is not None:
+                self.hits += 1
+                return result
+            if not tail.complete and len(tail.messages) == self.room_capacity:
+                # 已快取滿但仍不夠，重新預熱也無法滿足
+                self.misses += 1
+                return None
+        self.misses += 1
+        return self._select(self.warm(db, room_id), limit, blocked_ids)
+
+    def warm(self, db: Session, room_id: str) -> RoomTail:
+        """從資料庫載入房間最近的消息"""
+        rows = db.query(Message).filter(Message.room_id == room_id).order_by(
+            Message.timestamp.desc(), Message.id.desc()
+        ).limit(self.room_capacity + 1).all()
+        complete = len(rows) <= self.room_capacity
+        messages = deque((to_response(msg) for msg in reversed(rows[:self.room_capacity])), maxlen=self.room_capacity)
+
+        self.drop_room(room_id)
+        tail = RoomTail(messages, complete)
+        self._rooms[room_id] = tail
+        self.total_bytes += tail.size
+        self._evict()
+        return tail
+
+    def append(self, message: MessageResponse, previous_id: Optional[str]):
+        """
+        追加新消息；只更新已快取的房間，冷房間等第一次讀取時再預熱
+        previous_id 為資料庫中排在新消息之前的一條消息，與快取最後一條不同時丟棄該房間的快取
+        """
+        tail = self._rooms.get(message.room_id)
+        if tail is None:
+            return
+        last_id = tail.messages[-1].id if tail.messages else None
+        if last_id != previous_id:
+            self.stale += 1
+            self.drop_room(message.room_id)
+            return
+        if len(tail.messages) == self.room_capacity:
+            tail.size -= estimate_size(tail.messages[0])
+            self.total_bytes -= estimate_size(tail.messages[0])
+            tail.complete = False
+        tail.messages.append(message)
+        size = estimate_size(message)
+        tail.size += size
+        self.total_bytes += size
+        self._rooms.move_to_end(message.room_id)
+        self._evict()
+
+    def drop_room(self, room_id: str):
+        tail = self._rooms.pop(room_id, None)
+        if tail is not None:
+            self.total_bytes -= tail.size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._rooms) > 1:
+            _, tail = self._rooms.popitem(last=False)
+            self.total_bytes -= tail.size
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale
+        }
+
+
+# 全局消息快取
+message_cache = MessageTailCache(
+    room_capacity=settings.MESSAGE_CACHE_ROOM_CAPACITY,
+    max_bytes=settings.MESSAGE_CACHE_MAX_BYTES,
+    ttl_seconds=settings.MESSAGE_CACHE_TTL_SECONDS
+)
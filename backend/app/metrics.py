@@ -0,0 +1,44 @@
+"""
+進程內指標（每個 worker 各自統計）
+- counter：只增不減的計數
+- gauge：當前值
+- summary：觀測值的次數、總和、最大值
+通過 /api/debug/metrics 查看
+"""
+import os
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: Dict[str, float] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self.summaries: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1):
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        summary = self.summaries.get(name)
+        if summary is None:
+            summary = self.summaries[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+        summary["count"] += 1
+        summary["sum"] += value
+        if value > summary["max"]:
+            summary["max"] = value
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "summaries": {name: dict(summary) for name, summary in self.summaries.items()}
+        }
+
+
+# 全局指標
+metrics = Metrics()
@@ -0,0 +1,108 @@
+"""
+版本化資料庫遷移
+- 每個遷移是本目錄下的 mNNNN_<name>.py 模塊，提供 upgrade(conn)
+- 已執行的版本記錄在 schema_migrations 表中，每個版本只執行一次
+- 由 migrate.py 在啟動 worker 之前執行一次（見 deployment 的 ExecStartPre），
+  worker 啟動時只讀取當前版本號做檢查，不再修改資料庫結構
+- MySQL 上用 GET_LOCK 保證同一時間只有一個進程在執行遷移
+"""
+import importlib
+import pkgutil
+import time
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.migrations.ops import has_table, is_mysql
+
+MIGRATION_LOCK = "chat_schema_migrations"
+MIGRATION_LOCK_TIMEOUT_SECONDS = 600
+
+
+def discover() -> List[Tuple[int, str, object]]:
+    """按版本號排序的所有遷移：[(version, name, module), ...]"""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        if not info.name.startswith("m") or "_" not in info.name or not info.name[1:5].isdigit():
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        migrations.append((int(info.name[1:5]), info.name[6:], module))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+def head_version() -> int:
+    migrations = discover()
+    return migrations[-1][0] if migrations else 0
+
+
+def _ensure_version_table(conn):
+    if not has_table(conn, "schema_migrations"):
+        conn.execute(text(
+            "CREATE TABLE schema_migrations ("
+            "version INTEGER NOT NULL PRIMARY KEY, "
+            "name VARCHAR(100) NOT NULL, "
+            "applied_at DATETIME NOT NULL, "
+            "duration_ms INTEGER NOT NULL)"
+        ))
+        conn.commit()
+
+
+def applied_versions(conn) -> set:
+    if not has_table(conn, "schema_migrations"):
+        return set()
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def current_version(engine: Engine) -> int:
+    """資料庫當前版本（worker 啟動檢查用，只執行一條查詢）"""
+    with engine.connect() as conn:
+        try:
+            return conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+        except Exception:
+            return 0
+
+
+def run_migrations(engine: Engine, target: int = None, redo: int = None) -> List[int]:
+    """
+    執行所有未執行的遷移（或直到 target 版本），返回本次執行的版本號
+    redo 指定的版本即使已執行也重新執行一次（遷移是冪等的，用於依賴配置的遷移，例如 m0011）
+    """
+    executed = []
+    with engine.connect() as conn:
+        if is_mysql(conn):
+            acquired = conn.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {"name": MIGRATION_LOCK, "timeout": MIGRATION_LOCK_TIMEOUT_SECONDS}
+            ).scalar()
+            if acquired != 1:
+                raise RuntimeError("Could not acquire migration lock; another migration is running")
+        try:
+            _ensure_version_table(conn)
+            if redo is not None:
+                conn.execute(text("DELETE FROM schema_migrations WHERE version = :version"), {"version": redo})
+            done = applied_versions(conn)
+            conn.commit()
+            for version, name, module in discover():
+                if version in done or (target is not None and version > target):
+                    continue
+                print(f"[Migrate] Applying {version:04d} {name}")
+                start = time.perf_counter()
+                # MySQL 的 DDL 會隱式提交，遷移本身需冪等；成功後才記錄版本
+                module.upgrade(conn)
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at, duration_ms) "
+                         "VALUES (:version, :name, CURRENT_TIMESTAMP, :duration_ms)"),
+                    {"version": version, "name": name, "duration_ms": duration_ms}
+                )
+                conn.commit()
+                executed.append(version)
+                print(f"[Migrate] Applied {version:04d} {name} in {duration_ms} ms")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if is_mysql(conn):
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK})
+    return executed
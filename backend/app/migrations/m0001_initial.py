@@ -0,0 +1,75 @@
+"""
+初始結構：引入版本化遷移之前的資料表（已存在的表跳過）
+這裡是當時結構的固定快照，不引用 app.models：模型之後的變化由後續遷移完成
+（頭像 LONGTEXT 見 0002、rooms.deleted_at 見 0003、查詢索引和 room_members 的約束見 0004），
+新資料庫和已有資料庫經過同樣的遷移序列得到同樣的結構。
+已有資料庫只會補建缺少的表（例如 room_members），現有表由後續遷移升級。
+"""
+from app.migrations.ops import create_index_online, create_table, id_column, is_mysql
+
+
+def upgrade(conn):
+    id_type = id_column(conn)
+    long_text = "LONGTEXT" if is_mysql(conn) else "TEXT"
+
+    create_table(conn, "users", (
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "email VARCHAR(255) NOT NULL, "
+        "password_hash VARCHAR(255) NOT NULL, "
+        f"avatar {long_text} NOT NULL, "
+        "is_online BOOLEAN NOT NULL, "
+        "bio TEXT NULL, "
+        "created_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP, "
+        "updated_at DATETIME NULL"
+    ))
+    create_index_online(conn, "users", "ix_users_email", ["email"], unique=True)
+
+    create_table(conn, "rooms", (
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "is_private BOOLEAN NOT NULL, "
+        "password_hash VARCHAR(255) NULL, "
+        f"created_by {id_type} NOT NULL, "
+        "description TEXT NULL, "
+        "created_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP, "
+        "updated_at DATETIME NULL, "
+        "FOREIGN KEY (created_by) REFERENCES users (id)"
+    ))
+
+    create_table(conn, "messages", (
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        f"room_id {id_type} NOT NULL, "
+        f"sender_id {id_type} NOT NULL, "
+        "sender_name VARCHAR(100) NOT NULL, "
+        f"sender_avatar {long_text} NOT NULL, "
+        "content TEXT NOT NULL, "
+        "type VARCHAR(20) NOT NULL, "
+        "timestamp DATETIME NULL DEFAULT CURRENT_TIMESTAMP, "
+        "FOREIGN KEY (room_id) REFERENCES rooms (id), "
+        "FOREIGN KEY (sender_id) REFERENCES users (id)"
+    ))
+    create_index_online(conn, "messages", "ix_messages_room_id", ["room_id"])
+    create_index_online(conn, "messages", "ix_messages_sender_id", ["sender_id"])
+    create_index_online(conn, "messages", "ix_messages_timestamp", ["timestamp"])
+
+    create_table(conn, "user_relationships", (
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        f"user_id {id_type} NOT NULL, "
+        f"target_id {id_type} NOT NULL, "
+        "relationship_type VARCHAR(20) NOT NULL, "
+        "created_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP, "
+        "FOREIGN KEY (user_id) REFERENCES users (id), "
+        "FOREIGN KEY (target_id) REFERENCES users (id)"
+    ))
+    create_index_online(conn, "user_relationships", "ix_user_relationships_user_id", ["user_id"])
+    create_index_online(conn, "user_relationships", "ix_user_relationships_target_id", ["target_id"])
+
+    create_table(conn, "room_members", (
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        f"room_id {id_type} NOT NULL, "
+        f"user_id {id_type} NOT NULL, "
+        "joined_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP, "
+        "FOREIGN KEY (room_id) REFERENCES rooms (id), "
+        "FOREIGN KEY (user_id) REFERENCES users (id)"
+    ))
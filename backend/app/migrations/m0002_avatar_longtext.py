@@ -0,0 +1,13 @@
+"""
+頭像欄位改為 LONGTEXT，支持 base64 編碼的大圖片
+（取代原 migrate_avatar_to_text.py；舊版本可能是 VARCHAR(500) 或 TEXT）
+"""
+from app.migrations.ops import column_type, modify_column
+
+
+def upgrade(conn):
+    for table, column in (("users", "avatar"), ("messages", "sender_avatar")):
+        current = column_type(conn, table, column)
+        if current is None or current.lower() == "longtext":
+            continue
+        modify_column(conn, table, column, "LONGTEXT NOT NULL")
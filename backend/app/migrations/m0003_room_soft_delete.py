@@ -0,0 +1,9 @@
+"""
+房間軟刪除：rooms.deleted_at 及其索引（取代原 migrate_room_soft_delete.py）
+"""
+from app.migrations.ops import add_column, create_index_online
+
+
+def upgrade(conn):
+    add_column(conn, "rooms", "deleted_at", "DATETIME NULL")
+    create_index_online(conn, "rooms", "ix_rooms_deleted_at", ["deleted_at"])
@@ -0,0 +1,14 @@
+"""
+查詢索引
+- messages (room_id, timestamp, id)：房間歷史、分頁游標和續接查詢按此順序掃描，無需額外排序
+- user_relationships (target_id, relationship_type)：查詢收藏了某用戶的人（在線狀態扇出）
+- room_members：早期手動建立的表可能缺少這兩個索引
+"""
+from app.migrations.ops import create_index_online
+
+
+def upgrade(conn):
+    create_index_online(conn, "messages", "ix_messages_room_timestamp", ["room_id", "timestamp", "id"])
+    create_index_online(conn, "user_relationships", "ix_user_relationships_target_type", ["target_id", "relationship_type"])
+    create_index_online(conn, "room_members", "uq_room_members_room_user", ["room_id", "user_id"], unique=True)
+    create_index_online(conn, "room_members", "ix_room_members_user_room", ["user_id", "room_id"])
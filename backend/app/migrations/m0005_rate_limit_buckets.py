@@ -0,0 +1,14 @@
+"""
+限流令牌桶表：rate_limit_buckets（RATE_LIMIT_BACKEND=database 時使用）
+時間和令牌數使用 DOUBLE：MySQL FLOAT 是單精度，當前的 epoch 秒只能精確到約 2 分鐘
+"""
+from app.migrations.ops import create_index_online, create_table
+
+
+def upgrade(conn):
+    create_table(conn, "rate_limit_buckets", (
+        "`key` VARCHAR(191) NOT NULL PRIMARY KEY, "
+        "tokens DOUBLE NOT NULL, "
+        "updated_at DOUBLE NOT NULL"
+    ))
+    create_index_online(conn, "rate_limit_buckets", "ix_rate_limit_buckets_updated_at", ["updated_at"])
@@ -0,0 +1,19 @@
+"""
+跨 worker 的在線連接計數：presence_workers（worker 心跳）、presence_connections（每個 worker 上每個用戶的連接數）
+"""
+from app.migrations.ops import create_index_online, create_table, id_column
+
+
+def upgrade(conn):
+    create_table(conn, "presence_workers", (
+        "worker_id VARCHAR(128) NOT NULL PRIMARY KEY, "
+        "heartbeat_at DOUBLE NOT NULL"
+    ))
+    create_index_online(conn, "presence_workers", "ix_presence_workers_heartbeat_at", ["heartbeat_at"])
+    create_table(conn, "presence_connections", (
+        "worker_id VARCHAR(128) NOT NULL, "
+        f"user_id {id_column(conn)} NOT NULL, "
+        "connections INTEGER NOT NULL, "
+        "PRIMARY KEY (worker_id, user_id)"
+    ))
+    create_index_online(conn, "presence_connections", "ix_presence_connections_user", ["user_id"])
@@ -0,0 +1,9 @@
+"""
+房間清理認領：rooms.purge_claimed_by / purge_claimed_at，每個已刪除房間只由一個 worker 清理
+"""
+from app.migrations.ops import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "rooms", "purge_claimed_by", "VARCHAR(128) NULL")
+    add_column(conn, "rooms", "purge_claimed_at", "DOUBLE NULL")
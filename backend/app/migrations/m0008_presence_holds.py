@@ -0,0 +1,12 @@
+"""
+關閉時保持在線的用戶：presence_holds（用戶 ID、離線期限），期限前沒有重連的用戶由存活的 worker 標記離線
+"""
+from app.migrations.ops import create_index_online, create_table, id_column
+
+
+def upgrade(conn):
+    create_table(conn, "presence_holds", (
+        f"user_id {id_column(conn)} NOT NULL PRIMARY KEY, "
+        "deadline DOUBLE NOT NULL"
+    ))
+    create_index_online(conn, "presence_holds", "ix_presence_holds_deadline", ["deadline"])
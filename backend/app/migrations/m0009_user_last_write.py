@@ -0,0 +1,8 @@
+"""
+users.last_write_at：用戶最近一次寫入的時間，所有 worker 共用，用於讀寫分離的 read-your-writes
+"""
+from app.migrations.ops import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "users", "last_write_at", "DOUBLE NULL")
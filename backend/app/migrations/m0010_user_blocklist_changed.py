@@ -0,0 +1,9 @@
+"""
+users.blocklist_changed_at：用戶封鎖列表最近一次變化的時間，各 worker 據此使本地的封鎖列表快取失效
+"""
+from app.migrations.ops import add_column, create_index_online
+
+
+def upgrade(conn):
+    add_column(conn, "users", "blocklist_changed_at", "DOUBLE NULL")
+    create_index_online(conn, "users", "ix_users_blocklist_changed_at", ["blocklist_changed_at"])
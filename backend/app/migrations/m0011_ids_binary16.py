@@ -0,0 +1,74 @@
+"""
+ID 欄位從 VARCHAR(36) 轉換為 BINARY(16)（取代原 migrate_ids_to_binary.py）
+只在 MySQL 且 DB_ID_STORAGE=binary16 時轉換，其他情況不做任何修改。
+
+切換步驟：維護窗口內設置 DB_ID_STORAGE=binary16 後執行 migrate.py（本遷移已記錄為已執行時用
+`python migrate.py --redo 11`），再重新啟動服務。
+每個欄位：VARCHAR(36) → VARBINARY(36) → UNHEX(去掉連字號) → BINARY(16)，保留主鍵和索引；
+轉換前刪除涉及的外鍵，轉換後重新建立。ALTER TABLE 會複製整張表，大表需要較長時間，請提前備份。
+"""
+from sqlalchemy import inspect, text
+
+from app.migrations.ops import column_type, id_column, modify_column
+
+# 需要轉換的欄位：{表名: [欄位, ...]}
+ID_COLUMNS = {
+    "users": ["id"],
+    "rooms": ["id", "created_by"],
+    "messages": ["id", "room_id", "sender_id"],
+    "user_relationships": ["id", "user_id", "target_id"],
+    "room_members": ["id", "room_id", "user_id"],
+    "presence_connections": ["user_id"],
+    "presence_holds": ["user_id"],
+}
+
+# 涉及 ID 欄位的外鍵（m0001），轉換後按此重建；中途失敗重跑時也會補回已刪除的外鍵
+FOREIGN_KEYS = [
+    ("rooms", "created_by", "users", "id"),
+    ("messages", "room_id", "rooms", "id"),
+    ("messages", "sender_id", "users", "id"),
+    ("user_relationships", "user_id", "users", "id"),
+    ("user_relationships", "target_id", "users", "id"),
+    ("room_members", "room_id", "rooms", "id"),
+    ("room_members", "user_id", "users", "id"),
+]
+
+
+def _foreign_key_names(conn, table, column):
+    return [row[0] for row in conn.execute(text(
+        "SELECT CONSTRAINT_NAME FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column "
+        "AND REFERENCED_TABLE_NAME IS NOT NULL"
+    ), {"table": table, "column": column})]
+
+
+def upgrade(conn):
+    if id_column(conn) != "BINARY(16)":
+        return
+
+    pending = []
+    for table, columns in ID_COLUMNS.items():
+        nullable = {col["name"]: col["nullable"] for col in inspect(conn).get_columns(table)}
+        for column in columns:
+            current = column_type(conn, table, column)
+            if current is not None and current.lower() != "binary(16)":
+                pending.append((table, column, "NULL" if nullable[column] else "NOT NULL"))
+
+    if pending:
+        # 轉換期間引用兩端的類型不一致，先刪除外鍵
+        for table, column, _, _ in FOREIGN_KEYS:
+            for name in _foreign_key_names(conn, table, column):
+                conn.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {name}"))
+                print(f"[Migrate]   dropped foreign key {table}.{name}")
+
+        for table, column, null_sql in pending:
+            modify_column(conn, table, column, f"VARBINARY(36) {null_sql}")
+            conn.execute(text(
+                f"UPDATE {table} SET {column} = UNHEX(REPLACE({column}, '-', '')) WHERE LENGTH({column}) = 36"
+            ))
+            modify_column(conn, table, column, f"BINARY(16) {null_sql}")
+
+    for table, column, ref_table, ref_column in FOREIGN_KEYS:
+        if not _foreign_key_names(conn, table, column):
+            conn.execute(text(f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {ref_table} ({ref_column})"))
+            print(f"[Migrate]   created foreign key {table}.{column} -> {ref_table}.{ref_column}")
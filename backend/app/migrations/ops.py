@@ -0,0 +1,90 @@
+"""
+遷移輔助操作（冪等：已存在的表/欄位/索引會跳過，中途失敗後可以安全重跑）
+MySQL 上添加欄位和索引使用 InnoDB 在線 DDL（ALGORITHM=INPLACE, LOCK=NONE），
+執行期間表仍可讀寫；不支持在線執行時直接報錯，而不是靜默退化為鎖表。
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+
+def is_mysql(conn: Connection) -> bool:
+    return conn.dialect.name == "mysql"
+
+
+def id_column(conn: Connection) -> str:
+    """ID 欄位的 DDL 類型，與 app.ids.id_type() 一致（MySQL 且 DB_ID_STORAGE=binary16 時為 BINARY(16)）"""
+    from app.config import settings
+    if is_mysql(conn) and settings.DB_ID_STORAGE == "binary16":
+        return "BINARY(16)"
+    return "VARCHAR(36)"
+
+
+def create_table(conn: Connection, table: str, ddl: str):
+    """創建資料表；ddl 為括號內的欄位和索引定義，MySQL 上使用 InnoDB、utf8mb4"""
+    if has_table(conn, table):
+        print(f"[Migrate]   table {table} already exists, skipped")
+        return
+    options = " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4" if is_mysql(conn) else ""
+    conn.execute(text(f"CREATE TABLE {table} ({ddl}){options}"))
+    print(f"[Migrate]   created table {table}")
+
+
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    insp = inspect(conn)
+    names = {index["name"] for index in insp.get_indexes(table)}
+    names |= {constraint["name"] for constraint in insp.get_unique_constraints(table)}
+    return name in names
+
+
+def column_type(conn: Connection, table: str, column: str) -> Optional[str]:
+    """MySQL 返回 COLUMN_TYPE（例如 'varchar(36)'），其他資料庫返回 None"""
+    if not is_mysql(conn):
+        return None
+    return conn.execute(text(
+        "SELECT COLUMN_TYPE FROM INFORMATION_SCHEMA.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"
+    ), {"table": table, "column": column}).scalar()
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """添加欄位；ddl 為欄位定義，例如 'DATETIME NULL'"""
+    if has_column(conn, table, column):
+        print(f"[Migrate]   {table}.{column} already exists, skipped")
+        return
+    online = ", ALGORITHM=INPLACE, LOCK=NONE" if is_mysql(conn) else ""
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}{online}"))
+    print(f"[Migrate]   added column {table}.{column}")
+
+
+def create_index_online(conn: Connection, table: str, name: str, columns: Iterable[str], unique: bool = False):
+    """在線創建索引：MySQL 使用 ALGORITHM=INPLACE, LOCK=NONE，建索引期間不阻塞寫入"""
+    if has_index(conn, table, name):
+        print(f"[Migrate]   index {name} already exists, skipped")
+        return
+    column_list = ", ".join(columns)
+    unique_sql = "UNIQUE " if unique else ""
+    if is_mysql(conn):
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD {unique_sql}INDEX {name} ({column_list}), ALGORITHM=INPLACE, LOCK=NONE"
+        ))
+    else:
+        conn.execute(text(f"CREATE {unique_sql}INDEX {name} ON {table} ({column_list})"))
+    print(f"[Migrate]   created index {name} on {table} ({column_list})")
+
+
+def modify_column(conn: Connection, table: str, column: str, ddl: str):
+    """修改欄位類型（僅 MySQL；SQLite 不支持，模型定義已是最終類型）"""
+    if not is_mysql(conn):
+        return
+    conn.execute(text(f"ALTER TABLE {table} MODIFY COLUMN {column} {ddl}"))
+    print(f"[Migrate]   modified {table}.{column} to {ddl}")
@@ -1,27 +1,39 @@
-from sqlalchemy import Column, String, Boolean, Integer, DateTime, Text, ForeignKey, JSON
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, String, Boolean, Integer, Double, DateTime, Text, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
-import uuid
+from app.ids import generate_id, id_type
+
+# MySQL 使用 LONGTEXT（最大 4GB），其他資料庫（如 SQLite 測試替身）使用普通 Text
+LongText = Text().with_variant(LONGTEXT(), "mysql")
+
 
+def utcnow() -> datetime:
+    """當前 UTC 時間（不帶時區），與資料庫 func.now() 寫入的時間一致，可以直接比較"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
-def generate_id():
-    return str(uuid.uuid4())
+
+# 主鍵使用時間有序的 UUIDv7（見 app/ids.py），存儲類型由 DB_ID_STORAGE 決定
+IdType = id_type()
 
 
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(String(36), primary_key=True, default=generate_id)
+    id = Column(IdType, primary_key=True, default=generate_id)
     name = Column(String(100), nullable=False)
     email = Column(String(255), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
-    avatar = Column(LONGTEXT, nullable=False)  # 改為 LONGTEXT 以支持更大的 base64 圖片（最大 4GB）
+    avatar = Column(LongText, nullable=False)  # 改為 LONGTEXT 以支持更大的 base64 圖片（最大 4GB）
     is_online = Column(Boolean, default=False, nullable=False)
     bio = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    last_write_at = Column(Double, nullable=True)  # 最近一次寫入的時間（epoch 秒），之後短時間內該用戶的讀取走主庫
+    blocklist_changed_at = Column(Double, nullable=True, index=True)  # 封鎖列表最近一次變化的時間（epoch 秒），用作快取版本
     
     # 關係
     created_rooms = relationship("Room", back_populates="creator", foreign_keys="Room.created_by")
@@ -49,28 +61,32 @@ class User(Base):
 class Room(Base):
     __tablename__ = "rooms"
     
-    id = Column(String(36), primary_key=True, default=generate_id)
+    id = Column(IdType, primary_key=True, default=generate_id)
     name = Column(String(100), nullable=False)
     is_private = Column(Boolean, default=False, nullable=False)
     password_hash = Column(String(255), nullable=True)  # 僅私有房間需要
-    created_by = Column(String(36), ForeignKey("users.id"), nullable=False)
+    created_by = Column(IdType, ForeignKey("users.id"), nullable=False)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)  # 軟刪除時間，消息由後台任務清理
+    purge_claimed_by = Column(String(128), nullable=True)  # 正在清理該房間的 worker（app.room_purge）
+    purge_claimed_at = Column(Double, nullable=True)  # 上次認領/續期時間（epoch 秒）
     
     # 關係
     creator = relationship("User", foreign_keys=[created_by], back_populates="created_rooms")
-    messages = relationship("Message", back_populates="room", cascade="all, delete-orphan")
+    # 不使用 ORM 級聯刪除（會把整個房間的消息載入記憶體逐條刪除），由 app.room_purge 分批清理
+    messages = relationship("Message", back_populates="room", passive_deletes=True)
 
 
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(String(36), primary_key=True, default=generate_id)
-    room_id = Column(String(36), ForeignKey("rooms.id"), nullable=False, index=True)
-    sender_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
+    id = Column(IdType, primary_key=True, default=generate_id)
+    room_id = Column(IdType, ForeignKey("rooms.id"), nullable=False, index=True)
+    sender_id = Column(IdType, ForeignKey("users.id"), nullable=False, index=True)
     sender_name = Column(String(100), nullable=False)  # 冗余字段，避免查詢用戶表
-    sender_avatar = Column(LONGTEXT, nullable=False)  # 冗余字段，改為 LONGTEXT 以支持更大的 base64 圖片（最大 4GB）
+    sender_avatar = Column(LongText, nullable=False)  # 冗余字段，改為 LONGTEXT 以支持更大的 base64 圖片（最大 4GB）
     content = Column(Text, nullable=False)
     type = Column(String(20), default="text", nullable=False)  # 'text' or 'image'
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -78,14 +94,20 @@ class Message(Base):
     # 關係
     room = relationship("Room", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
+    
+    # 房間歷史、分頁游標和續接查詢都按 (room_id, timestamp, id) 掃描，無需額外排序
+    __table_args__ = (
+        Index("ix_messages_room_timestamp", "room_id", "timestamp", "id"),
+        {"mysql_engine": "InnoDB"},
+    )
 
 
 class UserRelationship(Base):
     __tablename__ = "user_relationships"
     
-    id = Column(String(36), primary_key=True, default=generate_id)
-    user_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
-    target_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
+    id = Column(IdType, primary_key=True, default=generate_id)
+    user_id = Column(IdType, ForeignKey("users.id"), nullable=False, index=True)
+    target_id = Column(IdType, ForeignKey("users.id"), nullable=False, index=True)
     relationship_type = Column(String(20), nullable=False)  # 'favorite' or 'blocked'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -94,6 +116,75 @@ class UserRelationship(Base):
     
     # 唯一約束：同一用戶對同一目標只能有一種關係類型
     __table_args__ = (
+        Index("ix_user_relationships_target_type", "target_id", "relationship_type"),
+        {"mysql_engine": "InnoDB"},
+    )
+
+
+
+class RoomMember(Base):
+    __tablename__ = "room_members"
+    
+    id = Column(IdType, primary_key=True, default=generate_id)
+    room_id = Column(IdType, ForeignKey("rooms.id"), nullable=False)
+    user_id = Column(IdType, ForeignKey("users.id"), nullable=False)
+    joined_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 唯一約束 (room_id, user_id) 同時作為按房間查成員的索引；
+    # (user_id, room_id) 覆蓋索引供 WebSocket 連接時一次性載入用戶的所有房間
+    __table_args__ = (
+        UniqueConstraint("room_id", "user_id", name="uq_room_members_room_user"),
+        Index("ix_room_members_user_room", "user_id", "room_id"),
         {"mysql_engine": "InnoDB"},
     )
 
+
+class RateLimitBucket(Base):
+    """跨 worker 共用的限流令牌桶（RATE_LIMIT_BACKEND=database，見 app/ratelimit.py）"""
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String(191), primary_key=True)  # "{路由}:{用戶 ID}"
+    tokens = Column(Double, nullable=False)  # 上次更新時的剩餘令牌
+    updated_at = Column(Double, nullable=False, index=True)  # 上次更新時間（epoch 秒，需要 DOUBLE：單精度 FLOAT 只能精確到約 2 分鐘），清理過期桶時使用
+    
+    __table_args__ = (
+        {"mysql_engine": "InnoDB"},
+    )
+
+
+class PresenceWorker(Base):
+    """在線狀態：每個 worker 一行心跳，心跳過期的 worker 的連接計數不再有效（見 app/presence.py）"""
+    __tablename__ = "presence_workers"
+    
+    worker_id = Column(String(128), primary_key=True)  # "{主機名}:{pid}"
+    heartbeat_at = Column(Double, nullable=False, index=True)  # 上次心跳時間（epoch 秒）
+    
+    __table_args__ = (
+        {"mysql_engine": "InnoDB"},
+    )
+
+
+class PresenceConnection(Base):
+    """在線狀態：每個 worker 上每個用戶的連接數（只記錄大於 0 的）"""
+    __tablename__ = "presence_connections"
+    
+    worker_id = Column(String(128), primary_key=True)
+    user_id = Column(IdType, primary_key=True)
+    connections = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_presence_connections_user", "user_id"),
+        {"mysql_engine": "InnoDB"},
+    )
+
+
+class PresenceHold(Base):
+    """在線狀態：服務關閉時保持在線的用戶，期限前沒有重新連接時由存活的 worker 標記離線"""
+    __tablename__ = "presence_holds"
+    
+    user_id = Column(IdType, primary_key=True)
+    deadline = Column(Double, nullable=False, index=True)  # 離線期限（epoch 秒）
+    
+    __table_args__ = (
+        {"mysql_engine": "InnoDB"},
+    )
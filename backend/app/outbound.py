@@ -0,0 +1,214 @@
+"""
+WebSocket 出站優先級通道
+每個連接同一時間只有一個發送者：連接空閒時事件直接發送；連接正在發送（慢連接、緩衝區已滿）時，
+事件按優先級放入連接的待發送通道，當前發送完成後由後台任務按優先級繼續發送，扇出只等待自己的那一次發送：
+- 0 消息：NEW_MESSAGE、心跳等控制事件
+- 1 房間：ROOM_CREATED / ROOM_UPDATED / ROOM_DELETED
+- 2 在線狀態：USER_UPDATE / USER_LEFT / USER_JOINED / TYPING
+這樣在線狀態風暴（大量重連）時，排在後面的新消息會先於積壓的狀態事件送達。
+積壓時低優先級事件可以犧牲：同一用戶的 USER_UPDATE / USER_LEFT 合併為最終狀態，超出上限時直接丟棄；
+消息和房間事件積壓超出上限時視為連接無法跟上，拋出 OutboundQueueFull 由調用方斷開連接。
+合併發送（app.batching）的連接共用這些通道，窗口結束時按優先級拼接為一個數組幀。
+"""
+import asyncio
+from collections import deque
+from typing import Callable, List, Optional
+
+from app.codec import encode_event, join_frames
+from app.config import settings
+from app.connections import ConnectionRecord
+from app.metrics import metrics
+
+PRIORITY_MESSAGE = 0
+PRIORITY_ROOM = 1
+PRIORITY_PRESENCE = 2
+LANES = 3
+
+EVENT_PRIORITIES = {
+    "NEW_MESSAGE": PRIORITY_MESSAGE,
+    "ROOM_CREATED": PRIORITY_ROOM,
+    "ROOM_UPDATED": PRIORITY_ROOM,
+    "ROOM_DELETED": PRIORITY_ROOM,
+    "USER_UPDATE": PRIORITY_PRESENCE,
+    "USER_LEFT": PRIORITY_PRESENCE,
+    "USER_JOINED": PRIORITY_PRESENCE,
+    "TYPING": PRIORITY_PRESENCE,
+}
+
+
+# 正在發送積壓事件的後台任務（保持引用，避免任務被回收）
+_drain_tasks = set()
+
+
+class OutboundQueueFull(Exception):
+    """連接積壓的消息/房間事件超出上限"""
+
+
+def event_priority(message: dict) -> int:
+    """未列出的事件類型（ping/pong 等）按最高優先級處理"""
+    return EVENT_PRIORITIES.get(message.get("type"), PRIORITY_MESSAGE)
+
+
+def collapse_key(message: dict) -> Optional[str]:
+    """可合併事件（同一用戶的 USER_UPDATE / USER_LEFT）返回用戶 ID，其他事件返回 None"""
+    event_type = message.get("type")
+    if event_type == "USER_UPDATE":
+        return message["payload"].get("id")
+    if event_type == "USER_LEFT":
+        return message["payload"].get("userId")
+    return None
+
+
+def _as_update(message: dict) -> dict:
+    """將 USER_LEFT 視為 isOnline=False 的 USER_UPDATE，便於合併"""
+    if message["type"] == "USER_LEFT":
+        return {"id": message["payload"]["userId"], "isOnline": False}
+    return message["payload"]
+
+
+def merge_events(previous: dict, message: dict) -> dict:
+    """
+    合併同一用戶的兩個事件
+    後一個事件包含前一個的所有欄位時直接使用後一個（無需重新序列化），
+    否則合併為一個 USER_UPDATE，避免只含在線狀態的事件蓋掉資料更新
+    """
+    previous_payload = _as_update(previous)
+    payload = _as_update(message)
+    if payload.keys() >= previous_payload.keys():
+        return message
+    return {"type": "USER_UPDATE", "payload": {**previous_payload, **payload}}
+
+
+def queue_event(record: ConnectionRecord, message: dict, frame):
+    """
+    將已序列化的事件放入連接的待發送通道
+    可合併事件的條目是 [key, 事件, 幀]，合併時原地替換，保持在通道中的原位置
+    """
+    lanes = record.pending
+    if lanes is None:
+        lanes = record.pending = [deque() for _ in range(LANES)]
+    key = collapse_key(message)
+    if key is not None:
+        if record.pending_keys is None:
+            record.pending_keys = {}
+        entry = record.pending_keys.get(key)
+        if entry is not None:
+            merged = merge_events(entry[1], message)
+            entry[1] = merged
+            entry[2] = frame if merged is message else encode_event(merged, record.encoding)
+            metrics.inc("websocket.outbound.collapsed")
+            return
+    priority = event_priority(message)
+    if priority == PRIORITY_PRESENCE:
+        if len(lanes[PRIORITY_PRESENCE]) >= settings.WS_OUTBOUND_MAX_LOW_PRIORITY:
+            metrics.inc("websocket.outbound.dropped")
+            return
+    elif len(lanes[PRIORITY_MESSAGE]) + len(lanes[PRIORITY_ROOM]) >= settings.WS_OUTBOUND_MAX_QUEUED:
+        metrics.inc("websocket.outbound.overflow")
+        raise OutboundQueueFull(f"{settings.WS_OUTBOUND_MAX_QUEUED} events queued")
+    if key is not None:
+        entry = [key, message, frame]
+        record.pending_keys[key] = entry
+        lanes[priority].append(entry)
+    else:
+        lanes[priority].append(frame)
+    metrics.inc(f"websocket.outbound.queued.{priority}")
+
+
+def _frame_of(record: ConnectionRecord, entry):
+    if type(entry) is list:
+        del record.pending_keys[entry[0]]
+        return entry[2]
+    return entry
+
+
+def clear(record: ConnectionRecord):
+    """丟棄所有待發送事件"""
+    record.pending = None
+    record.pending_keys = None
+
+
+def take_next(record: ConnectionRecord):
+    """取出優先級最高的一個待發送幀"""
+    lanes = record.pending
+    frame = None
+    for lane in lanes:
+        if lane:
+            frame = _frame_of(record, lane.popleft())
+            break
+    if not any(lanes):
+        clear(record)
+    return frame
+
+
+def take_all(record: ConnectionRecord) -> List:
+    """按優先級取出所有待發送幀"""
+    frames = [
+        entry[2] if type(entry) is list else entry
+        for lane in record.pending for entry in lane
+    ]
+    clear(record)
+    return frames
+
+
+async def send_frame(record: ConnectionRecord, frame):
+    if isinstance(frame, bytes):
+        await record.websocket.send_bytes(frame)
+    else:
+        await record.websocket.send_text(frame)
+
+
+async def drain(record: ConnectionRecord, frame=None):
+    """
+    佔用連接的發送權，先發送 frame（如有），再按優先級發送積壓的事件直到清空
+    合併發送的連接每輪把積壓事件拼成一個數組幀
+    """
+    record.sending = True
+    try:
+        if frame is not None:
+            await send_frame(record, frame)
+        while record.pending is not None:
+            if record.batched:
+                frames = take_all(record)
+                if not frames:
+                    continue
+                await send_frame(record, frames[0] if len(frames) == 1 else join_frames(frames, record.encoding))
+                metrics.inc("websocket.batch.frames")
+                metrics.inc("websocket.batch.events", len(frames))
+            else:
+                frame = take_next(record)
+                if frame is not None:
+                    await send_frame(record, frame)
+    finally:
+        record.sending = False
+
+
+async def _drain_backlog(record: ConnectionRecord, on_error: Callable):
+    try:
+        await drain(record)
+    except Exception as e:
+        on_error(record, e)
+
+
+async def deliver(record: ConnectionRecord, message: dict, frame, on_error: Callable):
+    """
+    發送一個事件：連接正在發送時入隊；否則直接發送，發送期間積壓的事件交給後台任務
+    後台發送失敗時調用 on_error(record, error)
+    """
+    if record.sending:
+        queue_event(record, message, frame)
+        return
+    record.sending = True
+    task = None
+    try:
+        await send_frame(record, frame)
+        if record.pending is not None:
+            task = asyncio.create_task(_drain_backlog(record, on_error))
+    finally:
+        # 發送失敗或被取消（CancelledError 不是 Exception）時也要釋放發送權，否則後續事件只會入隊
+        if task is None:
+            record.sending = False
+    if task is None:
+        return
+    _drain_tasks.add(task)
+    task.add_done_callback(_drain_tasks.discard)
@@ -0,0 +1,122 @@
+"""
+資料庫連接池監控
+- 借出等待時間、超時（連接池耗盡）次數、借出中連接數
+- 連接持有時間，超過 DB_POOL_HOLD_WARN_SECONDS 時記錄警告
+- 跨 await 持有檢測：事件循環是單線程的，如果某個協程借出的連接尚未歸還，
+  而另一個協程正在借出連接，說明前者在持有連接時讓出了事件循環（await），
+  期間其他請求只能使用剩餘的連接
+"""
+import asyncio
+import time
+import traceback
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app.config import settings
+from app.metrics import metrics
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # 線程池中（例如同步依賴）沒有運行中的事件循環
+        return None
+
+
+class InstrumentedQueuePool(QueuePool):
+    """記錄借出等待時間和耗盡次數的 QueuePool"""
+
+    # 由 instrument_engine 設置，用於區分主庫/副本的指標
+    monitor_name = "db"
+
+    def _do_get(self):
+        name = self.monitor_name
+        if self.checkedout() >= self.size() + self._max_overflow:
+            # 所有連接都已借出，本次借出需要排隊等待歸還
+            metrics.inc(f"db.pool.{name}.exhausted")
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc(f"db.pool.{name}.timeouts")
+            print(f"[DBPool] Checkout timed out after {time.perf_counter() - start:.1f}s ({self.status()})")
+            raise
+        finally:
+            metrics.observe(f"db.pool.{name}.checkout_wait_seconds", time.perf_counter() - start)
+
+
+def _caller_stack() -> list:
+    """借出連接的應用層調用棧（去掉 SQLAlchemy 和 asyncio 內部的幀）"""
+    return [
+        frame for frame in traceback.format_stack(limit=30)
+        if "sqlalchemy" not in frame and "asyncio" not in frame and "pool_monitor" not in frame
+    ][-8:]
+
+
+def instrument_engine(engine, name: str):
+    """為引擎註冊借出/歸還事件"""
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.monitor_name = name
+    # 借出中的連接：{id(connection_record): (task, checkout_time, stack)}
+    held = {}
+    # 已報告過跨 await 持有的連接，每次借出只報告一次
+    flagged = set()
+
+    def flag_held_across_await(current):
+        for key, (task, checked_out_at, stack) in list(held.items()):
+            if task is None or task is current or task.done() or key in flagged:
+                continue
+            if task.get_loop() is not current.get_loop():
+                # 其他線程的事件循環，不是本循環讓出導致的
+                continue
+            flagged.add(key)
+            metrics.inc(f"db.pool.{name}.held_across_await")
+            held_for = time.monotonic() - checked_out_at
+            print(f"[DBPool] Connection held across await by task {task.get_name()} for {held_for:.3f}s")
+            if stack:
+                print("".join(stack))
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        task = _current_task()
+        if task is not None:
+            flag_held_across_await(task)
+        stack = _caller_stack() if settings.DB_POOL_TRACK_STACKS else None
+        held[id(connection_record)] = (task, time.monotonic(), stack)
+        metrics.set_gauge(f"db.pool.{name}.checked_out", engine.pool.checkedout())
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        key = id(connection_record)
+        flagged.discard(key)
+        entry = held.pop(key, None)
+        # checkin 事件在連接放回連接池之前觸發，此時仍計入借出數
+        metrics.set_gauge(f"db.pool.{name}.checked_out", max(0, engine.pool.checkedout() - 1))
+        if entry is None:
+            return
+        task, checked_out_at, stack = entry
+        held_for = time.monotonic() - checked_out_at
+        metrics.observe(f"db.pool.{name}.held_seconds", held_for)
+        if held_for >= settings.DB_POOL_HOLD_WARN_SECONDS:
+            metrics.inc(f"db.pool.{name}.long_held")
+            print(f"[DBPool] Connection held for {held_for:.2f}s")
+            if stack:
+                print("".join(stack))
+
+
+def per_worker_pool_limits() -> tuple:
+    """
+    計算每個 worker 的 (pool_size, max_overflow)
+    設置 DB_CONNECTION_BUDGET（所有 worker 合計的連接上限）時按 DB_WORKERS 平分，不超過單個 worker 的配置
+    """
+    pool_size = settings.DB_POOL_SIZE
+    max_overflow = settings.DB_MAX_OVERFLOW
+    if settings.DB_CONNECTION_BUDGET > 0:
+        per_worker = max(1, settings.DB_CONNECTION_BUDGET // max(1, settings.DB_WORKERS))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    return pool_size, max_overflow
@@ -0,0 +1,377 @@
+"""
+在線狀態（Presence）服務
+- 記憶體中按用戶統計連接數，多個分頁只算一次在線
+- 最後一個連接斷開後等待寬限期才視為離線，避免行動網路抖動造成狀態閃爍
+- 狀態變化先合併，每隔固定毫秒批量廣播一次
+- 定期將累積的狀態變化批量寫回資料庫
+- 服務關閉前 hold_online()：之後斷開的連接保持在線狀態，用戶重連到新進程時不再重複廣播和寫入；
+  關閉時這些用戶連同離線期限寫入 presence_holds，期限過後仍沒有連接的用戶由任一存活的 worker 標記離線
+- 多個 worker：每個 worker 的連接數寫入 presence_connections（每個 flush 間隔寫一次變化），
+  並在 presence_workers 中定期心跳；寬限期結束時如果其他存活的 worker 上仍有該用戶的連接，
+  本 worker 只移除自己的記錄，不廣播離線、不寫入 is_online=False
+所有資料庫操作都在線程池中執行，不阻塞事件循環。
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import delete, insert, select, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.metrics import metrics
+from app.models import PresenceConnection, PresenceHold, PresenceWorker, User
+
+
+def worker_id() -> str:
+    """當前 worker 的標識；fork 後 pid 不同，每次調用時重新計算"""
+    return f"{socket.gethostname()}:{os.getpid()}"[:128]
+
+
+class PresenceService:
+    def __init__(
+        self,
+        grace_seconds: float,
+        flush_interval_ms: int,
+        persist_interval_seconds: float,
+        worker_stale_seconds: float
+    ):
+        self.grace_seconds = grace_seconds
+        self.flush_interval = flush_interval_ms / 1000
+        self.persist_interval = persist_interval_seconds
+        self.worker_stale_seconds = worker_stale_seconds
+        # 每個用戶當前的連接數：{user_id: count}
+        self.connection_counts: Dict[str, int] = {}
+        # 當前視為在線的用戶
+        self.online_users: Set[str] = set()
+        # 等待寬限期結束後離線的用戶：{user_id: deadline (monotonic)}
+        self._offline_deadlines: Dict[str, float] = {}
+        # 待廣播的狀態變化（同一用戶只保留最後狀態）：{user_id: is_online}
+        self._pending_broadcast: Dict[str, bool] = {}
+        # 待寫入資料庫的狀態變化：{user_id: is_online}
+        self._pending_persist: Dict[str, bool] = {}
+        # 最後一次廣播出去的狀態，用於丟棄來回抖動後沒有實際變化的事件
+        self._broadcast_state: Dict[str, bool] = {}
+        # 連接數有變化、尚未寫入 presence_connections 的用戶
+        self._dirty_counts: Set[str] = set()
+        self._last_persist = time.monotonic()
+        # 服務關閉中：斷開的連接不進入離線寬限期
+        self._holding = False
+        # 關閉中斷開、預期會重連到新進程的用戶，及其離線期限（epoch 秒）
+        self._held_users: Set[str] = set()
+        self._hold_deadline = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self.online_users
+
+    def connected(self, user_id: str, persisted_online: bool = False):
+        """用戶建立了一個新連接；persisted_online 為資料庫中當前的在線狀態"""
+        self.connection_counts[user_id] = self.connection_counts.get(user_id, 0) + 1
+        self._dirty_counts.add(user_id)
+        self._offline_deadlines.pop(user_id, None)
+        self.mark_online(user_id, persisted_online)
+
+    def disconnected(self, user_id: str):
+        """用戶斷開了一個連接；最後一個連接斷開後進入寬限期"""
+        count = self.connection_counts.get(user_id, 0) - 1
+        self._dirty_counts.add(user_id)
+        if count > 0:
+            self.connection_counts[user_id] = count
+            return
+        self.connection_counts.pop(user_id, None)
+        if self._holding:
+            # 服務關閉中，用戶預期會重連到新進程，保持資料庫中的在線狀態（關閉時寫入 presence_holds）
+            self._held_users.add(user_id)
+            return
+        if user_id in self.online_users:
+            self._offline_deadlines[user_id] = time.monotonic() + self.grace_seconds
+
+    def hold_online(self, reconnect_seconds: float):
+        """
+        服務關閉前調用：之後斷開的連接不再標記離線
+        reconnect_seconds 為客戶端重連的最長延遲，超過它再加上寬限期仍未重連的用戶視為離線
+        """
+        self._holding = True
+        self._hold_deadline = time.time() + reconnect_seconds + self.grace_seconds
+
+    def mark_online(self, user_id: str, persisted_online: bool = False):
+        """
+        立即標記為在線（登入或建立連接）
+        資料庫中已是在線（例如服務重啟後重連、其他 worker 上已有連接）且沒有待寫入的狀態時，
+        只更新本進程記錄，不重複廣播和寫入
+        """
+        self._offline_deadlines.pop(user_id, None)
+        if user_id not in self.online_users:
+            self.online_users.add(user_id)
+            if persisted_online and user_id not in self._pending_persist:
+                self._broadcast_state[user_id] = True
+                metrics.inc("presence.reconnect_suppressed")
+            else:
+                self._record(user_id, True)
+
+    def mark_offline(self, user_id: str):
+        """立即標記為離線（登出），不等待寬限期"""
+        self._offline_deadlines.pop(user_id, None)
+        if user_id in self.online_users:
+            self.online_users.discard(user_id)
+            self._record(user_id, False)
+        else:
+            # 本進程沒有該用戶的在線記錄，但資料庫中可能仍為在線
+            self._pending_persist[user_id] = False
+
+    def _record(self, user_id: str, is_online: bool):
+        self._pending_broadcast[user_id] = is_online
+        self._pending_persist[user_id] = is_online
+
+    async def _expire_deadlines(self):
+        """
+        將寬限期已結束且仍沒有連接的用戶標記為離線
+        其他存活的 worker 上仍有連接的用戶只從本進程移除，不廣播離線
+        """
+        now = time.monotonic()
+        expired = [user_id for user_id, deadline in self._offline_deadlines.items() if deadline <= now]
+        for user_id in expired:
+            del self._offline_deadlines[user_id]
+        expired = [user_id for user_id in expired if not self.connection_counts.get(user_id)]
+        if not expired:
+            return
+        try:
+            elsewhere = await asyncio.to_thread(self.connected_elsewhere, expired)
+        except Exception as e:
+            print(f"[Presence] Error checking connections on other workers: {e}")
+            elsewhere = set()
+        for user_id in expired:
+            # 查詢期間重新連接到本 worker
+            if self.connection_counts.get(user_id):
+                continue
+            self.online_users.discard(user_id)
+            if user_id in elsewhere:
+                self._broadcast_state.pop(user_id, None)
+                metrics.inc("presence.offline_suppressed")
+                continue
+            self._record(user_id, False)
+
+    def _connected_on_live_workers(self, db, user_ids: Iterable[str], include_self: bool) -> Set[str]:
+        """在存活（心跳未過期）的 worker 上仍有連接的用戶"""
+        conditions = [
+            PresenceConnection.user_id.in_(list(user_ids)),
+            PresenceConnection.connections > 0,
+            PresenceWorker.heartbeat_at >= time.time() - self.worker_stale_seconds
+        ]
+        if not include_self:
+            conditions.append(PresenceConnection.worker_id != worker_id())
+        rows = db.execute(
+            select(PresenceConnection.user_id).distinct()
+            .join(PresenceWorker, PresenceWorker.worker_id == PresenceConnection.worker_id)
+            .where(*conditions)
+        ).all()
+        return {row[0] for row in rows}
+
+    def connected_elsewhere(self, user_ids: Iterable[str]) -> Set[str]:
+        """在其他存活的 worker 上仍有連接的用戶"""
+        db = SessionLocal()
+        try:
+            return self._connected_on_live_workers(db, user_ids, include_self=False)
+        finally:
+            db.close()
+
+    def _expire_holds(self, db) -> Set[str]:
+        """
+        處理離線期限已過的 presence_holds：仍沒有任何連接的用戶寫入 is_online=False，返回這些用戶
+        已重新連接的用戶只刪除記錄；多個 worker 同時處理時結果相同
+        """
+        now = time.time()
+        due = set(db.execute(select(PresenceHold.user_id).where(PresenceHold.deadline <= now)).scalars())
+        if not due:
+            return set()
+        connected = self._connected_on_live_workers(db, due, include_self=True)
+        offline = {user_id for user_id in due - connected if not self.connection_counts.get(user_id)}
+        if offline:
+            db.query(User).filter(User.id.in_(offline)).update({User.is_online: False}, synchronize_session=False)
+        db.execute(delete(PresenceHold).where(PresenceHold.user_id.in_(due), PresenceHold.deadline <= now))
+        return offline
+
+    async def flush_broadcasts(self):
+        """將合併後的狀態變化廣播出去"""
+        if not self._pending_broadcast:
+            return
+        from app.websocket import websocket_manager
+
+        pending, self._pending_broadcast = self._pending_broadcast, {}
+        changes = {}
+        for user_id, is_online in pending.items():
+            if self._broadcast_state.get(user_id) == is_online:
+                continue
+            self._broadcast_state[user_id] = is_online
+            changes[user_id] = is_online
+        try:
+            await websocket_manager.broadcast_presence_batch(changes)
+        except Exception as e:
+            print(f"[Presence] Error broadcasting presence for {len(changes)} users: {e}")
+        # 離線用戶不再需要記錄上次廣播狀態
+        for user_id, is_online in pending.items():
+            if not is_online and user_id not in self.online_users:
+                self._broadcast_state.pop(user_id, None)
+
+    def _heartbeat(self, db):
+        worker = worker_id()
+        now = time.time()
+        updated = db.execute(
+            update(PresenceWorker).where(PresenceWorker.worker_id == worker).values(heartbeat_at=now)
+        ).rowcount
+        if not updated:
+            db.execute(insert(PresenceWorker).values(worker_id=worker, heartbeat_at=now))
+
+    def write_connection_counts(self, counts: Dict[str, int]):
+        """寫入本 worker 的連接數變化（在線程中執行）：連接數為 0 的用戶刪除記錄"""
+        worker = worker_id()
+        db = SessionLocal()
+        try:
+            db.execute(delete(PresenceConnection).where(
+                PresenceConnection.worker_id == worker,
+                PresenceConnection.user_id.in_(list(counts))
+            ))
+            rows = [
+                {"worker_id": worker, "user_id": user_id, "connections": count}
+                for user_id, count in counts.items() if count > 0
+            ]
+            if rows:
+                db.execute(insert(PresenceConnection), rows)
+            self._heartbeat(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def flush_connection_counts(self):
+        """將本 worker 連接數的變化寫入 presence_connections"""
+        if not self._dirty_counts:
+            return
+        dirty, self._dirty_counts = self._dirty_counts, set()
+        counts = {user_id: self.connection_counts.get(user_id, 0) for user_id in dirty}
+        try:
+            await asyncio.to_thread(self.write_connection_counts, counts)
+        except Exception as e:
+            # 下一輪重試（期間的新變化會一起寫入最新值）
+            self._dirty_counts |= dirty
+            print(f"[Presence] Error writing connection counts: {e}")
+
+    def _write_presence(self, pending: Dict[str, bool]) -> Set[str]:
+        """
+        寫入累積的在線狀態、本 worker 心跳，清理已停止的 worker 的連接記錄，
+        並將關閉時保持在線、期限內沒有重連的用戶標記離線（在線程中執行），返回這些用戶
+        """
+        online_ids = [user_id for user_id, is_online in pending.items() if is_online]
+        offline_ids = [user_id for user_id, is_online in pending.items() if not is_online]
+        stale_before = time.time() - self.worker_stale_seconds * 10
+        db = SessionLocal()
+        try:
+            if online_ids:
+                db.query(User).filter(User.id.in_(online_ids)).update(
+                    {User.is_online: True}, synchronize_session=False
+                )
+            if offline_ids:
+                db.query(User).filter(User.id.in_(offline_ids)).update(
+                    {User.is_online: False}, synchronize_session=False
+                )
+            self._heartbeat(db)
+            stale = select(PresenceWorker.worker_id).where(PresenceWorker.heartbeat_at < stale_before)
+            db.execute(delete(PresenceConnection).where(PresenceConnection.worker_id.in_(stale)))
+            db.execute(delete(PresenceWorker).where(PresenceWorker.heartbeat_at < stale_before))
+            expired_holds = self._expire_holds(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if pending:
+            print(f"[Presence] Persisted presence: {len(online_ids)} online, {len(offline_ids)} offline")
+        if expired_holds:
+            print(f"[Presence] {len(expired_holds)} users did not reconnect after shutdown, marked offline")
+        return expired_holds
+
+    async def persist(self):
+        """將累積的狀態變化批量寫回資料庫（每種狀態一條 UPDATE），同時更新本 worker 心跳"""
+        self._last_persist = time.monotonic()
+        pending, self._pending_persist = self._pending_persist, {}
+        try:
+            expired_holds = await asyncio.to_thread(self._write_presence, pending)
+        except Exception as e:
+            # 寫入失敗時放回佇列，下一輪重試（不覆蓋期間產生的新狀態）
+            for user_id, is_online in pending.items():
+                self._pending_persist.setdefault(user_id, is_online)
+            print(f"[Presence] Error persisting presence: {e}")
+            return
+        for user_id in expired_holds:
+            # 已寫入資料庫，只需通知本 worker 的連接
+            if user_id not in self.online_users:
+                self._pending_broadcast[user_id] = False
+
+    def _forget_worker(self, held_users: Set[str]):
+        """服務關閉時刪除本 worker 的連接記錄和心跳，保持在線的用戶寫入 presence_holds"""
+        worker = worker_id()
+        db = SessionLocal()
+        try:
+            db.execute(delete(PresenceConnection).where(PresenceConnection.worker_id == worker))
+            db.execute(delete(PresenceWorker).where(PresenceWorker.worker_id == worker))
+            if held_users:
+                db.execute(delete(PresenceHold).where(PresenceHold.user_id.in_(list(held_users))))
+                db.execute(insert(PresenceHold), [
+                    {"user_id": user_id, "deadline": self._hold_deadline} for user_id in held_users
+                ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._expire_deadlines()
+                await self.flush_broadcasts()
+                await self.flush_connection_counts()
+                if time.monotonic() - self._last_persist >= self.persist_interval:
+                    await self.persist()
+            except Exception as e:
+                print(f"[Presence] Error in presence loop: {e}")
+
+    def start(self):
+        """啟動後台批量廣播/寫入任務（在事件循環中調用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止後台任務並寫入剩餘的狀態變化"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_broadcasts()
+        await self.persist()
+        # 關閉時仍連接（排空超時）或排空期間斷開的用戶，都等待重連到新進程
+        held_users = (self._held_users | set(self.connection_counts)) if self._holding else set()
+        try:
+            await asyncio.to_thread(self._forget_worker, held_users)
+        except Exception as e:
+            print(f"[Presence] Error removing worker connection records: {e}")
+
+
+# 全局 Presence 服務
+presence_service = PresenceService(
+    grace_seconds=settings.PRESENCE_GRACE_SECONDS,
+    flush_interval_ms=settings.PRESENCE_FLUSH_INTERVAL_MS,
+    persist_interval_seconds=settings.PRESENCE_PERSIST_INTERVAL_SECONDS,
+    worker_stale_seconds=settings.PRESENCE_WORKER_STALE_SECONDS
+)
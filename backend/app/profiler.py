@@ -0,0 +1,175 @@
+"""
+按需採樣分析（不需要重新部署即可查看線上 worker 的 CPU 消耗在哪裡）
+- 單個請求：帶 X-Profile-Token 請求頭（值為 PROFILING_TOKEN）的 HTTP 請求，在處理期間採樣事件循環線程，
+  響應頭 X-Profile-File 返回輸出文件名
+- 整個 worker：POST /api/debug/profile?seconds=N（同樣需要 X-Profile-Token），在 N 秒內（不超過
+  PROFILING_MAX_SECONDS）採樣所有線程，期間 worker 照常處理請求和 WebSocket 推送
+採樣由一個後台線程定時讀取 sys._current_frames() 完成，不修改被分析的代碼；
+輸出為 folded stacks 格式（每行「根;...;葉 次數」），可直接用 flamegraph.pl、speedscope、inferno 生成火焰圖。
+事件循環是單線程的，單個請求的採樣也會包含同一時間其他協程的調用棧。
+未設置 PROFILING_TOKEN 時不註冊中間件、不啟動線程，調試端點返回 404，沒有任何額外開銷。
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from app.config import settings
+from app.metrics import metrics
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_FILE_HEADER = b"x-profile-file"
+# 整個 worker 分析的端點，本身不做單請求採樣
+WORKER_PROFILE_PATH = "/api/debug/profile"
+MAX_STACK_DEPTH = 200
+
+
+class StackSampler:
+    """後台線程定時採樣指定線程（默認除自身外的所有線程）的調用棧"""
+
+    def __init__(self, interval_seconds: float, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = interval_seconds
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.counts: Counter = Counter()
+        self.samples = 0
+        # 代碼對象 -> 幀標籤，避免每次採樣重新格式化
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = Path(code.co_filename)
+            label = self._labels[code] = f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if self.thread_ids is None:
+                stack.append(f"thread {thread_names.get(thread_id, thread_id)}")
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.monotonic() - self.started_at
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class Profiler:
+    def __init__(self, token: str, interval_ms: float, max_seconds: float, output_dir: Path):
+        self.token = token
+        self.interval = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self.output_dir = output_dir
+        # 同一時間每個 worker 只運行一個採樣器（採樣線程本身也佔用 GIL）
+        self._active: Optional[StackSampler] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    @property
+    def busy(self) -> bool:
+        return self._active is not None
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and hmac.compare_digest(token, self.token)
+
+    def start(self, thread_ids: Optional[Iterable[int]] = None) -> Optional[StackSampler]:
+        """開始採樣；已有採樣在運行時返回 None"""
+        if self._active is not None:
+            return None
+        sampler = self._active = StackSampler(self.interval, thread_ids)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: StackSampler, kind: str, label: str = "") -> str:
+        """停止採樣並寫入 folded stacks 文件，返回文件名"""
+        sampler.stop()
+        self._active = None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        suffix = "".join(char if char.isalnum() else "_" for char in label).strip("_")[:80]
+        name = f"{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+        filename = f"{name}-{suffix}.folded" if suffix else f"{name}.folded"
+        (self.output_dir / filename).write_text(sampler.folded(), encoding="utf-8")
+        metrics.inc(f"profiler.{kind}")
+        print(f"[Profiler] Wrote {filename} ({sampler.samples} samples in {sampler.duration:.2f}s)")
+        return filename
+
+
+class ProfilingMiddleware:
+    """
+    ASGI 中間件：帶有效 X-Profile-Token 的 HTTP 請求在處理期間採樣事件循環線程，
+    在響應開始時停止採樣並通過 X-Profile-File 返回文件名（僅在 PROFILING_TOKEN 已設置時註冊）
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == WORKER_PROFILE_PATH:
+            await self.app(scope, receive, send)
+            return
+        token = next((value for key, value in scope["headers"] if key == PROFILE_TOKEN_HEADER), None)
+        if token is None or not self.profiler.authorized(token.decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+        sampler = self.profiler.start(thread_ids=[threading.get_ident()])
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+        finished = False
+
+        async def send_with_profile(message):
+            nonlocal finished
+            if message["type"] == "http.response.start" and not finished:
+                finished = True
+                filename = self.profiler.finish(sampler, "request", f"{scope['method']} {scope['path']}")
+                message["headers"] = [*message.get("headers", []), (PROFILE_FILE_HEADER, filename.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            if not finished:
+                self.profiler.finish(sampler, "request", f"{scope['method']} {scope['path']}")
+
+
+# 全局採樣分析器
+profiler = Profiler(
+    token=settings.PROFILING_TOKEN,
+    interval_ms=settings.PROFILING_SAMPLE_INTERVAL_MS,
+    max_seconds=settings.PROFILING_MAX_SECONDS,
+    output_dir=settings.profile_dir_absolute
+)
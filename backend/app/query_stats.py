@@ -0,0 +1,119 @@
+"""
+每個請求的資料庫查詢統計和慢查詢日誌（SQLAlchemy 引擎事件）
+- 每條語句執行前後記錄時間，累加到當前請求（contextvars，線程池中執行的同步依賴也能看到）
+- 請求結束時按路由模板（例如 GET /api/messages/rooms/{room_id}）記錄查詢次數和資料庫時間，
+  存放在 metrics 的 summary（db.route_queries.* / db.route_seconds.*），通過 /api/debug/queries 查看每個路由的匯總
+- 響應頭 Server-Timing: db;dur=<毫秒>;desc="<N> queries"，瀏覽器開發者工具中可以直接看到
+- 單條語句超過 DB_SLOW_QUERY_MS 時打印語句和所屬路由，計數 db.slow_queries
+請求之外的查詢（後台任務、WebSocket 連接處理）只計入全局的 db.queries 和 db.query_seconds。
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.metrics import metrics
+
+ROUTE_QUERIES_PREFIX = "db.route_queries."
+ROUTE_SECONDS_PREFIX = "db.route_seconds."
+SLOW_QUERY_STATEMENT_MAX_CHARS = 500
+
+
+class RequestQueries:
+    __slots__ = ("scope", "count", "seconds")
+
+    def __init__(self, scope: dict):
+        # ASGI scope，路由匹配後 Starlette 會在其中寫入 route
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or "<unmatched>"
+        return f"{self.scope['method']} {path}"
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def instrument_queries(engine, name: str):
+    """為引擎註冊語句計時事件"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # 計時存放在本次執行的上下文中，語句出錯時不會殘留
+        context._query_started_at = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started_at", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        metrics.inc("db.queries")
+        metrics.observe("db.query_seconds", elapsed)
+        current = _current.get()
+        if current is not None:
+            current.count += 1
+            current.seconds += elapsed
+        if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+            metrics.inc("db.slow_queries")
+            route = current.route if current is not None else "background"
+            sql = " ".join(statement.split())[:SLOW_QUERY_STATEMENT_MAX_CHARS]
+            print(f"[SlowQuery] {elapsed * 1000:.1f}ms on {name} ({route}): {sql}")
+
+
+def server_timing(queries: RequestQueries) -> bytes:
+    return f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"'.encode()
+
+
+class QueryAccountingMiddleware:
+    """ASGI 中間件：為每個 HTTP 請求建立查詢統計，添加 Server-Timing 響應頭並在結束時按路由記錄"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope)
+        token = _current.set(queries)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.DB_SERVER_TIMING:
+                message["headers"] = [*message.get("headers", []), (b"server-timing", server_timing(queries))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = queries.route
+            metrics.observe(f"{ROUTE_QUERIES_PREFIX}{route}", queries.count)
+            metrics.observe(f"{ROUTE_SECONDS_PREFIX}{route}", queries.seconds)
+
+
+def route_summary() -> list:
+    """每個路由的請求數、平均/最大查詢次數和資料庫時間，按資料庫總時間降序"""
+    routes = []
+    for name, counts in metrics.summaries.items():
+        if not name.startswith(ROUTE_QUERIES_PREFIX):
+            continue
+        route = name[len(ROUTE_QUERIES_PREFIX):]
+        seconds = metrics.summaries.get(f"{ROUTE_SECONDS_PREFIX}{route}", {"sum": 0.0, "max": 0.0})
+        requests = counts["count"]
+        routes.append({
+            "route": route,
+            "requests": requests,
+            "queries_avg": round(counts["sum"] / requests, 2),
+            "queries_max": counts["max"],
+            "db_ms_avg": round(seconds["sum"] / requests * 1000, 2),
+            "db_ms_max": round(seconds["max"] * 1000, 2),
+            "db_ms_total": round(seconds["sum"] * 1000, 1),
+        })
+    return sorted(routes, key=lambda route: route["db_ms_total"], reverse=True)
@@ -0,0 +1,197 @@
+"""
+HTTP 接口令牌桶限流（每個用戶 × 每個路由一個桶）
+- messages.send：發送消息
+- messages.search：搜索消息歷史（LIKE 查詢，開銷最大）
+- upload：上傳頭像和消息圖片（WebP 轉換佔用 CPU）
+桶的容量（burst）允許正常的連續操作，補充速率（rate）限制持續濫用。
+超出限制時返回 429 Too Many Requests，Retry-After 為補足一個令牌所需的秒數（向上取整）。
+
+兩種存儲後端（RATE_LIMIT_BACKEND）：
+- memory：每個 worker 各自計數（LRU，最多 RATE_LIMIT_MAX_TRACKED_KEYS 個桶），
+  多 worker 部署時實際上限約為配置值 × worker 數
+- database：所有 worker 共用 rate_limit_buckets 表，每次檢查是一個短事務（SELECT ... FOR UPDATE），
+  在線程池中執行，不阻塞事件循環
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.dependencies import get_current_user
+from app.metrics import metrics
+from app.models import RateLimitBucket, User
+
+# 路由名 -> (每秒補充令牌數, 桶容量)；速率為 0 表示不限制
+LIMITS = {
+    "messages.send": (settings.RATE_LIMIT_MESSAGES_PER_SECOND, settings.RATE_LIMIT_MESSAGES_BURST),
+    "messages.search": (settings.RATE_LIMIT_SEARCH_PER_SECOND, settings.RATE_LIMIT_SEARCH_BURST),
+    "upload": (settings.RATE_LIMIT_UPLOAD_PER_SECOND, settings.RATE_LIMIT_UPLOAD_BURST),
+}
+
+
+def refill(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> float:
+    """按經過的時間補充令牌，不超過桶容量"""
+    return min(float(burst), tokens + max(0.0, now - updated_at) * rate)
+
+
+def retry_after(tokens: float, rate: float, cost: int = 1) -> float:
+    """令牌不足時補足 cost 個令牌所需的秒數"""
+    return (cost - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """每個 worker 獨立的令牌桶：{key: [剩餘令牌, 上次更新時間]}（LRU）"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        """消耗 cost 個令牌，成功返回 0，否則返回需要等待的秒數"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = refill(bucket[0], bucket[1], now, rate, burst)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return retry_after(bucket[0], rate, cost)
+        bucket[0] -= cost
+        return 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self._buckets)
+
+    def reset(self):
+        self._buckets.clear()
+
+
+class DatabaseRateLimitBackend:
+    """
+    跨 worker 共用的令牌桶，存放在 rate_limit_buckets 表（時間使用 epoch 秒，各主機時鐘需同步）
+    每次檢查在一個事務內鎖定該行、補充並扣減令牌；首次出現的 key 插入新行，
+    併發插入衝突時重試一次（此時行已存在，走更新路徑）
+    """
+
+    def __init__(self, engine, stale_seconds: int):
+        self.engine = engine
+        self.stale_seconds = stale_seconds
+        self._table = RateLimitBucket.__table__
+        self._last_cleanup = 0.0
+
+    def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        for attempt in range(2):
+            try:
+                return self._take(key, rate, burst, cost)
+            except IntegrityError:
+                if attempt:
+                    raise
+        return 0.0
+
+    def _take(self, key: str, rate: float, burst: int, cost: int) -> float:
+        table = self._table
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                select(table.c.tokens, table.c.updated_at).where(table.c.key == key).with_for_update()
+            ).first()
+            tokens = float(burst) if row is None else refill(row.tokens, row.updated_at, now, rate, burst)
+            wait = retry_after(tokens, rate, cost) if tokens < cost else 0.0
+            if not wait:
+                tokens -= cost
+            if row is None:
+                conn.execute(insert(table).values(key=key, tokens=tokens, updated_at=now))
+            else:
+                conn.execute(update(table).where(table.c.key == key).values(tokens=tokens, updated_at=now))
+        self._cleanup(now)
+        return wait
+
+    def _cleanup(self, now: float):
+        """每分鐘最多一次：刪除長時間未使用的桶（已補滿，和不存在等價）"""
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(self._table).where(self._table.c.updated_at < now - self.stale_seconds))
+        except Exception as e:
+            print(f"[RateLimit] Error deleting stale buckets: {e}")
+
+    def reset(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self._table))
+
+
+class RateLimiter:
+    def __init__(self, backend_name: str):
+        self.backend_name = backend_name
+        self._backend = None
+
+    @property
+    def backend(self):
+        # 延遲創建：database 後端需要引擎，避免導入本模塊時建立連接
+        if self._backend is None:
+            if self.backend_name == "database":
+                from app.database import engine
+                self._backend = DatabaseRateLimitBackend(engine, settings.RATE_LIMIT_STALE_SECONDS)
+            else:
+                self._backend = MemoryRateLimitBackend(settings.RATE_LIMIT_MAX_TRACKED_KEYS)
+        return self._backend
+
+    async def check(self, route: str, user_id: str) -> Tuple[bool, float]:
+        """返回 (是否允許, 需要等待的秒數)"""
+        rate, burst = LIMITS[route]
+        if rate <= 0:
+            return True, 0.0
+        key = f"{route}:{user_id}"
+        backend = self.backend
+        try:
+            if isinstance(backend, MemoryRateLimitBackend):
+                wait = backend.take(key, rate, burst)
+            else:
+                wait = await asyncio.to_thread(backend.take, key, rate, burst)
+        except Exception as e:
+            # 存儲出錯時放行（限流是保護措施，不應讓接口整體不可用）
+            print(f"[RateLimit] Error checking {key}: {e}")
+            metrics.inc("ratelimit.errors")
+            return True, 0.0
+        if wait:
+            metrics.inc(f"ratelimit.limited.{route}")
+            return False, wait
+        return True, 0.0
+
+
+def rate_limit(route: str):
+    """
+    路由依賴：按當前用戶限流，超出時返回 429 和 Retry-After
+    用法：current_user: User = Depends(rate_limit("messages.send"))
+    """
+    if route not in LIMITS:
+        raise ValueError(f"Unknown rate limit route: {route}")
+
+    async def dependency(current_user: User = Depends(get_current_user)) -> User:
+        allowed, wait = await rate_limiter.check(route, current_user.id)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+        return current_user
+
+    return dependency
+
+
+# 全局限流器
+rate_limiter = RateLimiter(backend_name=settings.RATE_LIMIT_BACKEND)
@@ -0,0 +1,259 @@
+"""
+房間後台清理
+刪除房間時只做軟刪除（設置 rooms.deleted_at），立即對用戶不可見；
+消息由後台任務按批次刪除，每批只載入 ID 和圖片地址，單批一個短事務，
+批次之間讓出事件循環，避免一次性載入整個房間或長時間鎖住 messages 表。
+消息清空後刪除房間記錄，並刪除房間消息引用的上傳圖片。
+資料庫操作都在線程池中執行，不阻塞事件循環。
+
+多 worker 部署時每個房間只由一個 worker 清理：開始前用條件 UPDATE 認領（rooms.purge_claimed_by /
+purge_claimed_at），每批刪除在同一事務內續期，續期失敗（已被其他 worker 接管）時停止。
+所有 worker 每隔 ROOM_PURGE_CLAIM_STALE_SECONDS 掃描一次未完成的清理（resume_pending），
+認領超過該時間未續期（worker 已退出）的房間由掃描到的 worker 接管（按 ID 刪除，重複執行無副作用）。
+"""
+import asyncio
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.metrics import metrics
+from app.models import Message, Room
+from app.presence import worker_id
+
+UPLOAD_URL_PREFIX = "/api/uploads/"
+
+
+def upload_path_for(url: str) -> Optional[Path]:
+    """將消息中的圖片地址轉換為上傳目錄中的文件路徑；不是本站上傳的文件返回 None"""
+    index = url.find(UPLOAD_URL_PREFIX)
+    if index < 0:
+        return None
+    upload_dir = settings.upload_dir_absolute
+    path = (upload_dir / url[index + len(UPLOAD_URL_PREFIX):]).resolve()
+    try:
+        path.relative_to(upload_dir)
+    except ValueError:
+        return None
+    return path
+
+
+def remove_files(paths: List[Path]) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[RoomPurge] Failed to remove {path}: {e}")
+    return removed
+
+
+class ClaimLost(Exception):
+    """房間的清理已被其他 worker 接管"""
+
+
+class RoomPurger:
+    def __init__(self, batch_size: int, pause_seconds: float, claim_stale_seconds: float):
+        self.batch_size = batch_size
+        self.pause = pause_seconds
+        self.claim_stale = claim_stale_seconds
+        # 清理進度：{room_id: {"status", "total", "deleted_messages", "deleted_files", "started_at", "finished_at"}}
+        self.progress: Dict[str, dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def schedule(self, room_id: str):
+        """啟動房間清理任務（同一房間只運行一個任務）"""
+        task = self._tasks.get(room_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[room_id] = asyncio.create_task(self._run(room_id))
+
+    def get_progress(self, room_id: str) -> Optional[dict]:
+        return self.progress.get(room_id)
+
+    def _claim(self, room_id: str) -> bool:
+        """認領房間的清理：未被認領、已由本 worker 認領或認領已過期時成功"""
+        now = time.time()
+        owner = worker_id()
+        db = SessionLocal()
+        try:
+            claimed = db.query(Room).filter(
+                Room.id == room_id,
+                Room.deleted_at.isnot(None),
+                or_(
+                    Room.purge_claimed_by.is_(None),
+                    Room.purge_claimed_by == owner,
+                    Room.purge_claimed_at < now - self.claim_stale
+                )
+            ).update({Room.purge_claimed_by: owner, Room.purge_claimed_at: now}, synchronize_session=False)
+            db.commit()
+            return claimed == 1
+        finally:
+            db.close()
+
+    def _release(self, room_ids: List[str]):
+        """釋放本 worker 的認領（停止時調用，其他 worker 無需等待過期即可接管）"""
+        db = SessionLocal()
+        try:
+            db.query(Room).filter(Room.id.in_(room_ids), Room.purge_claimed_by == worker_id()).update(
+                {Room.purge_claimed_by: None, Room.purge_claimed_at: None}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _delete_batch(self, room_id: str) -> tuple:
+        """續期認領並刪除一批消息，返回 (刪除的消息數, 需要刪除的圖片路徑)"""
+        db = SessionLocal()
+        try:
+            renewed = db.query(Room).filter(Room.id == room_id, Room.purge_claimed_by == worker_id()).update(
+                {Room.purge_claimed_at: time.time()}, synchronize_session=False
+            )
+            if not renewed:
+                db.rollback()
+                raise ClaimLost(room_id)
+            rows = db.query(Message.id, Message.type, Message.content).filter(
+                Message.room_id == room_id
+            ).limit(self.batch_size).all()
+            if not rows:
+                db.commit()
+                return 0, []
+            db.query(Message).filter(Message.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db.commit()
+            paths = [upload_path_for(row.content) for row in rows if row.type == "image"]
+            return len(rows), [path for path in paths if path is not None]
+        finally:
+            db.close()
+
+    def _count_messages(self, room_id: str) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(Message.id).filter(Message.room_id == room_id).count()
+        finally:
+            db.close()
+
+    def _delete_room_row(self, room_id: str):
+        db = SessionLocal()
+        try:
+            db.query(Room).filter(
+                Room.id == room_id, Room.deleted_at.isnot(None), Room.purge_claimed_by == worker_id()
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _run(self, room_id: str):
+        try:
+            claimed = await asyncio.to_thread(self._claim, room_id)
+        except Exception as e:
+            claimed = False
+            print(f"[RoomPurge] Error claiming room {room_id}: {e}")
+        if not claimed:
+            # 其他 worker 正在清理（進度接口會從資料庫估算剩餘消息數）
+            self._tasks.pop(room_id, None)
+            return
+        progress = self.progress[room_id] = {
+            "status": "running",
+            "total": None,
+            "deleted_messages": 0,
+            "deleted_files": 0,
+            "started_at": time.time(),
+            "finished_at": None
+        }
+        try:
+            progress["total"] = await asyncio.to_thread(self._count_messages, room_id)
+            print(f"[RoomPurge] Purging room {room_id}: {progress['total']} messages")
+            while True:
+                deleted, paths = await asyncio.to_thread(self._delete_batch, room_id)
+                if paths:
+                    # 文件刪除在線程池中執行，不阻塞事件循環
+                    progress["deleted_files"] += await asyncio.to_thread(remove_files, paths)
+                progress["deleted_messages"] += deleted
+                metrics.inc("rooms.purge.deleted_messages", deleted)
+                if deleted < self.batch_size:
+                    break
+                await asyncio.sleep(self.pause)
+            await asyncio.to_thread(self._delete_room_row, room_id)
+            progress["status"] = "done"
+            metrics.inc("rooms.purge.completed")
+            print(f"[RoomPurge] Room {room_id} purged: {progress['deleted_messages']} messages, {progress['deleted_files']} files")
+        except ClaimLost:
+            # 本 worker 停頓超過認領期限，已被其他 worker 接管
+            self.progress.pop(room_id, None)
+            metrics.inc("rooms.purge.claim_lost")
+            print(f"[RoomPurge] Room {room_id} was taken over by another worker")
+        except asyncio.CancelledError:
+            progress["status"] = "cancelled"
+            raise
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            metrics.inc("rooms.purge.failed")
+            print(f"[RoomPurge] Error purging room {room_id}: {e}")
+        finally:
+            progress["finished_at"] = time.time()
+            self._tasks.pop(room_id, None)
+
+    def _unclaimed_rooms(self) -> List[str]:
+        """已軟刪除、且沒有被存活 worker 認領的房間"""
+        db = SessionLocal()
+        try:
+            return [room_id for (room_id,) in db.query(Room.id).filter(
+                Room.deleted_at.isnot(None),
+                or_(Room.purge_claimed_by.is_(None), Room.purge_claimed_at < time.time() - self.claim_stale)
+            ).all()]
+        finally:
+            db.close()
+
+    async def resume_pending(self):
+        """繼續清理已軟刪除但尚未清理完成的房間（每個房間只有認領成功的 worker 執行）"""
+        room_ids = await asyncio.to_thread(self._unclaimed_rooms)
+        for room_id in room_ids:
+            self.schedule(room_id)
+        if room_ids:
+            print(f"[RoomPurge] Resuming purge of {len(room_ids)} deleted rooms")
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.resume_pending()
+            except Exception as e:
+                print(f"[RoomPurge] Error scanning deleted rooms: {e}")
+            await asyncio.sleep(self.claim_stale)
+
+    def start(self):
+        """啟動掃描任務（在事件循環中調用）：啟動時立即繼續未完成的清理，之後定期接管過期的認領"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """停止掃描和進行中的清理任務，釋放認領（由其他 worker 或下次啟動時繼續）"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+        room_ids = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if room_ids:
+            try:
+                await asyncio.to_thread(self._release, room_ids)
+            except Exception as e:
+                print(f"[RoomPurge] Error releasing claims: {e}")
+
+
+# 全局房間清理器
+room_purger = RoomPurger(
+    batch_size=settings.ROOM_PURGE_BATCH_SIZE,
+    pause_seconds=settings.ROOM_PURGE_BATCH_PAUSE_SECONDS,
+    claim_stale_seconds=settings.ROOM_PURGE_CLAIM_STALE_SECONDS
+)
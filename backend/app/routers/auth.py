@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, release_connection
 from app.models import User
 from app.schemas import LoginRequest, RegisterRequest, TokenResponse, UserResponse
 from app.auth import verify_password, get_password_hash, create_access_token
 from app.dependencies import get_current_user
 from app.websocket import websocket_manager
+from app.presence import presence_service
+import time
 
 router = APIRouter()
 
@@ -22,10 +24,8 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
             detail="Invalid email or password"
         )
     
-    # 設置在線狀態
-    user.is_online = True
-    db.commit()
-    db.refresh(user)
+    # 設置在線狀態（由 Presence 服務合併後批量寫入和廣播）
+    presence_service.mark_online(user.id)
     
     # 創建 token
     access_token = create_access_token(data={"sub": user.id})
@@ -46,16 +46,12 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
         "name": user.name,
         "email": user.email,
         "avatar": user.avatar,
-        "is_online": user.is_online,
+        "is_online": True,
         "bio": user.bio,
         "favorites": favorites,
         "blocked": blocked
     }
     
-    # 廣播用戶更新事件（異步執行，避免阻塞）
-    import asyncio
-    asyncio.create_task(websocket_manager.broadcast_user_update(user))
-    
     return TokenResponse(
         access_token=access_token,
         user=UserResponse(**user_dict)
@@ -83,12 +79,15 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
         email=request.email,
         password_hash=get_password_hash(request.password),
         avatar=avatar_url,
-        is_online=True
+        is_online=True,
+        # 新用戶在副本同步前讀取自己的數據時走主庫
+        last_write_at=time.time()
     )
     
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    release_connection(db)
     
     # 創建 token
     access_token = create_access_token(data={"sub": new_user.id})
@@ -120,12 +119,8 @@ async def register(request: RegisterRequest, db: Session = Depends(get_db)):
 @router.post("/logout")
 async def logout(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """用戶登出"""
-    # 設置離線狀態
-    current_user.is_online = False
-    db.commit()
-    
-    # 廣播用戶離線事件
-    await websocket_manager.broadcast_user_left(current_user.id)
+    # 設置離線狀態（由 Presence 服務合併後批量寫入和廣播）
+    presence_service.mark_offline(current_user.id)
     
     return {"message": "Logged out successfully"}
 
@@ -0,0 +1,79 @@
+"""
+啟動快照端點
+客戶端載入時原本需要依次調用 /api/auth/me、/api/rooms、/api/users 和當前房間的歷史消息，
+此端點一次返回全部數據（批量查詢 + 快取），並附帶可用於續接實時事件的游標：
+- WebSocket：/ws?token=...&lastMessageId=<cursor.last_message_id>
+- Long Polling：/api/realtime/poll?lastMessageId=...&lastTimestamp=<cursor.timestamp>
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from app.models import User, Room, Message, utcnow
+from app.schemas import RoomResponse, BootstrapResponse, BootstrapCursor
+from app.dependencies import get_current_user, get_read_db
+from app.blocklist import blocked_cache
+from app.message_cache import message_cache, to_response
+from app.routers.users import build_user_responses
+from typing import Optional
+
+router = APIRouter()
+
+# 未指定 limit 時返回當前房間最新的消息數
+DEFAULT_MESSAGE_LIMIT = 50
+
+
+@router.get("", response_model=BootstrapResponse)
+async def get_bootstrap(
+    room_id: Optional[str] = Query(None, alias="roomId", description="同時返回該房間的最近消息"),
+    limit: int = Query(DEFAULT_MESSAGE_LIMIT, ge=1, le=500, description="返回的最近消息數"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """獲取客戶端啟動所需的全部數據"""
+    # 先取游標再讀數據：之後產生的消息一定能通過游標續接到（可能與快照重複，客戶端按 ID 去重）
+    cursor = BootstrapCursor(
+        last_message_id=db.query(Message.id).order_by(Message.timestamp.desc(), Message.id.desc()).limit(1).scalar(),
+        timestamp=utcnow()
+    )
+
+    blocked_ids = blocked_cache.get(db, current_user.id, current_user.blocklist_changed_at)
+
+    rooms = [RoomResponse(
+        id=room.id,
+        name=room.name,
+        is_private=room.is_private,
+        created_by=room.created_by,
+        description=room.description
+    ) for room in db.query(Room).filter(Room.deleted_at.is_(None)).all()]
+
+    # 只有當前用戶需要收藏/封鎖列表，其他用戶不再逐一查詢關係
+    others = db.query(User).filter(User.id != current_user.id)
+    if blocked_ids:
+        others = others.filter(~User.id.in_(list(blocked_ids)))
+    me = build_user_responses(db, [current_user])[0]
+    users = [me] + build_user_responses(db, others.all(), include_relationships=False)
+
+    messages = []
+    if room_id:
+        if not any(room.id == room_id for room in rooms):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Room not found"
+            )
+        messages = message_cache.get_recent(db, room_id, limit, blocked_ids)
+        if messages is None:
+            query = db.query(Message).filter(Message.room_id == room_id)
+            if blocked_ids:
+                query = query.filter(~Message.sender_id.in_(list(blocked_ids)))
+            messages = [
+                to_response(msg)
+                for msg in reversed(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit).all())
+            ]
+
+    return BootstrapResponse(
+        user=me,
+        rooms=rooms,
+        users=users,
+        room_id=room_id,
+        messages=messages,
+        cursor=cursor
+    )
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import get_db
+from sqlalchemy import func, or_, and_
+from app.database import get_db, release_connection
 from app.models import Message, Room, User, UserRelationship
 from app.schemas import MessageResponse, MessageCreateRequest, MessageSearchResponse
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_read_db
+from app.blocklist import blocked_cache
+from app.message_cache import message_cache, to_response
+from app.ratelimit import rate_limit
 from app.websocket import websocket_manager
 from datetime import datetime
+from typing import Optional
 
 router = APIRouter()
 
@@ -14,12 +18,14 @@ router = APIRouter()
 @router.get("/rooms/{room_id}", response_model=list[MessageResponse])
 async def get_messages(
     room_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="只返回最新的 N 條消息（不指定時返回全部）"),
+    before: Optional[str] = Query(None, description="分頁游標：只返回該消息 ID 之前的消息"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """獲取房間的所有消息"""
-    # 檢查房間是否存在
-    room = db.query(Room).filter(Room.id == room_id).first()
+    """獲取房間的消息（默認全部，指定 limit 時只返回最新的 N 條，指定 before 時向前翻頁）"""
+    # 檢查房間是否存在（每次都查詢：房間可能已在其他 worker 上刪除，本 worker 的快取不會被清除）
+    room = db.query(Room.id).filter(Room.id == room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -27,41 +33,50 @@ async def get_messages(
         )
     
     # 獲取當前用戶封鎖的用戶 ID
-    blocked_ids = [
-        rel.target_id for rel in db.query(UserRelationship).filter(
-            UserRelationship.user_id == current_user.id,
-            UserRelationship.relationship_type == "blocked"
-        ).all()
-    ]
+    blocked_ids = blocked_cache.get(db, current_user.id, current_user.blocklist_changed_at)
+    
+    # 優先從房間最近消息快取返回（分頁請求直接查詢資料庫）
+    if before is None:
+        cached = message_cache.get_recent(db, room_id, limit, blocked_ids)
+        if cached is not None:
+            return cached
     
     # 查詢消息，排除被封鎖用戶的消息
     query = db.query(Message).filter(Message.room_id == room_id)
     if blocked_ids:
-        query = query.filter(~Message.sender_id.in_(blocked_ids))
-    
-    messages = query.order_by(Message.timestamp.asc()).all()
-    
-    return [MessageResponse(
-        id=msg.id,
-        room_id=msg.room_id,
-        sender_id=msg.sender_id,
-        sender_name=msg.sender_name,
-        sender_avatar=msg.sender_avatar,
-        content=msg.content,
-        type=msg.type,
-        timestamp=msg.timestamp
-    ) for msg in messages]
+        query = query.filter(~Message.sender_id.in_(list(blocked_ids)))
+    
+    if before is not None:
+        # 分頁：只返回游標消息之前的消息（按 (timestamp, id) 排序，同一秒內的消息順序穩定）
+        exists = db.query(Message.id).filter(Message.id == before, Message.room_id == room_id).first()
+        if not exists:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        cursor_timestamp = db.query(Message.timestamp).filter(Message.id == before).scalar_subquery()
+        query = query.filter(or_(
+            Message.timestamp < cursor_timestamp,
+            and_(Message.timestamp == cursor_timestamp, Message.id < before)
+        ))
+    
+    if limit is not None:
+        messages = list(reversed(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit).all()))
+    else:
+        messages = query.order_by(Message.timestamp.asc(), Message.id.asc()).all()
+    
+    return [to_response(msg) for msg in messages]
 
 
 @router.post("", response_model=MessageResponse)
 async def send_message(
     request: MessageCreateRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(rate_limit("messages.send")),
     db: Session = Depends(get_db)
 ):
     """發送消息"""
     # 檢查房間是否存在
-    room = db.query(Room).filter(Room.id == request.room_id).first()
+    room = db.query(Room).filter(Room.id == request.room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -81,6 +96,9 @@ async def send_message(
     db.add(new_message)
     db.commit()
     db.refresh(new_message)
+    # 快取中有該房間時，核對前一條消息（其他 worker 可能剛寫入過），見 MessageTailCache.append
+    previous_id = message_cache.previous_id(db, new_message) if message_cache.has_room(request.room_id) else None
+    release_connection(db)
     
     # 廣播新消息事件
     message_response = MessageResponse(
@@ -93,6 +111,7 @@ async def send_message(
         type=new_message.type,
         timestamp=new_message.timestamp
     )
+    message_cache.append(message_response, previous_id)
     await websocket_manager.broadcast_new_message(message_response)
     
     return message_response
@@ -101,17 +120,12 @@ async def send_message(
 @router.get("/search", response_model=list[MessageSearchResponse])
 async def search_messages(
     query: str = Query(..., min_length=3, description="Search query (minimum 3 characters)"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(rate_limit("messages.search")),
+    db: Session = Depends(get_read_db)
 ):
     """搜索消息歷史"""
     # 獲取當前用戶封鎖的用戶 ID
-    blocked_ids = [
-        rel.target_id for rel in db.query(UserRelationship).filter(
-            UserRelationship.user_id == current_user.id,
-            UserRelationship.relationship_type == "blocked"
-        ).all()
-    ]
+    blocked_ids = blocked_cache.get(db, current_user.id, current_user.blocklist_changed_at)
     
     # 搜索文字消息（MySQL 使用 LIKE，不區分大小寫）
     search_query = db.query(Message).filter(
@@ -120,17 +134,21 @@ async def search_messages(
     )
     
     if blocked_ids:
-        search_query = search_query.filter(~Message.sender_id.in_(blocked_ids))
+        search_query = search_query.filter(~Message.sender_id.in_(list(blocked_ids)))
     
-    messages = search_query.order_by(Message.timestamp.desc()).limit(50).all()
+    messages = search_query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(50).all()
     
     # 獲取所有相關房間信息
     room_ids = list(set([msg.room_id for msg in messages]))
-    rooms = {room.id: room.name for room in db.query(Room).filter(Room.id.in_(room_ids)).all()}
+    rooms = {room.id: room.name for room in db.query(Room).filter(
+        Room.id.in_(room_ids), Room.deleted_at.is_(None)
+    ).all()}
     
-    # 構建響應
+    # 構建響應（跳過已刪除、正在清理的房間中的消息）
     result = []
     for msg in messages:
+        if msg.room_id not in rooms:
+            continue
         result.append(MessageSearchResponse(
             id=msg.id,
             room_id=msg.room_id,
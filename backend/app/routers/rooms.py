@@ -1,23 +1,50 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Room, User
+from app.models import Room, User, RoomMember, Message, utcnow
 from app.schemas import RoomResponse, RoomCreateRequest, RoomJoinRequest, RoomUpdateRequest
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_read_db
 from app.auth import verify_password, get_password_hash
 from app.websocket import websocket_manager
+from app.message_cache import message_cache
+from app.room_purge import room_purger
 import asyncio
 
 router = APIRouter()
 
 
+def _insert_member(db: Session, user_id: str, room_id: str):
+    """
+    插入成員關係；已存在時不做任何事
+    檢查和插入之間可能有併發加入（多個分頁、客戶端重試），後插入的一方觸發唯一約束，回滾後視為已加入
+    """
+    exists = db.query(RoomMember.id).filter(
+        RoomMember.room_id == room_id,
+        RoomMember.user_id == user_id
+    ).first()
+    if exists:
+        return
+    db.add(RoomMember(room_id=room_id, user_id=user_id))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+
+async def _add_member(db: Session, user_id: str, room_id: str):
+    """持久化房間成員關係並更新記憶體中的訂閱"""
+    _insert_member(db, user_id, room_id)
+    await websocket_manager.join_room(user_id, room_id)
+
+
 @router.get("", response_model=list[RoomResponse])
 async def get_rooms(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """獲取所有房間列表"""
-    rooms = db.query(Room).all()
+    rooms = db.query(Room).filter(Room.deleted_at.is_(None)).all()
     return [RoomResponse(
         id=room.id,
         name=room.name,
@@ -55,7 +82,7 @@ async def create_room(
     db.refresh(new_room)
     
     # 創建者自動加入房間
-    await websocket_manager.join_room(current_user.id, new_room.id)
+    await _add_member(db, current_user.id, new_room.id)
     
     # 廣播房間創建事件（異步執行，避免阻塞）
     room_response = RoomResponse(
@@ -78,7 +105,7 @@ async def join_room(
     db: Session = Depends(get_db)
 ):
     """加入房間（驗證密碼）"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room).filter(Room.id == room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -88,7 +115,7 @@ async def join_room(
     # 如果是公開房間，直接允許加入
     if not room.is_private:
         # 記錄用戶加入房間
-        await websocket_manager.join_room(current_user.id, room_id)
+        await _add_member(db, current_user.id, room_id)
         return {"message": "Joined room successfully", "room": RoomResponse(
             id=room.id,
             name=room.name,
@@ -100,7 +127,7 @@ async def join_room(
     # 如果是創建者，直接允許加入
     if room.created_by == current_user.id:
         # 記錄用戶加入房間
-        await websocket_manager.join_room(current_user.id, room_id)
+        await _add_member(db, current_user.id, room_id)
         return {"message": "Joined room successfully", "room": RoomResponse(
             id=room.id,
             name=room.name,
@@ -123,7 +150,7 @@ async def join_room(
         )
     
     # 記錄用戶加入房間
-    await websocket_manager.join_room(current_user.id, room_id)
+    await _add_member(db, current_user.id, room_id)
     
     return {"message": "Joined room successfully", "room": RoomResponse(
         id=room.id,
@@ -141,7 +168,7 @@ async def leave_room(
     db: Session = Depends(get_db)
 ):
     """離開房間"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room).filter(Room.id == room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -149,6 +176,11 @@ async def leave_room(
         )
     
     # 記錄用戶離開房間
+    db.query(RoomMember).filter(
+        RoomMember.room_id == room_id,
+        RoomMember.user_id == current_user.id
+    ).delete(synchronize_session=False)
+    db.commit()
     await websocket_manager.leave_room(current_user.id, room_id)
     
     return {"message": "Left room successfully"}
@@ -161,7 +193,7 @@ async def delete_room(
     db: Session = Depends(get_db)
 ):
     """刪除房間（僅創建者可刪除）"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room).filter(Room.id == room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -174,24 +206,59 @@ async def delete_room(
             detail="Only room creator can delete the room"
         )
     
-    db.delete(room)
+    # 軟刪除：房間立即不可見，消息和上傳的圖片由後台任務分批清理
+    db.query(RoomMember).filter(RoomMember.room_id == room_id).delete(synchronize_session=False)
+    room.deleted_at = utcnow()
     db.commit()
+    room_purger.schedule(room_id)
     
     # 清理所有用戶的房間關係（房間已刪除）
-    # 注意：這裡需要清理所有用戶的該房間關係
-    users_to_clean = [
-        user_id for user_id, rooms in websocket_manager.user_rooms.items()
-        if room_id in rooms
-    ]
-    for user_id in users_to_clean:
-        await websocket_manager.leave_room(user_id, room_id)
+    member_ids = websocket_manager.drop_room(room_id)
+    message_cache.drop_room(room_id)
     
     # 廣播房間刪除事件（異步執行，避免阻塞）
-    asyncio.create_task(websocket_manager.broadcast_room_deleted(room_id))
+    asyncio.create_task(websocket_manager.broadcast_room_deleted(room_id, member_ids))
     
     return {"message": "Room deleted successfully"}
 
 
+@router.get("/{room_id}/deletion")
+async def get_room_deletion_progress(
+    room_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查詢房間後台清理進度（僅創建者可查詢）"""
+    room = db.query(Room).filter(Room.id == room_id).first()
+    progress = room_purger.get_progress(room_id)
+    if room is not None and room.created_by != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only room creator can view deletion progress"
+        )
+    if room is None:
+        # 房間記錄已刪除：清理已完成
+        if progress is not None:
+            return progress
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    if room.deleted_at is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Room is not being deleted"
+        )
+    if progress is None:
+        # 清理任務在其他 worker 上運行
+        return {
+            "status": "running",
+            "total": None,
+            "remaining_messages": db.query(Message.id).filter(Message.room_id == room_id).count()
+        }
+    return progress
+
+
 @router.put("/{room_id}", response_model=RoomResponse)
 async def update_room(
     room_id: str,
@@ -200,7 +267,7 @@ async def update_room(
     db: Session = Depends(get_db)
 ):
     """更新房間信息（僅創建者可更新）"""
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room).filter(Room.id == room_id, Room.deleted_at.is_(None)).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
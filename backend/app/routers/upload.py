@@ -7,13 +7,13 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.dependencies import get_current_user
+from app.ratelimit import rate_limit
 from app.models import User
 from app.config import settings
 import os
 import uuid
 from pathlib import Path
 from datetime import datetime
-from PIL import Image
 import io
 
 router = APIRouter()
@@ -36,23 +36,23 @@ async def check_file(file_path: str):
             "upload_dir": str(UPLOAD_DIR)
         }
 
-# 確保上傳目錄存在（使用絕對路徑，基於後端目錄）
+# 上傳目錄（使用絕對路徑，基於後端目錄）；目錄在第一次保存文件時才創建，導入時不觸碰文件系統
 UPLOAD_DIR = settings.upload_dir_absolute
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-# 創建子目錄
 AVATARS_DIR = UPLOAD_DIR / "avatars"
 MESSAGES_DIR = UPLOAD_DIR / "messages"
-AVATARS_DIR.mkdir(exist_ok=True)
-MESSAGES_DIR.mkdir(exist_ok=True)
 
-print(f"[Upload] Upload directory: {UPLOAD_DIR}")
-print(f"[Upload] Avatars directory: {AVATARS_DIR}")
-print(f"[Upload] Messages directory: {MESSAGES_DIR}")
+
+def ensure_directory(directory: Path):
+    if not directory.is_dir():
+        directory.mkdir(parents=True, exist_ok=True)
+        print(f"[Upload] Created directory: {directory}")
 
 
 def convert_to_webp(image_data: bytes, max_size: int = 1920) -> bytes:
     """將圖片轉換為 WebP 格式"""
+    # Pillow 只在第一次處理圖片時導入，不拖慢 worker 啟動
+    from PIL import Image
+
     try:
         # 打開圖片
         img = Image.open(io.BytesIO(image_data))
@@ -108,6 +108,7 @@ def save_uploaded_file(file: UploadFile, directory: Path, max_size: int = 1920)
     # 生成唯一文件名（始終使用 .webp 擴展名）
     unique_filename = f"{uuid.uuid4()}.webp"
     file_path = directory / unique_filename
+    ensure_directory(directory)
     
     # 保存 WebP 文件
     with open(file_path, "wb") as f:
@@ -126,7 +127,7 @@ def save_uploaded_file(file: UploadFile, directory: Path, max_size: int = 1920)
 @router.post("/avatar")
 async def upload_avatar(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(rate_limit("upload")),
     db: Session = Depends(get_db)
 ):
     """上傳用戶頭像"""
@@ -174,7 +175,7 @@ async def upload_avatar(
 @router.post("/message-image")
 async def upload_message_image(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(rate_limit("upload")),
     db: Session = Depends(get_db)
 ):
     """上傳消息圖片"""
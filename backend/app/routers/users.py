@@ -1,57 +1,55 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, release_connection
 from app.models import User, UserRelationship
 from app.schemas import UserResponse, UserUpdateRequest
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_read_db
+from app.blocklist import blocked_cache, mark_changed
 from app.auth import get_password_hash
 from app.websocket import websocket_manager
 
 router = APIRouter()
 
 
+def build_user_responses(db: Session, users, include_relationships: bool = True) -> list[UserResponse]:
+    """構建用戶響應列表；所有用戶的收藏和封鎖列表用一次查詢批量載入"""
+    relationships = {user.id: ([], []) for user in users}
+    if include_relationships and relationships:
+        rows = db.query(
+            UserRelationship.user_id, UserRelationship.target_id, UserRelationship.relationship_type
+        ).filter(UserRelationship.user_id.in_(list(relationships))).all()
+        for user_id, target_id, relationship_type in rows:
+            favorites, blocked = relationships[user_id]
+            if relationship_type == "favorite":
+                favorites.append(target_id)
+            elif relationship_type == "blocked":
+                blocked.append(target_id)
+    
+    return [UserResponse(
+        id=user.id,
+        name=user.name,
+        email=user.email,
+        avatar=user.avatar,
+        is_online=user.is_online,
+        bio=user.bio,
+        favorites=relationships[user.id][0],
+        blocked=relationships[user.id][1]
+    ) for user in users]
+
+
 @router.get("", response_model=list[UserResponse])
 async def get_users(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """獲取所有用戶列表（排除被封鎖的用戶）"""
     # 獲取當前用戶封鎖的用戶 ID
-    blocked_ids = [
-        rel.target_id for rel in db.query(UserRelationship).filter(
-            UserRelationship.user_id == current_user.id,
-            UserRelationship.relationship_type == "blocked"
-        ).all()
-    ]
+    blocked_ids = blocked_cache.get(db, current_user.id, current_user.blocklist_changed_at)
     
     # 查詢所有用戶，排除被封鎖的
-    users = db.query(User).filter(~User.id.in_(blocked_ids) if blocked_ids else True).all()
-    
-    # 構建響應
-    result = []
-    for user in users:
-        # 獲取該用戶的收藏和封鎖列表
-        favorites = []
-        blocked = []
-        relationships = db.query(UserRelationship).filter(UserRelationship.user_id == user.id).all()
-        for rel in relationships:
-            if rel.relationship_type == "favorite":
-                favorites.append(rel.target_id)
-            elif rel.relationship_type == "blocked":
-                blocked.append(rel.target_id)
-        
-        result.append(UserResponse(
-            id=user.id,
-            name=user.name,
-            email=user.email,
-            avatar=user.avatar,
-            is_online=user.is_online,
-            bio=user.bio,
-            favorites=favorites,
-            blocked=blocked
-        ))
+    users = db.query(User).filter(~User.id.in_(list(blocked_ids)) if blocked_ids else True).all()
     
-    return result
+    return build_user_responses(db, users)
 
 
 @router.put("/{user_id}/profile", response_model=UserResponse)
@@ -93,6 +91,7 @@ async def update_profile(
         
         db.commit()
         db.refresh(current_user)
+        release_connection(db)
         
         # 廣播用戶更新事件（異步執行，失敗不影響主流程）
         try:
@@ -193,7 +192,11 @@ async def toggle_favorite(
             relationship_type="favorite"
         )
         db.add(new_rel)
+        if blocked_rel:
+            mark_changed(db, user_id)
         db.commit()
+        if blocked_rel:
+            blocked_cache.invalidate(user_id)
         await websocket_manager.broadcast_user_update(current_user)
         return {"message": "Added to favorites", "is_favorite": True}
 
@@ -253,7 +256,9 @@ async def block_user(
         relationship_type="blocked"
     )
     db.add(new_rel)
+    mark_changed(db, user_id)
     db.commit()
+    blocked_cache.invalidate(user_id)
     
     await websocket_manager.broadcast_user_update(current_user)
     return {"message": "User blocked successfully", "is_blocked": True}
@@ -287,7 +292,9 @@ async def unblock_user(
         )
     
     db.delete(blocked_rel)
+    mark_changed(db, user_id)
     db.commit()
+    blocked_cache.invalidate(user_id)
     
     await websocket_manager.broadcast_user_update(current_user)
     return {"message": "User unblocked successfully", "is_blocked": False}
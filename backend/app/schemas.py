@@ -108,6 +108,22 @@ class MessageSearchResponse(BaseModel):
         from_attributes = True
 
 
+# ============ 啟動快照 ============
+class BootstrapCursor(BaseModel):
+    # 客戶端可用於 /ws?lastMessageId= 或 /api/realtime/poll 續接
+    last_message_id: Optional[str] = None
+    timestamp: datetime
+
+
+class BootstrapResponse(BaseModel):
+    user: UserResponse
+    rooms: List[RoomResponse]
+    users: List[UserResponse]
+    room_id: Optional[str] = None
+    messages: List[MessageResponse] = []
+    cursor: BootstrapCursor
+
+
 # ============ WebSocket 事件 ============
 class WebSocketEvent(BaseModel):
     type: str
@@ -0,0 +1,82 @@
+"""
+關閉前排空 WebSocket 連接（graceful drain）
+重啟時如果所有連接同時斷開，客戶端會在一秒內一起重連，集中觸發 token 驗證、在線狀態寫入和廣播。
+關閉流程（ChatUvicornWorker 在 uvicorn 關閉連接之前調用 drain）：
+1. 進入排空狀態：新的 /ws 連接不再查詢資料庫，直接收到重連提示後關閉
+2. 在線狀態保持不變：之後斷開的連接不進入離線寬限期，不廣播 USER_LEFT、不寫入資料庫；
+   超過最長重連延遲加寬限期仍未重連的用戶，由存活的 worker 標記離線（presence_holds）
+3. 向每個連接發送 {"type": "RECONNECT", "payload": {"delayMs": ...}}（隨機延遲），再以 1012（Service Restart）關閉
+客戶端按 delayMs 延遲重連，重連分散在 SHUTDOWN_RECONNECT_MIN_MS ~ SHUTDOWN_RECONNECT_MAX_MS 之間；
+重連時資料庫中仍是在線狀態，新進程不再重複廣播和寫入（見 PresenceService.mark_online）。
+"""
+import asyncio
+import random
+
+from fastapi import WebSocket
+
+from app.codec import encode_event
+from app.config import settings
+from app.metrics import metrics
+from app.presence import presence_service
+
+# 1012 Service Restart：服務重啟，客戶端應稍後重連
+CLOSE_SERVICE_RESTART = 1012
+# 每批並發關閉的連接數
+DRAIN_BATCH_SIZE = 500
+
+
+class ShutdownDrain:
+    def __init__(self, reconnect_min_ms: int, reconnect_max_ms: int, timeout_seconds: float):
+        self.reconnect_min_ms = reconnect_min_ms
+        self.reconnect_max_ms = max(reconnect_min_ms, reconnect_max_ms)
+        self.timeout = timeout_seconds
+        self.draining = False
+
+    def reconnect_hint(self) -> dict:
+        """每個連接獨立的隨機重連延遲"""
+        return {
+            "type": "RECONNECT",
+            "payload": {"delayMs": random.randint(self.reconnect_min_ms, self.reconnect_max_ms)}
+        }
+
+    async def send_hint_and_close(self, websocket: WebSocket, encoding: str):
+        """發送重連提示並以 1012 關閉，忽略已斷開的連接"""
+        frame = encode_event(self.reconnect_hint(), encoding)
+        try:
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+            await websocket.close(code=CLOSE_SERVICE_RESTART, reason="Server restarting")
+        except Exception:
+            pass
+
+    async def drain(self, manager):
+        """排空本進程的所有 WebSocket 連接（只執行一次）"""
+        if self.draining:
+            return
+        self.draining = True
+        presence_service.hold_online(self.reconnect_max_ms / 1000)
+        records = [record for connections in manager.active_connections.values() for record in connections]
+        print(f"[Shutdown] Draining {len(records)} WebSocket connections")
+        metrics.inc("websocket.drain.connections", len(records))
+
+        async def close_all():
+            for offset in range(0, len(records), DRAIN_BATCH_SIZE):
+                batch = records[offset:offset + DRAIN_BATCH_SIZE]
+                await asyncio.gather(*(
+                    self.send_hint_and_close(record.websocket, record.encoding) for record in batch
+                ))
+
+        try:
+            await asyncio.wait_for(close_all(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            print(f"[Shutdown] Drain timed out after {self.timeout}s, remaining connections will be closed by the server")
+
+
+# 全局排空控制
+shutdown_drain = ShutdownDrain(
+    reconnect_min_ms=settings.SHUTDOWN_RECONNECT_MIN_MS,
+    reconnect_max_ms=settings.SHUTDOWN_RECONNECT_MAX_MS,
+    timeout_seconds=settings.SHUTDOWN_DRAIN_TIMEOUT_SECONDS
+)
@@ -1,51 +1,223 @@
 from fastapi import WebSocket, WebSocketDisconnect, Depends
-from typing import Dict, List
-from app.models import User
+from typing import Dict, List, Optional
+from sqlalchemy import or_, and_
+from app.models import User, Message, RoomMember, UserRelationship
 from app.auth import decode_access_token
 from app.database import SessionLocal
+from app.presence import presence_service
+from app.heartbeat import heartbeat_scheduler
+from app.metrics import metrics
+from app.codec import ENCODING_JSON, negotiate_encoding, encode_event
+from app.blocklist import blocked_cache
+from app.connections import ConnectionRecord, append_record, remove_record
+from app.batching import event_batcher
+from app.outbound import PRIORITY_PRESENCE, OutboundQueueFull, deliver, event_priority
+from app.shutdown import shutdown_drain
+from app.admission import admission_control
+import asyncio
 import json
 
+# 訂閱主題：房間列表變化、用戶目錄變化（新用戶註冊）
+TOPIC_ROOMS = "rooms"
+TOPIC_USERS = "users"
+DEFAULT_TOPICS = (TOPIC_ROOMS, TOPIC_USERS)
+# 重連續接時最多補發的消息數，更早的消息由客戶端通過歷史接口載入
+RESUME_MESSAGE_LIMIT = 200
+# 低優先級（在線狀態）扇出每發送給多少個連接讓出一次事件循環，讓同時進行的消息扇出先執行
+LOW_PRIORITY_YIELD_EVERY = 200
+
 
 class ConnectionManager:
     def __init__(self):
-        # 存儲所有活躍連接：{user_id: [websocket1, websocket2, ...]}
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # 存儲所有活躍連接：{user_id: [record1, record2, ...]}，記錄知道自己的下標，添加/移除 O(1)
+        self.active_connections: Dict[str, List[ConnectionRecord]] = {}
         # 追蹤用戶所在的房間：{user_id: {room_id1, room_id2, ...}}
         self.user_rooms: Dict[str, set] = {}
+        # 反向索引：{room_id: {user_id1, user_id2, ...}}，房間廣播時無需掃描所有用戶
+        self.room_users: Dict[str, set] = {}
+        # 主題訂閱者：{topic: {user_id1, user_id2, ...}}
+        self.topic_subscribers: Dict[str, set] = {}
+        # 當前連接總數
+        self.connection_count = 0
     
-    async def connect(self, websocket: WebSocket, user_id: str):
-        """建立 WebSocket 連接"""
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        encoding: str = ENCODING_JSON,
+        batch: bool = False
+    ) -> ConnectionRecord:
+        """建立 WebSocket 連接，返回連接記錄（batch=True 且服務端開啟合併時按 tick 合併發送）"""
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        total_connections = sum(len(conns) for conns in self.active_connections.values())
-        print(f"[WebSocket] User {user_id} connected. Total users: {len(self.active_connections)}, Total connections: {total_connections}")
+        record = ConnectionRecord(websocket, user_id, encoding, batch and event_batcher.enabled)
+        connections = self.active_connections.get(user_id)
+        if connections is None:
+            connections = self.active_connections[user_id] = []
+            # 默認訂閱房間列表和用戶目錄，客戶端可發送 unsubscribe 取消
+            for topic in DEFAULT_TOPICS:
+                self.subscribe(user_id, topic)
+        append_record(connections, record)
+        heartbeat_scheduler.register(record)
+        self.connection_count += 1
+        metrics.set_gauge("websocket.connections", self.connection_count)
+        print(f"[WebSocket] User {user_id} connected. Total users: {len(self.active_connections)}, Total connections: {self.connection_count}")
+        return record
     
-    def disconnect(self, websocket: WebSocket, user_id: str):
+    def disconnect(self, record: ConnectionRecord):
         """斷開 WebSocket 連接"""
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
+        user_id = record.user_id
+        heartbeat_scheduler.unregister(record)
+        event_batcher.discard(record)
+        connections = self.active_connections.get(user_id)
+        if connections is not None:
+            if remove_record(connections, record):
+                self.connection_count -= 1
+                metrics.set_gauge("websocket.connections", self.connection_count)
+            if not connections:
                 del self.active_connections[user_id]
-                # 清理用戶的房間關係（用戶完全離線）
-                if user_id in self.user_rooms:
-                    del self.user_rooms[user_id]
+                # 清理用戶的房間關係（用戶完全離線，重新連接時會從資料庫恢復）
+                self._forget_user_rooms(user_id)
+                for topic in list(self.topic_subscribers):
+                    self.unsubscribe(user_id, topic)
+    
+    def subscribe(self, user_id: str, topic: str):
+        """訂閱主題"""
+        self.topic_subscribers.setdefault(topic, set()).add(user_id)
+    
+    def unsubscribe(self, user_id: str, topic: str):
+        """取消訂閱主題"""
+        subscribers = self.topic_subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(user_id)
+            if not subscribers:
+                del self.topic_subscribers[topic]
+    
+    def _forget_user_rooms(self, user_id: str):
+        """移除用戶在記憶體中的所有房間訂閱（包括反向索引）"""
+        for room_id in self.user_rooms.pop(user_id, set()):
+            members = self.room_users.get(room_id)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.room_users[room_id]
+    
+    async def send_event(self, record: ConnectionRecord, message: dict, frames: dict = None):
+        """
+        按連接選擇的編碼發送事件
+        frames 用於在一次扇出中緩存已序列化的幀，同一事件每種編碼只序列化一次
+        合併發送的連接只入隊，由 event_batcher 在窗口結束時發送
+        連接正在發送時事件按優先級入隊，由後台任務接著發送（app.outbound）
+        """
+        encoding = record.encoding
+        if frames is None:
+            frames = {}
+        frame = frames.get(encoding)
+        if frame is None:
+            frame = frames[encoding] = encode_event(message, encoding)
+        try:
+            if record.batched:
+                event_batcher.enqueue(record, message, frame)
+            else:
+                await deliver(record, message, frame, self._on_send_error)
+        except OutboundQueueFull:
+            # 連接長時間跟不上，關閉後由客戶端重連並通過 lastMessageId 補發
+            print(f"[WebSocket] Outbound queue full for user {record.user_id}, closing connection")
+            asyncio.create_task(close_quietly(record.websocket, 1013, "Outbound queue full"))
+            raise
+    
+    def _on_send_error(self, record: ConnectionRecord, error: Exception):
+        """後台發送積壓事件失敗時移除連接"""
+        print(f"[WebSocket] Error sending queued events to user {record.user_id}: {error}")
+        self.disconnect(record)
     
     async def send_personal_message(self, message: dict, user_id: str):
         """發送消息給特定用戶"""
         if user_id in self.active_connections:
             disconnected = []
-            for connection in self.active_connections[user_id]:
+            frames = {}
+            for record in list(self.active_connections[user_id]):
                 try:
-                    await connection.send_json(message)
+                    await self.send_event(record, message, frames)
                 except:
-                    disconnected.append(connection)
+                    disconnected.append(record)
             
             # 清理斷開的連接
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
+            for record in disconnected:
+                self.disconnect(record)
+    
+    async def send_to_users(self, message: dict, user_ids) -> int:
+        """發送消息給指定用戶的所有連接，返回成功發送的連接數"""
+        total_sent = 0
+        frames = {}
+        low_priority = event_priority(message) == PRIORITY_PRESENCE
+        for user_id in list(user_ids):
+            connections = self.active_connections.get(user_id)
+            if not connections:
+                continue
+            disconnected = []
+            for record in list(connections):
+                try:
+                    await self.send_event(record, message, frames)
+                    total_sent += 1
+                    if low_priority and total_sent % LOW_PRIORITY_YIELD_EVERY == 0:
+                        await asyncio.sleep(0)
+                except Exception as e:
+                    print(f"[WebSocket] Error sending to user {user_id}: {e}")
+                    disconnected.append(record)
+            
+            # 清理斷開的連接
+            for record in disconnected:
+                self.disconnect(record)
+        return total_sent
+    
+    async def send_to_topic(self, message: dict, topic: str, extra_user_ids=()):
+        """發送消息給主題訂閱者（以及額外指定的用戶）"""
+        target_users = set(self.topic_subscribers.get(topic, ()))
+        target_users.update(extra_user_ids)
+        total_sent = await self.send_to_users(message, target_users)
+        print(f"[WebSocket] Sending {message.get('type')} to topic {topic}: {len(target_users)} users, {total_sent} connections")
+    
+    def interested_users(self, user_ids) -> Dict[str, set]:
+        """
+        批量計算關注這些用戶的本進程在線用戶：
+        用戶自己、與其同房間的成員、收藏了該用戶的人
+        """
+        user_ids = list(set(user_ids))
+        result = {user_id: set() for user_id in user_ids}
+        if not user_ids or not self.active_connections:
+            return result
+        
+        user_room_ids = {user_id: self.user_rooms.get(user_id, set()) for user_id in user_ids}
+        favoriters: Dict[str, set] = {}
+        db = SessionLocal()
+        try:
+            # 本進程沒有連接的用戶，從資料庫載入其房間
+            unknown = [user_id for user_id in user_ids if user_id not in self.active_connections]
+            if unknown:
+                rows = db.query(RoomMember.user_id, RoomMember.room_id).filter(
+                    RoomMember.user_id.in_(unknown)
+                ).all()
+                for user_id, room_id in rows:
+                    user_room_ids[user_id] = user_room_ids[user_id] | {room_id}
+            
+            rows = db.query(UserRelationship.target_id, UserRelationship.user_id).filter(
+                UserRelationship.target_id.in_(user_ids),
+                UserRelationship.relationship_type == "favorite"
+            ).all()
+            for target_id, user_id in rows:
+                favoriters.setdefault(target_id, set()).add(user_id)
+        finally:
+            db.close()
+        
+        for user_id in user_ids:
+            interested = result[user_id]
+            interested.add(user_id)
+            for room_id in user_room_ids[user_id]:
+                interested.update(self.room_users.get(room_id, ()))
+            interested.update(favoriters.get(user_id, ()))
+            # 只保留本進程有連接的用戶
+            interested.intersection_update(self.active_connections.keys())
+        return result
     
     async def broadcast(self, message: dict):
         """廣播消息給所有連接的用戶"""
@@ -57,18 +229,24 @@ class ConnectionManager:
         print(f"[WebSocket] Broadcasting {message.get('type')} to {len(self.active_connections)} users ({total_connections} connections)")
         
         disconnected_users = []
-        for user_id, connections in self.active_connections.items():
+        frames = {}
+        low_priority = event_priority(message) == PRIORITY_PRESENCE
+        sent = 0
+        for user_id, connections in list(self.active_connections.items()):
             disconnected = []
-            for connection in connections:
+            for record in list(connections):
                 try:
-                    await connection.send_json(message)
+                    await self.send_event(record, message, frames)
+                    sent += 1
+                    if low_priority and sent % LOW_PRIORITY_YIELD_EVERY == 0:
+                        await asyncio.sleep(0)
                 except Exception as e:
                     print(f"[WebSocket] Error sending to user {user_id}: {e}")
-                    disconnected.append(connection)
+                    disconnected.append(record)
             
             # 清理斷開的連接
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
+            for record in disconnected:
+                self.disconnect(record)
                 if not self.active_connections.get(user_id):
                     disconnected_users.append(user_id)
         
@@ -82,6 +260,7 @@ class ConnectionManager:
         if user_id not in self.user_rooms:
             self.user_rooms[user_id] = set()
         self.user_rooms[user_id].add(room_id)
+        self.room_users.setdefault(room_id, set()).add(user_id)
         print(f"[WebSocket] User {user_id} joined room {room_id}")
     
     async def leave_room(self, user_id: str, room_id: str):
@@ -90,41 +269,75 @@ class ConnectionManager:
             self.user_rooms[user_id].discard(room_id)
             if not self.user_rooms[user_id]:
                 del self.user_rooms[user_id]
+            members = self.room_users.get(room_id)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.room_users[room_id]
             print(f"[WebSocket] User {user_id} left room {room_id}")
     
-    async def broadcast_to_room(self, message: dict, room_id: str):
-        """廣播消息給特定房間的所有用戶"""
+    def restore_user_rooms(self, user_id: str, room_ids):
+        """連接建立時，用資料庫中的成員關係恢復用戶的房間訂閱"""
+        self._forget_user_rooms(user_id)
+        room_ids = set(room_ids)
+        if not room_ids:
+            return
+        self.user_rooms[user_id] = room_ids
+        for room_id in room_ids:
+            self.room_users.setdefault(room_id, set()).add(user_id)
+        print(f"[WebSocket] Restored {len(room_ids)} room subscriptions for user {user_id}")
+    
+    def drop_room(self, room_id: str) -> set:
+        """房間刪除時，移除所有用戶對該房間的訂閱，返回原成員"""
+        members = self.room_users.pop(room_id, set())
+        for user_id in members:
+            rooms = self.user_rooms.get(user_id)
+            if rooms is not None:
+                rooms.discard(room_id)
+                if not rooms:
+                    del self.user_rooms[user_id]
+        return members
+    
+    async def broadcast_to_room(self, message: dict, room_id: str, sender_id: str = None):
+        """廣播消息給特定房間的所有用戶（指定 sender_id 時跳過封鎖了發送者的用戶）"""
         if not self.active_connections:
             print(f"[WebSocket] No active connections to broadcast to room {room_id}")
             return
         
-        # 找到在該房間的所有用戶
-        target_users = [
-            user_id for user_id, rooms in self.user_rooms.items()
-            if room_id in rooms
-        ]
+        # 通過反向索引找到在該房間的所有用戶（複製一份，發送過程中可能有用戶斷開）
+        target_users = list(self.room_users.get(room_id, ()))
         
         if not target_users:
             print(f"[WebSocket] No users in room {room_id} to broadcast")
             return
         
+        blocked_by = {}
+        if sender_id is not None:
+            # 一次查詢補齊未快取的封鎖列表，之後每個接收者 O(1) 判斷
+            blocked_by = blocked_cache.ensure_loaded(target_users)
+        
         total_sent = 0
         disconnected_users = []
+        frames = {}
         
         for user_id in target_users:
-            connections = self.active_connections.get(user_id, [])
+            if sender_id in blocked_by.get(user_id, ()):
+                continue
+            connections = self.active_connections.get(user_id)
+            if not connections:
+                continue
             disconnected = []
-            for connection in connections:
+            for record in list(connections):
                 try:
-                    await connection.send_json(message)
+                    await self.send_event(record, message, frames)
                     total_sent += 1
                 except Exception as e:
                     print(f"[WebSocket] Error sending to user {user_id} in room {room_id}: {e}")
-                    disconnected.append(connection)
+                    disconnected.append(record)
             
             # 清理斷開的連接
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
+            for record in disconnected:
+                self.disconnect(record)
                 if not self.active_connections.get(user_id):
                     disconnected_users.append(user_id)
         
@@ -135,14 +348,21 @@ class ConnectionManager:
             if user_id in self.active_connections and not self.active_connections[user_id]:
                 del self.active_connections[user_id]
                 # 同時清理房間關係
-                if user_id in self.user_rooms:
-                    del self.user_rooms[user_id]
+                self._forget_user_rooms(user_id)
 
 
 # 全局 WebSocket 管理器
 websocket_manager = ConnectionManager()
 
 
+async def close_quietly(websocket: WebSocket, code: int, reason: str):
+    """關閉連接，忽略已關閉或關閉超時的錯誤"""
+    try:
+        await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=5)
+    except Exception:
+        pass
+
+
 async def get_user_from_token(token: str) -> User | None:
     """從 token 獲取用戶"""
     payload = decode_access_token(token)
@@ -161,10 +381,16 @@ async def get_user_from_token(token: str) -> User | None:
         db.close()
 
 
-# 添加廣播方法到 ConnectionManager
-async def broadcast_new_message(self, message):
-    """廣播新消息事件（只發送給該房間的用戶）"""
-    event = {
+def load_user_room_ids(db, user_id: str) -> List[str]:
+    """一次索引查詢載入用戶加入的所有房間 ID（使用 ix_room_members_user_room）"""
+    return [
+        room_id for (room_id,) in db.query(RoomMember.room_id).filter(RoomMember.user_id == user_id).all()
+    ]
+
+
+def message_event(message) -> dict:
+    """將消息轉換為 NEW_MESSAGE 事件"""
+    return {
         "type": "NEW_MESSAGE",
         "payload": {
             "id": message.id,
@@ -177,12 +403,43 @@ async def broadcast_new_message(self, message):
             "timestamp": message.timestamp.isoformat() if hasattr(message.timestamp, 'isoformat') else str(message.timestamp)
         }
     }
-    # 使用按房間廣播，只發送給該房間的用戶
-    await self.broadcast_to_room(event, message.room_id)
+
+
+def load_messages_after(
+    db,
+    last_message_id: str,
+    blocked_ids=(),
+    room_ids: Optional[List[str]] = None,
+    limit: int = 50
+) -> List[Message]:
+    """獲取指定消息之後的新消息（可限定房間），排除被封鎖用戶的消息"""
+    if not db.query(Message.id).filter(Message.id == last_message_id).first():
+        return []
+    # 按 (timestamp, id) 比較：同一秒內的消息也不會遺漏或重複
+    last_timestamp = db.query(Message.timestamp).filter(Message.id == last_message_id).scalar_subquery()
+    query = db.query(Message).filter(or_(
+        Message.timestamp > last_timestamp,
+        and_(Message.timestamp == last_timestamp, Message.id > last_message_id)
+    ))
+    if room_ids is not None:
+        if not room_ids:
+            return []
+        query = query.filter(Message.room_id.in_(room_ids))
+    if blocked_ids:
+        query = query.filter(~Message.sender_id.in_(list(blocked_ids)))
+    return query.order_by(Message.timestamp.asc(), Message.id.asc()).limit(limit).all()
+
+
+# 添加廣播方法到 ConnectionManager
+async def broadcast_new_message(self, message):
+    """廣播新消息事件（只發送給該房間的用戶）"""
+    event = message_event(message)
+    # 使用按房間廣播，只發送給該房間中未封鎖發送者的用戶
+    await self.broadcast_to_room(event, message.room_id, sender_id=message.sender_id)
 
 
 async def broadcast_room_created(self, room):
-    """廣播房間創建事件"""
+    """廣播房間創建事件（發送給房間列表訂閱者）"""
     event = {
         "type": "ROOM_CREATED",
         "payload": {
@@ -194,23 +451,22 @@ async def broadcast_room_created(self, room):
         }
     }
     print(f"[WebSocket] Broadcasting ROOM_CREATED: {room.id} - {room.name}")
-    print(f"[WebSocket] Active connections: {len(self.active_connections)} users")
-    await self.broadcast(event)
+    await self.send_to_topic(event, TOPIC_ROOMS)
 
 
-async def broadcast_room_deleted(self, room_id: str):
-    """廣播房間刪除事件"""
+async def broadcast_room_deleted(self, room_id: str, member_ids=()):
+    """廣播房間刪除事件（發送給房間列表訂閱者和原房間成員）"""
     event = {
         "type": "ROOM_DELETED",
         "payload": {
             "roomId": room_id
         }
     }
-    await self.broadcast(event)
+    await self.send_to_topic(event, TOPIC_ROOMS, member_ids)
 
 
 async def broadcast_room_updated(self, room):
-    """廣播房間更新事件"""
+    """廣播房間更新事件（發送給房間列表訂閱者和房間成員）"""
     event = {
         "type": "ROOM_UPDATED",
         "payload": {
@@ -221,46 +477,55 @@ async def broadcast_room_updated(self, room):
             "description": room.description
         }
     }
-    await self.broadcast(event)
+    await self.send_to_topic(event, TOPIC_ROOMS, self.room_users.get(room.id, ()))
 
 
 async def broadcast_user_update(self, user):
-    """廣播用戶更新事件"""
-    from app.database import SessionLocal
-    from app.models import UserRelationship
+    """
+    廣播用戶更新事件
+    - 用戶自己的連接收到完整資料（包括收藏和封鎖列表）
+    - 關注該用戶的人（同房間成員、收藏者）只收到公開資料
+    """
+    interested = self.interested_users([user.id])[user.id]
+    if not interested:
+        return
     
-    db = SessionLocal()
-    try:
-        # 獲取用戶關係
-        favorites = []
-        blocked = []
-        relationships = db.query(UserRelationship).filter(UserRelationship.user_id == user.id).all()
-        for rel in relationships:
-            if rel.relationship_type == "favorite":
-                favorites.append(rel.target_id)
-            elif rel.relationship_type == "blocked":
-                blocked.append(rel.target_id)
+    public_payload = {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "avatar": user.avatar,
+        "isOnline": user.is_online,
+        "bio": user.bio
+    }
+    
+    if user.id in interested:
+        db = SessionLocal()
+        try:
+            # 獲取用戶關係
+            favorites = []
+            blocked = []
+            relationships = db.query(UserRelationship).filter(UserRelationship.user_id == user.id).all()
+            for rel in relationships:
+                if rel.relationship_type == "favorite":
+                    favorites.append(rel.target_id)
+                elif rel.relationship_type == "blocked":
+                    blocked.append(rel.target_id)
+        finally:
+            db.close()
         
-        event = {
+        await self.send_to_users({
             "type": "USER_UPDATE",
-            "payload": {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "avatar": user.avatar,
-                "isOnline": user.is_online,
-                "bio": user.bio,
-                "favorites": favorites,
-                "blocked": blocked
-            }
-        }
-        await self.broadcast(event)
-    finally:
-        db.close()
+            "payload": {**public_payload, "favorites": favorites, "blocked": blocked}
+        }, [user.id])
+    
+    others = interested - {user.id}
+    total_sent = await self.send_to_users({"type": "USER_UPDATE", "payload": public_payload}, others)
+    print(f"[WebSocket] Sending USER_UPDATE for {user.id} to {len(others)} interested users ({total_sent} connections)")
 
 
 async def broadcast_user_joined(self, user):
-    """廣播用戶加入事件"""
+    """廣播用戶加入事件（發送給用戶目錄訂閱者）"""
     event = {
         "type": "USER_JOINED",
         "payload": {
@@ -274,18 +539,31 @@ async def broadcast_user_joined(self, user):
             "blocked": []
         }
     }
-    await self.broadcast(event)
+    await self.send_to_topic(event, TOPIC_USERS)
+
+
+async def broadcast_presence_batch(self, changes: Dict[str, bool]):
+    """
+    批量廣播在線狀態變化（只包含狀態，不重新查詢用戶資料）
+    一次查詢算出所有變化用戶的關注者，只發送給關注者
+    用戶自己不接收：事件只有部分欄位，客戶端收到自己的 USER_UPDATE 時會用它更新當前用戶資料
+    """
+    if not changes or not self.active_connections:
+        return
+    interested = self.interested_users(changes.keys())
+    for user_id, is_online in changes.items():
+        if is_online:
+            event = {"type": "USER_UPDATE", "payload": {"id": user_id, "isOnline": True}}
+        else:
+            event = {"type": "USER_LEFT", "payload": {"userId": user_id}}
+        recipients = interested.get(user_id, set())
+        recipients.discard(user_id)
+        await self.send_to_users(event, recipients)
 
 
 async def broadcast_user_left(self, user_id: str):
-    """廣播用戶離線事件"""
-    event = {
-        "type": "USER_LEFT",
-        "payload": {
-            "userId": user_id
-        }
-    }
-    await self.broadcast(event)
+    """廣播用戶離線事件（只發送給關注該用戶的人）"""
+    await self.broadcast_presence_batch({user_id: False})
 
 
 # 將方法綁定到 ConnectionManager 類
@@ -296,6 +574,7 @@ ConnectionManager.broadcast_room_updated = broadcast_room_updated
 ConnectionManager.broadcast_user_update = broadcast_user_update
 ConnectionManager.broadcast_user_joined = broadcast_user_joined
 ConnectionManager.broadcast_user_left = broadcast_user_left
+ConnectionManager.broadcast_presence_batch = broadcast_presence_batch
 
 async def handle_websocket(websocket: WebSocket):
     """處理 WebSocket 連接"""
@@ -307,44 +586,85 @@ async def handle_websocket(websocket: WebSocket):
         await websocket.close(code=1008, reason="Authentication required")
         return
     
+    # 服務關閉中：不查詢資料庫，直接讓客戶端稍後重連到新進程
+    if shutdown_drain.draining:
+        await websocket.accept()
+        await shutdown_drain.send_hint_and_close(websocket, negotiate_encoding(query_params.get("encoding")))
+        return
+    
+    # 准入控制：IP 連接速率和 worker 容量在查詢資料庫之前檢查
+    client_ip = websocket.client.host if websocket.client else ""
+    rejection = admission_control.check_before_auth(client_ip, websocket_manager.connection_count)
+    if rejection:
+        await admission_control.reject(websocket, rejection)
+        return
+    
     # 驗證用戶
     user = await get_user_from_token(token)
     if not user:
         await websocket.close(code=1008, reason="Invalid token")
         return
     
-    # 建立連接
-    await websocket_manager.connect(websocket, user.id)
+    rejection = admission_control.check_user(len(websocket_manager.active_connections.get(user.id, ())))
+    if rejection:
+        print(f"[WebSocket] Rejecting connection for user {user.id}: {rejection[1]}")
+        await admission_control.reject(websocket, rejection)
+        return
+    
+    # 建立連接（可選 ?encoding=msgpack 使用二進制編碼，?batch=1 接收合併後的數組幀）
+    encoding = negotiate_encoding(query_params.get("encoding"))
+    batch = query_params.get("batch") == "1"
+    record = await websocket_manager.connect(websocket, user.id, encoding, batch)
+    
+    # 在線狀態由 Presence 服務計數並批量廣播/寫入（資料庫中已是在線時不重複廣播，例如重啟後重連）
+    presence_service.connected(user.id, persisted_online=user.is_online)
     
-    # 確保用戶在線狀態已更新並廣播
     db = SessionLocal()
+    missed_messages = []
     try:
-        db_user = db.query(User).filter(User.id == user.id).first()
-        if db_user and not db_user.is_online:
-            # 如果用戶狀態不是在線，更新為在線並廣播
-            db_user.is_online = True
-            db.commit()
-            db.refresh(db_user)
-            print(f"[WebSocket] User {user.id} marked as online via WebSocket connection")
-            # 廣播用戶上線事件
-            await websocket_manager.broadcast_user_update(db_user)
+        # 從資料庫恢復房間訂閱，客戶端重連後無需逐一重新調用 join
+        room_ids = load_user_room_ids(db, user.id)
+        websocket_manager.restore_user_rooms(user.id, room_ids)
+        # 預熱封鎖列表快取，房間扇出時無需再查詢
+        blocked_ids = blocked_cache.load_many(db, [user.id])[user.id]
+        # 從 bootstrap 游標（?lastMessageId=）續接：補發斷線期間所在房間的新消息
+        last_message_id = query_params.get("lastMessageId")
+        if last_message_id:
+            missed_messages = load_messages_after(db, last_message_id, blocked_ids, room_ids, limit=RESUME_MESSAGE_LIMIT)
     except Exception as e:
-        print(f"[WebSocket] Error updating user online status: {e}")
-        db.rollback()
+        print(f"[WebSocket] Error restoring room subscriptions: {e}")
     finally:
         db.close()
     
+    try:
+        for message in missed_messages:
+            await websocket_manager.send_event(record, message_event(message))
+    except Exception as e:
+        print(f"[WebSocket] Error replaying {len(missed_messages)} missed messages to user {user.id}: {e}")
+    
     try:
         while True:
             # 接收消息（如果需要雙向通信）
             data = await websocket.receive_text()
+            # 收到任何消息都視為連接存活
+            heartbeat_scheduler.touch(record)
             
             # 處理心跳消息（ping/pong）
             try:
                 message = json.loads(data)
                 if message.get("type") == "ping":
                     # 回應心跳
-                    await websocket.send_json({"type": "pong"})
+                    await websocket_manager.send_event(record, {"type": "pong"})
+                    continue
+                if message.get("type") == "pong":
+                    # 服務端心跳的回應
+                    continue
+                # 訂閱/取消訂閱主題（房間列表、用戶目錄）
+                if message.get("type") == "subscribe" and message.get("topic") in DEFAULT_TOPICS:
+                    websocket_manager.subscribe(user.id, message["topic"])
+                    continue
+                if message.get("type") == "unsubscribe" and message.get("topic") in DEFAULT_TOPICS:
+                    websocket_manager.unsubscribe(user.id, message["topic"])
                     continue
             except json.JSONDecodeError:
                 # 如果不是 JSON，忽略
@@ -354,21 +674,7 @@ async def handle_websocket(websocket: WebSocket):
             # 目前主要實現服務器到客戶端的推送
     except WebSocketDisconnect:
         print(f"[WebSocket] User {user.id} disconnected")
-        websocket_manager.disconnect(websocket, user.id)
-        
-        # 更新用戶離線狀態
-        db = SessionLocal()
-        try:
-            db_user = db.query(User).filter(User.id == user.id).first()
-            if db_user:
-                db_user.is_online = False
-                db.commit()
-                print(f"[WebSocket] User {user.id} marked as offline")
-                # 廣播用戶離線事件
-                await websocket_manager.broadcast_user_left(user.id)
-        except Exception as e:
-            print(f"[WebSocket] Error updating user offline status: {e}")
-            db.rollback()
-        finally:
-            db.close()
-
+    finally:
+        websocket_manager.disconnect(record)
+        # 其他分頁仍連接時不會離線；最後一個連接斷開後經過寬限期才標記離線
+        presence_service.disconnected(user.id)
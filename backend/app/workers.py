@@ -0,0 +1,40 @@
+"""
+Gunicorn worker 類
+使用方式：gunicorn main:app -k app.workers.ChatUvicornWorker
+- 可調參數的 WebSocket 壓縮（app.ws_protocol）
+- 收到 SIGTERM 後，在 uvicorn 關閉連接之前先排空 WebSocket（發送帶隨機延遲的重連提示，見 app.shutdown）
+"""
+import sys
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn.workers import UvicornWorker
+
+from app.ws_protocol import CompressedWebSocketProtocol
+
+
+class DrainingServer(Server):
+    """uvicorn 默認關閉時直接以 1012 斷開所有 WebSocket，這裡先發送重連提示"""
+
+    async def shutdown(self, sockets=None):
+        from app.shutdown import shutdown_drain
+        from app.websocket import websocket_manager
+
+        try:
+            await shutdown_drain.drain(websocket_manager)
+        except Exception as e:
+            print(f"[Shutdown] Error draining WebSocket connections: {e}")
+        await super().shutdown(sockets)
+
+
+class ChatUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto", "ws": CompressedWebSocketProtocol}
+
+    async def _serve(self) -> None:
+        # 與 UvicornWorker._serve 相同，只替換 Server 類
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
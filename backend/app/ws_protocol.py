@@ -0,0 +1,58 @@
+"""
+WebSocket 協議層配置
+uvicorn 默認的 permessage-deflate 不可調參數，這裡替換為可配置的壓縮擴展：
+- 窗口大小、壓縮等級、memLevel、context takeover 均可通過 Settings 調整
+- 記錄壓縮耗時和壓縮前後字節數到 metrics
+"""
+import time
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+
+from app.config import settings
+from app.metrics import metrics
+
+
+class TimedPerMessageDeflate(PerMessageDeflate):
+    """記錄壓縮 CPU 耗時和壓縮率的 permessage-deflate"""
+
+    def encode(self, frame):
+        start = time.perf_counter()
+        encoded = super().encode(frame)
+        if encoded is not frame:
+            metrics.observe("websocket.deflate_seconds", time.perf_counter() - start)
+            metrics.inc("websocket.deflate.bytes_in", len(frame.data))
+            metrics.inc("websocket.deflate.bytes_out", len(encoded.data))
+        return encoded
+
+
+class TunedPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        extension.__class__ = TimedPerMessageDeflate
+        return response_params, extension
+
+
+def build_deflate_factory() -> TunedPerMessageDeflateFactory:
+    """根據 Settings 創建壓縮擴展工廠"""
+    return TunedPerMessageDeflateFactory(
+        server_no_context_takeover=settings.WS_COMPRESSION_SERVER_NO_CONTEXT_TAKEOVER,
+        client_no_context_takeover=settings.WS_COMPRESSION_CLIENT_NO_CONTEXT_TAKEOVER,
+        server_max_window_bits=settings.WS_COMPRESSION_SERVER_MAX_WINDOW_BITS,
+        client_max_window_bits=settings.WS_COMPRESSION_CLIENT_MAX_WINDOW_BITS,
+        compress_settings={
+            "level": settings.WS_COMPRESSION_LEVEL,
+            "memLevel": settings.WS_COMPRESSION_MEM_LEVEL,
+        },
+    )
+
+
+class CompressedWebSocketProtocol(WebSocketProtocol):
+    """使用可調參數 permessage-deflate 的 uvicorn WebSocket 協議"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if settings.WS_COMPRESSION_ENABLED:
+            self.available_extensions = [build_deflate_factory()]
+        else:
+            self.available_extensions = []
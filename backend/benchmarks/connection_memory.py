@@ -0,0 +1,85 @@
+"""
+連接記憶體基準測試：建立 N 個模擬連接（默認 10 萬），統計每個連接在
+ConnectionManager、心跳調度器中佔用的記憶體（tracemalloc，不含 WebSocket 對象本身）
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/connection_memory.py
+    python benchmarks/connection_memory.py --connections 100000 --tabs 2 --rooms-per-user 5 --json memory.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fanout import FakeWebSocket  # noqa: E402
+
+
+async def measure(args) -> dict:
+    from app.websocket import ConnectionManager
+
+    manager = ConnectionManager()
+    user_count = max(1, args.connections // args.tabs)
+    user_ids = [f"user-{index:06d}" for index in range(user_count)]
+    room_ids = [f"room-{index:04d}" for index in range(args.rooms)]
+    sockets = [FakeWebSocket() for _ in range(args.connections)]
+    records = [None] * args.connections
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    for index, socket in enumerate(sockets):
+        records[index] = await manager.connect(socket, user_ids[index % user_count])
+    connect_seconds = time.perf_counter() - start
+    after_connect = tracemalloc.take_snapshot()
+    for index, user_id in enumerate(user_ids):
+        manager.restore_user_rooms(user_id, [room_ids[(index + offset) % len(room_ids)] for offset in range(args.rooms_per_user)])
+    after_rooms = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    for record in records:
+        manager.disconnect(record)
+    disconnect_seconds = time.perf_counter() - start
+    tracemalloc.stop()
+
+    connection_bytes = sum(stat.size_diff for stat in after_connect.compare_to(before, "filename"))
+    room_bytes = sum(stat.size_diff for stat in after_rooms.compare_to(after_connect, "filename"))
+    return {
+        "connections": args.connections,
+        "users": user_count,
+        "rooms_per_user": args.rooms_per_user,
+        "bytes_per_connection": round(connection_bytes / args.connections, 1),
+        "room_bytes_per_user": round(room_bytes / user_count, 1),
+        "total_mib": round((connection_bytes + room_bytes) / 1024 / 1024, 2),
+        "connect_us": round(connect_seconds / args.connections * 1_000_000, 2),
+        "disconnect_us": round(disconnect_seconds / args.connections * 1_000_000, 2),
+        "leftover_connections": manager.connection_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="連接記憶體基準測試")
+    parser.add_argument("--connections", type=int, default=100_000)
+    parser.add_argument("--tabs", type=int, default=1, help="每個用戶的連接數")
+    parser.add_argument("--rooms", type=int, default=1000, help="房間總數")
+    parser.add_argument("--rooms-per-user", type=int, default=3)
+    parser.add_argument("--json", help="將結果寫入 JSON 文件")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        result = asyncio.run(measure(args))
+    print(json.dumps(result, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
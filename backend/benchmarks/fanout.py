@@ -0,0 +1,324 @@
+"""
+WebSocket 扇出微基準測試：用記憶體中的假 WebSocket 驅動 ConnectionManager
+
+場景：
+- broadcast：廣播給所有連接
+- room：broadcast_new_message → broadcast_to_room（含封鎖過濾）
+- personal：對每個用戶調用 send_personal_message
+- burst：同一窗口內連續 --burst 條房間消息，加上同一用戶反覆上線/離線（USER_UPDATE / USER_LEFT）
+- storm：--storm 個用戶的在線狀態變化（模擬大量重連）扇出進行中時發送一條房間消息，
+  測量這條消息的投遞延遲（message_p50/p99_ms），反映在線狀態風暴對消息延遲的影響
+
+假 WebSocket 中一部分是慢連接：幀按順序以每幀 --slow-delay 的速度送達，
+發送時先寫入緩衝區立即返回，緩衝區超過 --slow-buffer 幀時等待（與真實傳輸層的背壓相同）、一部分發送時拋異常（模擬已斷開），
+每次事件前重新建立連接，保證每次都包含同樣比例的慢/失敗連接。
+--batch-window-ms > 0 時連接使用按 tick 合併發送（app.batching），事件觸發後立即 flush，
+耗時包含合併和發送，不包含等待窗口的時間。
+
+每個場景報告：
+- 每次事件扇出的耗時（p50/p99/max）
+- 每個接收者的 CPU 時間（不含慢連接的等待）
+- 每個接收者收到的幀數（每幀對應一次 send 調用）
+- 房間消息（NEW_MESSAGE）相對事件開始的投遞延遲（p50/p99）
+- 接收者收到事件的時間相對事件開始的延遲（p50/p99），反映慢連接造成的隊頭阻塞
+- 每個連接在 ConnectionManager 和心跳調度器中的記憶體佔用（tracemalloc）
+
+結果輸出為 JSON；指定 --baseline 時與之前的結果比較，超出 --tolerance 返回非 0 退出碼。
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/fanout.py
+    python benchmarks/fanout.py --connections 10000 --slow-fraction 0.01 --json fanout.json
+    python benchmarks/fanout.py --baseline fanout.json --tolerance 0.25
+    python benchmarks/fanout.py --scenarios burst --batch-window-ms 20
+    python benchmarks/fanout.py --scenarios storm --storm 500
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ("broadcast", "room", "personal", "burst", "storm")
+# 與基準結果比較的指標（越小越好）
+COMPARED_METRICS = ("event_p50_ms", "cpu_us_per_recipient", "frames_per_recipient", "bytes_per_connection")
+
+
+class FakeWebSocket:
+    """只實現 ConnectionManager 用到的接口；記錄每次收到幀的時間"""
+    __slots__ = (
+        "delay", "fail", "buffer", "ready_at", "received", "bytes_received", "last_received_at", "message_received_at"
+    )
+
+    def __init__(self, delay: float = 0.0, fail: bool = False, buffer: int = 0):
+        self.delay = delay
+        self.fail = fail
+        self.buffer = buffer
+        # 慢連接緩衝區中最後一幀送達的時間
+        self.ready_at = 0.0
+        self.received = 0
+        self.bytes_received = 0
+        self.last_received_at = 0.0
+        self.message_received_at = 0.0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    async def _deliver(self, size: int, is_message: bool):
+        if self.fail:
+            raise RuntimeError("Cannot call send once a close message has been sent")
+        now = time.perf_counter()
+        received_at = now
+        if self.delay:
+            # 幀進入緩衝區，按順序送達；緩衝區積壓超過上限時等待排空到上限以下
+            received_at = self.ready_at = max(now, self.ready_at) + self.delay
+            backlog = received_at - now - self.buffer * self.delay
+            if backlog > 0:
+                await asyncio.sleep(backlog)
+        self.received += 1
+        self.bytes_received += size
+        self.last_received_at = received_at
+        if is_message and not self.message_received_at:
+            self.message_received_at = received_at
+
+    async def send_text(self, data: str):
+        await self._deliver(len(data), "NEW_MESSAGE" in data)
+
+    async def send_bytes(self, data: bytes):
+        await self._deliver(len(data), b"NEW_MESSAGE" in data)
+
+
+def percentile(values, p) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def new_message(room_id: str, sender_id: str):
+    return SimpleNamespace(
+        id="01900000-0000-7000-8000-000000000000",
+        room_id=room_id,
+        sender_id=sender_id,
+        sender_name="基準測試",
+        sender_avatar="https://api.dicebear.com/7.x/initials/svg?seed=bench",
+        content="大家好，這是一條扇出基準測試消息 👍",
+        type="text",
+        timestamp=datetime(2024, 1, 1, 12, 0, 0)
+    )
+
+
+class FanoutBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.user_ids = [f"user-{index:06d}" for index in range(max(1, args.connections // args.tabs))]
+        self.room_id = "room-bench"
+
+    def make_sockets(self):
+        sockets = []
+        for index in range(self.args.connections):
+            roll = self.rng.random()
+            if roll < self.args.fail_fraction:
+                socket = FakeWebSocket(fail=True)
+            elif roll < self.args.fail_fraction + self.args.slow_fraction:
+                socket = FakeWebSocket(delay=self.args.slow_delay, buffer=self.args.slow_buffer)
+            else:
+                socket = FakeWebSocket()
+            sockets.append((self.user_ids[index % len(self.user_ids)], socket))
+        return sockets
+
+    async def connect_all(self, manager, sockets) -> list:
+        records = []
+        for user_id, socket in sockets:
+            encoding = "msgpack" if self.args.msgpack_fraction and self.rng.random() < self.args.msgpack_fraction else "json"
+            records.append(await manager.connect(socket, user_id, encoding, batch=self.args.batch_window_ms > 0))
+        for user_id in self.user_ids:
+            manager.restore_user_rooms(user_id, [self.room_id])
+        return records
+
+    def disconnect_all(self, manager, records):
+        for record in records:
+            manager.disconnect(record)
+
+    async def fire(self, manager, scenario: str):
+        if scenario == "broadcast":
+            await manager.broadcast({"type": "USER_UPDATE", "payload": {"id": self.user_ids[0], "name": "基準測試", "isOnline": True}})
+        elif scenario == "room":
+            await manager.broadcast_new_message(new_message(self.room_id, self.user_ids[0]))
+        elif scenario == "personal":
+            event = {"type": "ROOM_UPDATED", "payload": {"id": self.room_id, "name": "基準測試房間"}}
+            for user_id in self.user_ids:
+                await manager.send_personal_message(event, user_id)
+        elif scenario == "burst":
+            flapping = self.user_ids[-1]
+            for index in range(self.args.burst):
+                await manager.broadcast_new_message(new_message(self.room_id, self.user_ids[0]))
+                if index % 2:
+                    event = {"type": "USER_LEFT", "payload": {"userId": flapping}}
+                else:
+                    event = {"type": "USER_UPDATE", "payload": {"id": flapping, "isOnline": True}}
+                await manager.send_to_users(event, self.user_ids)
+        elif scenario == "storm":
+            storm = asyncio.create_task(self.presence_storm(manager))
+            # 讓在線狀態扇出先開始，慢連接上已有積壓時再發送消息
+            await asyncio.sleep(self.args.slow_delay * self.args.slow_buffer)
+            await manager.broadcast_new_message(new_message(self.room_id, self.user_ids[0]))
+            await storm
+
+    async def presence_storm(self, manager):
+        """--storm 個用戶依次上線，每個狀態變化發送給所有用戶（與 broadcast_presence_batch 相同的發送路徑）"""
+        for index in range(self.args.storm):
+            event = {"type": "USER_UPDATE", "payload": {"id": f"storm-{index}", "isOnline": True}}
+            await manager.send_to_users(event, self.user_ids)
+
+    async def measure_memory(self) -> int:
+        """每個連接在 ConnectionManager 和心跳調度器中佔用的字節數（不含假 WebSocket 本身）"""
+        from app.websocket import ConnectionManager
+
+        manager = ConnectionManager()
+        sockets = self.make_sockets()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        records = await self.connect_all(manager, sockets)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        self.disconnect_all(manager, records)
+        return round(allocated / len(sockets))
+
+    async def run_scenario(self, scenario: str) -> dict:
+        from app.batching import event_batcher
+        from app.websocket import ConnectionManager
+
+        event_seconds, cpu_seconds, offsets, message_offsets = [], [], [], []
+        recipients = 0
+        frames = 0
+        for iteration in range(self.args.warmup + self.args.events):
+            manager = ConnectionManager()
+            sockets = self.make_sockets()
+            records = await self.connect_all(manager, sockets)
+            event_batcher.start(manager)
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            await self.fire(manager, scenario)
+            await event_batcher.flush()
+            cpu_elapsed = time.process_time() - cpu_start
+            elapsed = time.perf_counter() - start
+            self.disconnect_all(manager, records)
+            if iteration < self.args.warmup:
+                continue
+            delivered = [socket for _, socket in sockets if socket.received]
+            recipients += len(delivered)
+            frames += sum(socket.received for socket in delivered)
+            event_seconds.append(elapsed)
+            cpu_seconds.append(cpu_elapsed / max(1, len(delivered)))
+            offsets.extend(socket.last_received_at - start for socket in delivered)
+            message_offsets.extend(socket.message_received_at - start for socket in delivered if socket.message_received_at)
+
+        return {
+            "scenario": scenario,
+            "connections": self.args.connections,
+            "recipients_per_event": round(recipients / self.args.events, 1),
+            "event_p50_ms": round(percentile(event_seconds, 0.5) * 1000, 3),
+            "event_p99_ms": round(percentile(event_seconds, 0.99) * 1000, 3),
+            "event_max_ms": round(max(event_seconds) * 1000, 3),
+            "cpu_us_per_recipient": round(percentile(cpu_seconds, 0.5) * 1_000_000, 3),
+            "frames_per_recipient": round(frames / max(1, recipients), 2),
+            "delivery_p50_ms": round(percentile(offsets, 0.5) * 1000, 3),
+            "delivery_p99_ms": round(percentile(offsets, 0.99) * 1000, 3),
+            "message_p50_ms": round(percentile(message_offsets, 0.5) * 1000, 3),
+            "message_p99_ms": round(percentile(message_offsets, 0.99) * 1000, 3),
+        }
+
+    async def run(self) -> dict:
+        results = []
+        bytes_per_connection = await self.measure_memory()
+        for scenario in self.args.scenarios.split(","):
+            result = await self.run_scenario(scenario.strip())
+            result["bytes_per_connection"] = bytes_per_connection
+            results.append(result)
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("json", "baseline")},
+            "python": sys.version.split()[0],
+            "results": results,
+        }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """返回超出容差的回歸：[(場景, 指標, 基準值, 當前值), ...]"""
+    regressions = []
+    previous = {result["scenario"]: result for result in baseline.get("results", [])}
+    for result in current["results"]:
+        old = previous.get(result["scenario"])
+        if not old:
+            continue
+        for metric in COMPARED_METRICS:
+            if old.get(metric) and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append((result["scenario"], metric, old[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 扇出微基準測試")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--tabs", type=int, default=1, help="每個用戶的連接數")
+    parser.add_argument("--slow-fraction", type=float, default=0.01, help="慢連接比例")
+    parser.add_argument("--slow-delay", type=float, default=0.002, help="慢連接每次發送的延遲（秒）")
+    parser.add_argument("--slow-buffer", type=int, default=16, help="慢連接發送緩衝區可容納的幀數，超過時發送等待")
+    parser.add_argument("--fail-fraction", type=float, default=0.005, help="發送失敗的連接比例")
+    parser.add_argument("--msgpack-fraction", type=float, default=0.0, help="使用 msgpack 編碼的連接比例（需安裝 msgpack）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--burst", type=int, default=20, help="burst 場景每次事件包含的房間消息數")
+    parser.add_argument("--storm", type=int, default=200, help="storm 場景中狀態變化的用戶數")
+    parser.add_argument("--batch-window-ms", type=int, default=0, help="按 tick 合併發送的窗口，0 表示逐個發送")
+    parser.add_argument("--events", type=int, default=10, help="每個場景測量的事件數")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="將結果寫入 JSON 文件")
+    parser.add_argument("--baseline", help="與之前的 JSON 結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允許的回歸比例")
+    parser.add_argument("--verbose", action="store_true", help="顯示 ConnectionManager 的日誌輸出")
+    args = parser.parse_args()
+
+    # 封鎖列表快取第一次扇出時會查詢資料庫，使用臨時 SQLite，無需 MySQL
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_fanout_'), 'chat.db')}")
+    from app.batching import event_batcher
+    from app.database import engine
+    from app.migrations import run_migrations
+
+    event_batcher.window = args.batch_window_ms / 1000
+
+    with contextlib.redirect_stdout(None if args.verbose else open(os.devnull, "w")):
+        run_migrations(engine)
+        # 日誌輸出是扇出成本的一部分，但寫入 /dev/null，避免終端輸出速度影響結果
+        result = asyncio.run(FanoutBenchmark(args).run())
+
+    for scenario in result["results"]:
+        print(json.dumps(scenario, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for scenario, metric, old, new in regressions:
+            print(f"[Regression] {scenario}.{metric}: {old} -> {new}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+主鍵插入吞吐量基準測試：uuid4 vs UUIDv7（VARCHAR(36) / BINARY(16)）
+
+對每種 ID 策略建立一張與 messages 結構相同的臨時表，分批插入 N 行並記錄：
+- 每秒插入行數（總體及最後 10% 批次，後者反映索引變大後的頁分裂影響）
+- 表和索引佔用空間（MySQL 取 information_schema，SQLite 取文件大小增量）
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/insert_ids.py                                   # SQLite 臨時文件
+    python benchmarks/insert_ids.py --url "mysql+pymysql://root:@localhost/bench" --rows 500000
+    python benchmarks/insert_ids.py --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, Text, create_engine, text  # noqa: E402
+from sqlalchemy.sql import func  # noqa: E402
+
+from app.ids import CompactUUID, generate_id  # noqa: E402
+
+STRATEGIES = {
+    "uuid4_char36": (lambda: String(36), lambda: str(uuid.uuid4())),
+    "uuid7_char36": (lambda: String(36), generate_id),
+    "uuid7_binary16": (CompactUUID, generate_id),
+}
+
+
+def build_table(metadata: MetaData, name: str, id_type) -> Table:
+    return Table(
+        name, metadata,
+        Column("id", id_type(), primary_key=True),
+        Column("room_id", String(36), nullable=False),
+        Column("sender_id", String(36), nullable=False),
+        Column("content", Text, nullable=False),
+        Column("timestamp", DateTime(timezone=True), server_default=func.now()),
+        Index(f"ix_{name}_room_id", "room_id"),
+        Index(f"ix_{name}_sender_id", "sender_id"),
+        mysql_engine="InnoDB",
+    )
+
+
+def table_size(engine, name: str, sqlite_path: str, baseline: int) -> dict:
+    if engine.dialect.name == "mysql":
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+            ), {"name": name}).first()
+        return {"data_bytes": int(row[0]), "index_bytes": int(row[1])}
+    if sqlite_path:
+        return {"file_bytes_delta": os.path.getsize(sqlite_path) - baseline}
+    return {}
+
+
+def run_strategy(engine, name: str, rows: int, batch_size: int, sqlite_path: str) -> dict:
+    id_type, make_id = STRATEGIES[name]
+    metadata = MetaData()
+    table = build_table(metadata, f"bench_{name}", id_type)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    baseline = os.path.getsize(sqlite_path) if sqlite_path else 0
+
+    room_ids = [str(uuid.uuid4()) for _ in range(50)]
+    sender_ids = [str(uuid.uuid4()) for _ in range(500)]
+    content = "你好，這是一條基準測試消息 benchmark message " * 2
+
+    batch_times = []
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        count = min(batch_size, rows - offset)
+        batch = [{
+            "id": make_id(),
+            "room_id": room_ids[(offset + i) % len(room_ids)],
+            "sender_id": sender_ids[(offset + i) % len(sender_ids)],
+            "content": content,
+        } for i in range(count)]
+        batch_start = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        batch_times.append((count, time.perf_counter() - batch_start))
+    elapsed = time.perf_counter() - start
+
+    tail = batch_times[-max(1, len(batch_times) // 10):]
+    result = {
+        "strategy": name,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1),
+        "tail_rows_per_second": round(sum(c for c, _ in tail) / sum(t for _, t in tail), 1),
+        **table_size(engine, table.name, sqlite_path, baseline),
+    }
+    if not sqlite_path:
+        metadata.drop_all(engine)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主鍵插入吞吐量基準測試")
+    parser.add_argument("--url", help="資料庫連接字符串（默認使用 SQLite 臨時文件）")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="逗號分隔：" + ",".join(STRATEGIES))
+    parser.add_argument("--json", help="將結果寫入 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ids_")
+    results = []
+    for name in args.strategies.split(","):
+        name = name.strip()
+        sqlite_path = ""
+        url = args.url
+        if not url:
+            # 每種策略使用獨立的 SQLite 文件，避免複用上一張表釋放的頁面影響大小統計
+            sqlite_path = os.path.join(workdir, f"{name}.db")
+            url = f"sqlite:///{sqlite_path}"
+        engine = create_engine(url)
+        result = run_strategy(engine, name, args.rows, args.batch, sqlite_path)
+        engine.dispose()
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"url": args.url or "sqlite (temporary files)", "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+負載測試：對本地實例同時驅動 REST 接口和大量 /ws 連接，報告吞吐量和延遲百分位
+
+流程：
+1. 登入 --users 個由 seed.py 生成的用戶（seed{n}@example.com），並加入 --rooms 個公開房間
+2. 建立 --ws-clients 個 WebSocket 連接（平均分配給這些用戶，相當於多個分頁）
+3. --concurrency 個虛擬用戶在 --duration 秒內按權重隨機調用 REST 接口：
+   房間列表、消息歷史、發送消息、搜索、bootstrap、用戶列表
+4. 發送的消息帶有標記，WebSocket 客戶端收到 NEW_MESSAGE 時計算端到端投遞延遲
+
+只依賴 httpx 和 websockets，不需要外網；--spawn 時自動用 uvicorn 啟動一個連接到 --url 的實例。
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/seed.py --url sqlite:///./bench.db
+    python benchmarks/loadtest.py --spawn --url sqlite:///./bench.db --duration 30
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --ws-clients 2000 --json loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.seed import SEED_EMAIL, message_text  # noqa: E402
+
+MARKER = "lt:"
+
+# (名稱, 權重)
+SCENARIOS = [
+    ("rooms", 20),
+    ("history", 30),
+    ("send", 25),
+    ("search", 5),
+    ("bootstrap", 10),
+    ("users", 10),
+]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions = []  # [(user_id, token)]
+        self.room_ids = []
+        self.sent_at = {}  # {marker: perf_counter}
+        self.delivery = []
+        self.ws_connect = []
+        self.ws_events = 0
+        self.ws_failed = 0
+        self.stopping = asyncio.Event()
+
+    async def request(self, client, name: str, method: str, url: str, token: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                self.errors[f"{name}.{response.status_code}"] += 1
+                return None
+            self.latencies[name].append(elapsed)
+            return response
+        except httpx.HTTPError as e:
+            self.errors[f"{name}.{type(e).__name__}"] += 1
+            return None
+
+    async def setup(self, client):
+        """登入用戶並加入測試房間"""
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def login(index):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/auth/login", json={
+                    "email": SEED_EMAIL.format(index=index), "password": self.args.password
+                })
+                if response.status_code != 200:
+                    self.errors[f"login.{response.status_code}"] += 1
+                    return None
+                self.latencies["login"].append(time.perf_counter() - start)
+                body = response.json()
+                return body["user"]["id"], body["access_token"]
+
+        results = await asyncio.gather(*(login(index) for index in range(self.args.users)))
+        self.sessions = [result for result in results if result]
+        if not self.sessions:
+            raise SystemExit("沒有用戶登入成功，請先執行 benchmarks/seed.py")
+
+        response = await client.get("/api/rooms", headers={"Authorization": f"Bearer {self.sessions[0][1]}"})
+        public_rooms = [room["id"] for room in response.json() if not room["is_private"]]
+        self.room_ids = public_rooms[:self.args.rooms]
+
+        async def join(token, room_id):
+            async with semaphore:
+                await self.request(client, "join", "POST", f"/api/rooms/{room_id}/join", token, json={})
+
+        await asyncio.gather(*(join(token, room_id) for _, token in self.sessions for room_id in self.room_ids))
+
+    async def ws_client(self, token: str, ready: asyncio.Event):
+        ws_url = self.args.base_url.replace("http", "ws", 1) + f"/ws?token={token}"
+        start = time.perf_counter()
+        try:
+            async with websockets.connect(ws_url, max_size=None, open_timeout=30) as ws:
+                self.ws_connect.append(time.perf_counter() - start)
+                ready.set()
+                while not self.stopping.is_set():
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=1)
+                    except asyncio.TimeoutError:
+                        continue
+                    received_at = time.perf_counter()
+                    event = json.loads(raw)
+                    self.ws_events += 1
+                    if event.get("type") == "ping":
+                        await ws.send(json.dumps({"type": "pong"}))
+                    elif event.get("type") == "NEW_MESSAGE":
+                        content = event["payload"].get("content", "")
+                        if content.startswith(MARKER):
+                            sent_at = self.sent_at.get(content.split(" ", 1)[0])
+                            if sent_at is not None:
+                                self.delivery.append(received_at - sent_at)
+        except Exception as e:
+            self.ws_failed += 1
+            self.errors[f"ws.{type(e).__name__}"] += 1
+            ready.set()
+
+    async def virtual_user(self, client, deadline: float):
+        names = [name for name, _ in SCENARIOS]
+        weights = [weight for _, weight in SCENARIOS]
+        while time.perf_counter() < deadline:
+            user_id, token = self.rng.choice(self.sessions)
+            room_id = self.rng.choice(self.room_ids) if self.room_ids else None
+            scenario = self.rng.choices(names, weights=weights)[0]
+            if scenario == "rooms":
+                await self.request(client, scenario, "GET", "/api/rooms", token)
+            elif scenario == "history" and room_id:
+                await self.request(client, scenario, "GET", f"/api/messages/rooms/{room_id}", token, params={"limit": 50})
+            elif scenario == "send" and room_id:
+                marker = f"{MARKER}{uuid.uuid4().hex}"
+                self.sent_at[marker] = time.perf_counter()
+                await self.request(client, scenario, "POST", "/api/messages", token, json={
+                    "room_id": room_id, "content": f"{marker} {message_text(self.rng)}"
+                })
+            elif scenario == "search":
+                await self.request(client, scenario, "GET", "/api/messages/search", token,
+                                   params={"query": self.rng.choice(["大家好", "deploy", "今天天氣", "代码已经"])})
+            elif scenario == "bootstrap":
+                await self.request(client, scenario, "GET", "/api/bootstrap", token, params={"roomId": room_id} if room_id else {})
+            elif scenario == "users":
+                await self.request(client, scenario, "GET", "/api/users", token)
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2, max_keepalive_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=60, limits=limits) as client:
+            setup_start = time.perf_counter()
+            await self.setup(client)
+            setup_seconds = time.perf_counter() - setup_start
+
+            ws_tasks = []
+            for index in range(self.args.ws_clients):
+                _, token = self.sessions[index % len(self.sessions)]
+                ready = asyncio.Event()
+                ws_tasks.append(asyncio.create_task(self.ws_client(token, ready)))
+                await ready.wait()
+
+            start = time.perf_counter()
+            deadline = start + self.args.duration
+            await asyncio.gather(*(self.virtual_user(client, deadline) for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+            # 等待最後一批消息投遞完成
+            await asyncio.sleep(self.args.drain_seconds)
+            self.stopping.set()
+            await asyncio.gather(*ws_tasks)
+
+            metrics = None
+            try:
+                metrics = (await client.get("/api/debug/metrics")).json()
+            except Exception:
+                pass
+
+        requests = sum(len(values) for name, values in self.latencies.items() if name not in ("login", "join"))
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("json",)},
+            "setup_seconds": round(setup_seconds, 2),
+            "duration_seconds": round(elapsed, 2),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 1),
+            "endpoints": {name: percentiles(values) for name, values in sorted(self.latencies.items())},
+            "errors": dict(self.errors),
+            "websocket": {
+                "connected": len(self.ws_connect),
+                "failed": self.ws_failed,
+                "connect": percentiles(self.ws_connect),
+                "events_received": self.ws_events,
+                "delivery": percentiles(self.delivery),
+            },
+            "server_metrics": metrics,
+        }
+
+
+def spawn_server(args):
+    """在本地啟動 uvicorn 實例，等待 /health 可用"""
+    env = {**os.environ, "DATABASE_URL": args.url}
+    subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    port = args.base_url.rsplit(":", 1)[-1].rstrip("/")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL if not args.verbose else None
+    )
+    for _ in range(300):
+        try:
+            if httpx.get(f"{args.base_url}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("本地實例啟動失敗")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST + WebSocket 負載測試")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8765")
+    parser.add_argument("--spawn", action="store_true", help="自動啟動本地 uvicorn 實例（需要 --url）")
+    parser.add_argument("--url", help="--spawn 時實例使用的資料庫連接字符串")
+    parser.add_argument("--users", type=int, default=50, help="登入的用戶數（seed0..seedN-1）")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--rooms", type=int, default=5, help="參與測試的公開房間數")
+    parser.add_argument("--ws-clients", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="並發虛擬用戶數")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--drain-seconds", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="將結果寫入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="顯示 --spawn 實例的輸出")
+    args = parser.parse_args()
+
+    if args.spawn and not args.url:
+        parser.error("--spawn 需要 --url")
+
+    process = spawn_server(args) if args.spawn else None
+    try:
+        result = asyncio.run(LoadTest(args).run())
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+
+    summary = {key: value for key, value in result.items() if key != "server_metrics"}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+合成數據生成工具：批量生成用戶、房間、成員關係、收藏/封鎖關係和消息，用於性能測試
+
+- 消息內容混合繁體/簡體中文、日文、英文和 emoji，長度分佈接近真實聊天
+- 一部分用戶使用舊版的 base64 頭像（data URI，數十 KB），消息的 sender_avatar 冗余欄位同樣會變大
+- 所有用戶密碼相同（只計算一次 bcrypt 哈希），郵箱為 seed{n}@example.com，供 loadtest.py 登入
+- 使用 Core 批量插入，先執行資料庫遷移；--seed 固定隨機種子，結果可重現
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/seed.py --url sqlite:///./bench.db
+    python benchmarks/seed.py --url "mysql+pymysql://root:@localhost/chat-bench?charset=utf8mb4" \\
+        --users 5000 --rooms 200 --messages 1000000
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED_EMAIL = "seed{index}@example.com"
+
+CJK_PHRASES = [
+    "大家好", "今天天氣不錯", "晚上一起吃飯嗎？", "這個功能已經上線了", "我剛剛看到消息",
+    "明天早上開會", "收到，謝謝", "哈哈哈哈", "有人在嗎", "週末去爬山吧",
+    "这个问题我来处理", "稍等一下", "代码已经提交了", "帮我看一下这个截图", "辛苦了",
+    "おはようございます", "よろしくお願いします", "了解です", "ありがとう",
+    "잘 부탁드립니다", "좋아요",
+]
+LATIN_PHRASES = [
+    "ok", "sounds good", "LGTM", "deploying now", "brb", "see you tomorrow",
+    "can you check the logs?", "thanks!", "lol", "meeting at 3pm",
+]
+EMOJI = ["😂", "👍", "🎉", "❤️", "🙏", "😅", "🔥", "✅"]
+NAMES = ["陳", "林", "黃", "張", "李", "王", "吳", "劉", "蔡", "楊", "Alice", "Bob", "Kenji", "Minji"]
+ROOM_NAMES = ["閒聊", "工程部", "前端", "後端", "設計", "產品", "午餐", "遊戲", "讀書會", "旅行", "Random", "General"]
+
+
+def message_text(rng: random.Random) -> str:
+    """生成一條消息：大部分是短句，少數是長段落"""
+    parts = rng.choices([1, 2, 3, 6, 12], weights=[45, 25, 15, 10, 5])[0]
+    words = []
+    for _ in range(parts):
+        pool = CJK_PHRASES if rng.random() < 0.75 else LATIN_PHRASES
+        words.append(rng.choice(pool))
+        if rng.random() < 0.15:
+            words.append(rng.choice(EMOJI))
+    separator = "，" if rng.random() < 0.6 else " "
+    return separator.join(words)
+
+
+def legacy_avatar(rng: random.Random, size_bytes: int) -> str:
+    """舊版客戶端直接上傳的 base64 頭像（內容是隨機字節，只用於模擬大小）"""
+    payload = rng.randbytes(size_bytes)
+    return "data:image/png;base64," + base64.b64encode(payload).decode()
+
+
+def avatar_for(rng: random.Random, name: str, index: int, base64_ratio: float, base64_size: int) -> str:
+    roll = rng.random()
+    if roll < base64_ratio:
+        return legacy_avatar(rng, base64_size)
+    if roll < base64_ratio + 0.2:
+        return f"/api/uploads/avatars/seed-{index}.webp"
+    return f"https://api.dicebear.com/7.x/initials/svg?seed={name}{index}"
+
+
+def insert_batches(conn, table, rows, batch_size: int):
+    for offset in range(0, len(rows), batch_size):
+        conn.execute(table.insert(), rows[offset:offset + batch_size])
+
+
+def seed(args) -> dict:
+    from app.auth import get_password_hash
+    from app.database import engine
+    from app.ids import generate_id
+    from app.migrations import run_migrations
+    from app.models import Message, Room, RoomMember, User, UserRelationship
+
+    rng = random.Random(args.seed)
+    run_migrations(engine)
+    stats = {}
+    started = time.perf_counter()
+    password_hash = get_password_hash(args.password)
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        if conn.execute(User.__table__.select().where(User.email == SEED_EMAIL.format(index=0))).first():
+            raise SystemExit("資料庫中已有合成數據（seed0@example.com），請使用新的資料庫")
+
+    # 用戶
+    users = []
+    for index in range(args.users):
+        name = f"{rng.choice(NAMES)}{index}"
+        users.append({
+            "id": generate_id(),
+            "name": name,
+            "email": SEED_EMAIL.format(index=index),
+            "password_hash": password_hash,
+            "avatar": avatar_for(rng, name, index, args.base64_avatar_ratio, args.base64_avatar_bytes),
+            "is_online": False,
+            "bio": rng.choice([None, "你好！", "後端工程師", "☕️"]),
+        })
+    with engine.begin() as conn:
+        insert_batches(conn, User.__table__, users, args.batch)
+    stats["users"] = len(users)
+
+    # 房間（約 20% 私有房間，密碼與用戶密碼相同）
+    rooms = []
+    for index in range(args.rooms):
+        is_private = rng.random() < 0.2
+        rooms.append({
+            "id": generate_id(),
+            "name": f"{rng.choice(ROOM_NAMES)} {index}",
+            "is_private": is_private,
+            "password_hash": password_hash if is_private else None,
+            "created_by": rng.choice(users)["id"],
+            "description": rng.choice([None, "歡迎加入", "Open to everyone"]),
+        })
+    with engine.begin() as conn:
+        insert_batches(conn, Room.__table__, rooms, args.batch)
+    stats["rooms"] = len(rooms)
+
+    # 房間成員：房間熱度呈長尾分佈，少數房間有大量成員
+    weights = [1 / (rank + 1) for rank in range(len(rooms))]
+    members = {}
+    for user in users:
+        joined = set()
+        for _ in range(min(args.rooms_per_user, len(rooms))):
+            joined.add(rng.choices(range(len(rooms)), weights=weights)[0])
+        members[user["id"]] = sorted(joined)
+    member_rows = [
+        {"id": generate_id(), "room_id": rooms[room_index]["id"], "user_id": user_id}
+        for user_id, room_indexes in members.items() for room_index in room_indexes
+    ]
+    with engine.begin() as conn:
+        insert_batches(conn, RoomMember.__table__, member_rows, args.batch)
+    stats["room_members"] = len(member_rows)
+
+    # 收藏和封鎖
+    relationship_rows = []
+    for user in users:
+        targets = rng.sample(users, min(args.relationships_per_user, len(users) - 1) if len(users) > 1 else 0)
+        for target in targets:
+            if target["id"] == user["id"]:
+                continue
+            relationship_rows.append({
+                "id": generate_id(),
+                "user_id": user["id"],
+                "target_id": target["id"],
+                "relationship_type": "blocked" if rng.random() < 0.1 else "favorite",
+            })
+    with engine.begin() as conn:
+        insert_batches(conn, UserRelationship.__table__, relationship_rows, args.batch)
+    stats["relationships"] = len(relationship_rows)
+
+    # 消息：時間戳在最近 --days 天內遞增，發送者是房間成員
+    room_members = {}
+    for user_id, room_indexes in members.items():
+        for room_index in room_indexes:
+            room_members.setdefault(room_index, []).append(user_id)
+    active_rooms = sorted(room_members)
+    room_weights = [weights[room_index] for room_index in active_rooms]
+    users_by_id = {user["id"]: user for user in users}
+    start_time = now - timedelta(days=args.days)
+    step = timedelta(days=args.days) / max(args.messages, 1)
+    batch = []
+    inserted = 0
+    with engine.begin() as conn:
+        for index in range(args.messages):
+            room_index = rng.choices(active_rooms, weights=room_weights)[0] if active_rooms else None
+            if room_index is None:
+                break
+            sender = users_by_id[rng.choice(room_members[room_index])]
+            is_image = rng.random() < 0.03
+            batch.append({
+                "id": generate_id(),
+                "room_id": rooms[room_index]["id"],
+                "sender_id": sender["id"],
+                "sender_name": sender["name"],
+                "sender_avatar": sender["avatar"],
+                "content": f"/api/uploads/messages/seed-{index}.webp" if is_image else message_text(rng),
+                "type": "image" if is_image else "text",
+                "timestamp": start_time + step * index,
+            })
+            if len(batch) >= args.batch:
+                conn.execute(Message.__table__.insert(), batch)
+                inserted += len(batch)
+                batch = []
+                if inserted % (args.batch * 50) == 0:
+                    print(f"[Seed]   {inserted} messages")
+        if batch:
+            conn.execute(Message.__table__.insert(), batch)
+            inserted += len(batch)
+    stats["messages"] = inserted
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成性能測試用的合成數據")
+    parser.add_argument("--url", required=True, help="資料庫連接字符串，例如 sqlite:///./bench.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--rooms-per-user", type=int, default=5)
+    parser.add_argument("--relationships-per-user", type=int, default=5)
+    parser.add_argument("--base64-avatar-ratio", type=float, default=0.1, help="使用舊版 base64 頭像的用戶比例")
+    parser.add_argument("--base64-avatar-bytes", type=int, default=30_000, help="base64 頭像解碼前的字節數")
+    parser.add_argument("--days", type=int, default=30, help="消息時間跨度（天）")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # 必須在導入 app.database 之前設置
+    os.environ["DATABASE_URL"] = args.url
+    stats = seed(args)
+    print(f"[Seed] Done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Worker 啟動時間基準測試：模擬 gunicorn 同時啟動 N 個 worker
+
+兩種模式：
+- cold：每個 worker 是獨立進程，各自導入 main（不使用 --preload）
+- preload：先在父進程導入 main 一次，再 fork N 個子進程（gunicorn --preload）
+
+每個 worker 記錄：
+- import_seconds：導入 main 的耗時（preload 模式下為父進程的一次導入）
+- startup_seconds：lifespan 啟動耗時
+- first_request_seconds：第一個請求（/health）和第一個資料庫請求（登入）的耗時
+- ready_seconds：從進程啟動/fork 到第一個資料庫請求完成
+以及所有 worker 就緒的總耗時、是否已載入 Pillow 等重型模塊。
+
+用法（在 backend 目錄下執行）：
+    python benchmarks/startup.py                          # SQLite 臨時文件，8 個 worker，兩種模式
+    python benchmarks/startup.py --workers 4 --modes preload
+    python benchmarks/startup.py --url "mysql+pymysql://root:@localhost/chat" --json startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+HEAVY_MODULES = ("PIL.Image", "msgpack")
+
+
+def serve_first_requests(app) -> dict:
+    """啟動 lifespan 並發送第一個請求，返回各階段耗時"""
+    from fastapi.testclient import TestClient
+
+    result = {}
+    start = time.perf_counter()
+    with TestClient(app) as client:
+        result["startup_seconds"] = time.perf_counter() - start
+        request_start = time.perf_counter()
+        client.get("/health")
+        result["first_request_seconds"] = time.perf_counter() - request_start
+        request_start = time.perf_counter()
+        client.post("/api/auth/login", json={"email": "nobody@example.com", "password": "x"})
+        result["first_db_request_seconds"] = time.perf_counter() - request_start
+    result["heavy_modules_loaded"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    return result
+
+
+def cold_worker():
+    """cold 模式的子進程入口：導入 main 並處理第一個請求，結果以 JSON 寫到 stdout"""
+    spawned_at = float(os.environ["BENCH_SPAWNED_AT"])
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+    result = serve_first_requests(main.app)
+    result["import_seconds"] = import_seconds
+    result["ready_seconds"] = time.time() - spawned_at
+    sys.stdout.write("\n" + json.dumps(result) + "\n")
+
+
+def run_cold(workers: int, env: dict) -> list:
+    spawned_at = time.time()
+    processes = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            cwd=BACKEND_DIR,
+            env={**env, "BENCH_SPAWNED_AT": str(spawned_at)},
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        for _ in range(workers)
+    ]
+    return [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in processes]
+
+
+def run_preload(workers: int) -> list:
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        forked_at = time.time()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            sys.stdout = open(os.devnull, "w")
+            result = serve_first_requests(main.app)
+            result["import_seconds"] = 0.0
+            result["ready_seconds"] = time.time() - forked_at
+            os.write(write_fd, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    for result in results:
+        result["master_import_seconds"] = import_seconds
+    return results
+
+
+def summarize(mode: str, results: list, wall_seconds: float) -> dict:
+    def avg(key):
+        return round(sum(result[key] for result in results) / len(results), 4)
+
+    return {
+        "mode": mode,
+        "workers": len(results),
+        "all_ready_seconds": round(wall_seconds, 3),
+        "avg_import_seconds": avg("import_seconds"),
+        "master_import_seconds": round(results[0].get("master_import_seconds", 0.0), 4),
+        "avg_startup_seconds": avg("startup_seconds"),
+        "avg_first_request_seconds": avg("first_request_seconds"),
+        "avg_first_db_request_seconds": avg("first_db_request_seconds"),
+        "max_ready_seconds": round(max(result["ready_seconds"] for result in results), 3),
+        "heavy_modules_loaded": sorted({name for result in results for name in result["heavy_modules_loaded"]}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker 啟動時間基準測試")
+    parser.add_argument("--url", help="資料庫連接字符串（默認使用已遷移的 SQLite 臨時文件）")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--modes", default="cold,preload", help="逗號分隔：cold,preload")
+    parser.add_argument("--json", help="將結果寫入 JSON 文件")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        cold_worker()
+        return
+
+    url = args.url
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_startup_'), 'chat.db')}"
+    env = {**os.environ, "DATABASE_URL": url}
+    subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    os.environ["DATABASE_URL"] = url
+
+    summaries = []
+    # preload 會在本進程導入 main，放在最後執行
+    modes = sorted((mode.strip() for mode in args.modes.split(",")), key=lambda mode: mode == "preload")
+    for mode in modes:
+        start = time.perf_counter()
+        results = run_preload(args.workers) if mode == "preload" else run_cold(args.workers, env)
+        summary = summarize(mode, results, time.perf_counter() - start)
+        summaries.append(summary)
+        print(json.dumps(summary, ensure_ascii=False))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"url": args.url or "sqlite (temporary file)", "results": summaries}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,8 @@
 import sys
 import pymysql
 from app.config import settings
-from app.database import engine, Base, SessionLocal
+from app.database import engine, SessionLocal
+from app.migrations import run_migrations
 from app.models import User, Room
 from app.auth import get_password_hash
 
@@ -33,10 +34,10 @@ def create_database():
 
 
 def create_tables():
-    """創建所有資料表"""
+    """創建所有資料表（執行版本化遷移）"""
     try:
-        Base.metadata.create_all(bind=engine)
-        print("✓ 資料表已創建")
+        run_migrations(engine)
+        print("✓ 資料表已創建並遷移到最新版本")
     except Exception as e:
         print(f"✗ 創建資料表失敗: {e}")
         sys.exit(1)
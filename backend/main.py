@@ -1,23 +1,52 @@
-from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi import FastAPI, WebSocket, HTTPException, Header, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
+import asyncio
+import os
+from typing import Optional
 import uvicorn
-from pathlib import Path
 
-from app.database import engine, Base
-from app.routers import auth, users, rooms, messages, realtime, upload
+from app.database import engine, read_replicas, replica_lag_monitor
+from app.migrations import current_version, head_version
+from app.routers import auth, users, rooms, messages, realtime, upload, bootstrap
 from app.websocket import websocket_manager, handle_websocket
+from app.presence import presence_service
+from app.heartbeat import heartbeat_scheduler
+from app.batching import event_batcher
+from app.metrics import metrics
+from app.message_cache import message_cache
+from app.room_purge import room_purger
+from app.blocklist import blocked_cache
+from app.loop_monitor import loop_monitor, LoadSheddingMiddleware
+from app.query_stats import QueryAccountingMiddleware, route_summary
+from app.profiler import profiler, ProfilingMiddleware, WORKER_PROFILE_PATH
 from app.config import settings
+from app.dependencies import require_debug_token
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: 創建資料表
-    Base.metadata.create_all(bind=engine)
+    # Startup: 資料庫結構由 migrate.py 在啟動 worker 之前統一遷移，這裡只檢查版本
+    schema_version, expected_version = current_version(engine), head_version()
+    if schema_version < expected_version:
+        print(f"[Startup] Database schema is at version {schema_version}, expected {expected_version}; run `python migrate.py`")
+    presence_service.start()
+    heartbeat_scheduler.start(websocket_manager)
+    event_batcher.start(websocket_manager)
+    room_purger.start()
+    loop_monitor.start()
+    replica_lag_monitor.start()
+    blocked_cache.start()
     yield
-    # Shutdown: 清理資源
-    pass
+    # Shutdown: 清理資源（寫入尚未持久化的在線狀態）
+    await room_purger.stop()
+    await heartbeat_scheduler.stop()
+    await presence_service.stop()
+    await event_batcher.stop()
+    await loop_monitor.stop()
+    await replica_lag_monitor.stop()
+    await blocked_cache.stop()
 
 
 app = FastAPI(
@@ -27,6 +56,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 按需採樣分析（帶 X-Profile-Token 的請求），未設置 PROFILING_TOKEN 時不註冊
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# 每個請求的查詢次數和資料庫時間（Server-Timing 響應頭、/api/debug/queries）
+app.add_middleware(QueryAccountingMiddleware)
+
+# 負載削減（事件循環過載時對非必要接口返回 503）
+# 需在 CORS 之前添加，由外層的 CORS 中間件為 503 響應加上跨域頭
+if settings.LOAD_SHED_ENABLED:
+    app.add_middleware(LoadSheddingMiddleware, monitor=loop_monitor)
+
 # CORS 配置
 app.add_middleware(
     CORSMiddleware,
@@ -48,14 +89,13 @@ app.include_router(rooms.router, prefix="/api/rooms", tags=["房間"])
 app.include_router(messages.router, prefix="/api/messages", tags=["消息"])
 app.include_router(realtime.router, prefix="/api/realtime", tags=["實時通信"])
 app.include_router(upload.router, prefix="/api/upload", tags=["文件上傳"])
+app.include_router(bootstrap.router, prefix="/api/bootstrap", tags=["啟動快照"])
 
 # 靜態文件服務（提供上傳的文件訪問）
 # 必須在其他路由之後註冊，使用裝飾器路由確保優先匹配
 # 使用絕對路徑，基於後端目錄，確保在不同工作目錄下都能正確訪問
+# 導入時不創建目錄、不打印：使用 --preload 時本模塊只在 master 進程導入一次，目錄由上傳接口按需創建
 upload_dir = settings.upload_dir_absolute
-upload_dir.mkdir(parents=True, exist_ok=True)
-print(f"[StaticFiles] Mounting uploads directory: {upload_dir}")
-print(f"[StaticFiles] Backend directory: {Path(__file__).parent.resolve()}")
 
 # 使用路由方式提供靜態文件服務（更可靠）
 # 注意：這個路由必須在 include_router 之後，這樣 FastAPI 會優先匹配它
@@ -107,6 +147,54 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/api/debug/metrics", dependencies=[Depends(require_debug_token)])
+async def debug_metrics():
+    """調試端點：當前 worker 的進程內指標"""
+    return {
+        **metrics.snapshot(),
+        "message_cache": message_cache.stats(),
+        "db_pool": {"primary": engine.pool.status(), **{replica.name: replica.engine.pool.status() for replica in read_replicas}}
+    }
+
+
+@app.get("/api/debug/queries", dependencies=[Depends(require_debug_token)])
+async def debug_queries():
+    """調試端點：當前 worker 每個路由的查詢次數和資料庫時間"""
+    return {
+        "pid": os.getpid(),
+        "slow_query_ms": settings.DB_SLOW_QUERY_MS,
+        "slow_queries": metrics.counters.get("db.slow_queries", 0),
+        "routes": route_summary()
+    }
+
+
+@app.post(WORKER_PROFILE_PATH)
+async def debug_profile(
+    seconds: float = Query(10.0, gt=0, description="採樣時長（秒），不超過 PROFILING_MAX_SECONDS"),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """調試端點：在指定時間內採樣當前 worker 的所有線程，輸出 folded stacks 文件（火焰圖）"""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+    seconds = min(seconds, profiler.max_seconds)
+    sampler = profiler.start()
+    if sampler is None:
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        filename = profiler.finish(sampler, "worker")
+    return {
+        "pid": os.getpid(),
+        "file": filename,
+        "seconds": round(sampler.duration, 2),
+        "samples": sampler.samples,
+        "stacks": len(sampler.counts)
+    }
+
+
 @app.get("/api/debug/uploads")
 async def debug_uploads():
     """調試端點：檢查上傳目錄和文件"""
@@ -135,5 +223,6 @@ async def debug_uploads():
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    from app.ws_protocol import CompressedWebSocketProtocol
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, ws=CompressedWebSocketProtocol)
 
@@ -0,0 +1,51 @@
+"""
+資料庫遷移命令（部署時在啟動 gunicorn 之前執行一次，見 deployment 的 ExecStartPre）
+
+用法（在 backend 目錄下執行）：
+    python migrate.py              # 執行所有未執行的遷移
+    python migrate.py --status     # 查看當前版本和待執行的遷移
+    python migrate.py --to 3       # 只遷移到指定版本
+    python migrate.py --redo 11    # 重新執行指定版本（例如設置 DB_ID_STORAGE=binary16 之後轉換 ID 欄位）
+
+所有遷移都是冪等的，已經手動執行過舊遷移腳本的資料庫也可以直接運行。
+"""
+import argparse
+import sys
+
+from app.database import engine
+from app.migrations import applied_versions, discover, run_migrations
+
+
+def show_status():
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    for version, name, _ in discover():
+        state = "applied" if version in done else "pending"
+        print(f"  {version:04d} {name:<30} {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="資料庫遷移")
+    parser.add_argument("--status", action="store_true", help="只顯示遷移狀態")
+    parser.add_argument("--to", type=int, help="遷移到指定版本（默認最新）")
+    parser.add_argument("--redo", type=int, help="重新執行指定版本（即使已經執行過）")
+    args = parser.parse_args()
+
+    print(f"資料庫: {engine.url.render_as_string(hide_password=True)}")
+    if args.status:
+        show_status()
+        return
+
+    try:
+        executed = run_migrations(engine, target=args.to, redo=args.redo)
+    except Exception as e:
+        print(f"[ERROR] 遷移失敗: {e}")
+        sys.exit(1)
+    if executed:
+        print(f"[OK] 已執行 {len(executed)} 個遷移")
+    else:
+        print("[OK] 資料庫已是最新版本")
+
+
+if __name__ == "__main__":
+    main()
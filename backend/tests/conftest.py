@@ -0,0 +1,122 @@
+"""
+測試配置：使用臨時 SQLite 資料庫代替 MySQL（必須在導入 app 之前設置 DATABASE_URL）
+在 backend 目錄下執行：python -m pytest
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_db_dir = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'primary.db')}"
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_db_dir, "uploads"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from app.database import engine
+    from app.migrations import run_migrations
+    run_migrations(engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    from app.database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def client(engine):
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register(client):
+    """註冊一個新用戶，返回 (用戶資料, 認證請求頭)"""
+    def _register(name: str = None):
+        name = name or f"user-{uuid.uuid4().hex[:8]}"
+        response = client.post("/api/auth/register", json={
+            "name": name, "email": f"{name}@example.com", "password": "password123"
+        })
+        assert response.status_code == 200, response.text
+        data = response.json()
+        return data["user"], {"Authorization": f"Bearer {data['access_token']}"}
+    return _register
+
+
+class FakeWebSocket:
+    """
+    WebSocket 替身：記錄接受、發送的事件（解析後的 JSON）和關閉碼
+    fail=True 時發送拋出異常（連接已斷開），hang=True 時發送一直等待（緩衝區已滿的慢連接）
+    """
+    def __init__(self, fail: bool = False, hang: bool = False):
+        self.fail = fail
+        self.hang = hang
+        self.accepted = False
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, frame):
+        if self.hang:
+            await asyncio.sleep(60)
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+class FakeManager:
+    """ConnectionManager 替身：記錄 send_event 和 disconnect；sockets 中的每個連接屬於不同用戶（u0、u1、...）"""
+    def __init__(self, sockets=()):
+        from app.connections import ConnectionRecord
+        self.sent = []
+        self.disconnected = []
+        self.active_connections = {f"u{index}": [ConnectionRecord(socket, f"u{index}")] for index, socket in enumerate(sockets)}
+
+    async def send_event(self, record, message):
+        self.sent.append((record, message))
+
+    def disconnect(self, record):
+        self.disconnected.append(record)
+
+
+@pytest.fixture
+def fake_websocket():
+    """FakeWebSocket 類：fake_websocket(fail=False, hang=False)"""
+    return FakeWebSocket
+
+
+@pytest.fixture
+def fake_manager():
+    """FakeManager 類：fake_manager(sockets=())"""
+    return FakeManager
+
+
+@pytest.fixture
+def make_record():
+    """創建使用 FakeWebSocket 的連接記錄：make_record(user_id="u1", fail=False, **ConnectionRecord 的其他參數)"""
+    from app.connections import ConnectionRecord
+
+    def _make_record(user_id: str = "u1", fail: bool = False, **options):
+        return ConnectionRecord(FakeWebSocket(fail=fail), user_id, **options)
+    return _make_record
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app import ratelimit
+from app.admission import CLOSE_POLICY_VIOLATION, CLOSE_TRY_AGAIN_LATER, AdmissionControl, admission_control
+from app.metrics import metrics
+
+
+@pytest.fixture
+def make_control():
+    """每個用戶 2 個、每個 worker 3 個連接，每個 IP 每秒 1 次、突發 2 次；參數可覆蓋"""
+    def _make_control(**overrides):
+        options = dict(max_per_user=2, max_per_worker=3, connect_rate_per_ip=1.0, connect_burst_per_ip=2, max_tracked_ips=2)
+        options.update(overrides)
+        return AdmissionControl(**options)
+    return _make_control
+
+
+def test_ip_rate_allows_burst_then_refills(monkeypatch, make_control):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    control = make_control()
+    assert control.allow_ip("1.1.1.1") and control.allow_ip("1.1.1.1")
+    assert control.check_before_auth("1.1.1.1", 0)[2] == "ip_rate"
+    # 其他 IP 不受影響
+    assert control.check_before_auth("2.2.2.2", 0) is None
+    now[0] += 1
+    assert control.allow_ip("1.1.1.1")
+    assert not control.allow_ip("1.1.1.1")
+
+
+def test_tracked_ips_are_bounded(make_control):
+    control = make_control(connect_burst_per_ip=1)
+    for ip in ("a", "b", "c"):
+        assert control.allow_ip(ip)
+    assert control._ip_buckets.size == 2
+    # 最久未出現的 IP 被淘汰，重新獲得完整的令牌桶
+    assert control.allow_ip("a")
+
+
+def test_zero_limits_disable_checks(make_control):
+    control = make_control(max_per_user=0, max_per_worker=0, connect_rate_per_ip=0)
+    for _ in range(10):
+        assert control.check_before_auth("1.1.1.1", 10**6) is None
+    assert control.check_user(10**6) is None
+    assert control.allow_ip("")
+
+
+def test_capacity_checks(make_control):
+    control = make_control()
+    assert control.check_before_auth("1.1.1.1", 2) is None
+    assert control.check_before_auth("1.1.1.1", 3) == (CLOSE_TRY_AGAIN_LATER, "Server at capacity", "worker_full")
+    assert control.check_user(1) is None
+    assert control.check_user(2)[0] == CLOSE_POLICY_VIOLATION
+
+
+def test_reject_accepts_then_closes_with_reason(make_control, fake_websocket):
+    control = make_control()
+    websocket = fake_websocket()
+    before = metrics.counters.get("websocket.admission.rejected.worker_full", 0)
+    asyncio.run(control.reject(websocket, control.check_before_auth("", 3)))
+    assert websocket.accepted
+    assert websocket.closed == (CLOSE_TRY_AGAIN_LATER, "Server at capacity")
+    assert metrics.counters["websocket.admission.rejected.worker_full"] - before == 1
+
+
+def test_user_connection_limit_on_websocket(client, register, monkeypatch):
+    _, headers = register()
+    token = headers["Authorization"].split()[1]
+    monkeypatch.setattr(admission_control, "max_per_user", 1)
+    monkeypatch.setattr(admission_control, "rate", 0)
+    with client.websocket_connect(f"/ws?token={token}"):
+        with client.websocket_connect(f"/ws?token={token}") as second:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                second.receive_json()
+    assert closed.value.code == CLOSE_POLICY_VIOLATION
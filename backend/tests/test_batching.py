@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.batching import EventBatcher
+from app.codec import ENCODING_JSON, encode_event
+
+
+@pytest.fixture
+def batched_record(make_record):
+    """合併發送的連接記錄：batched_record(fail=False)"""
+    return lambda fail=False: make_record(fail=fail, batched=True)
+
+
+def _enqueue(batcher, record, message):
+    batcher.enqueue(record, message, encode_event(message, ENCODING_JSON))
+
+
+MESSAGE = {"type": "NEW_MESSAGE", "payload": {"id": "m1"}}
+ONLINE = {"type": "USER_UPDATE", "payload": {"id": "u2", "name": "Bob", "isOnline": True}}
+LEFT = {"type": "USER_LEFT", "payload": {"userId": "u2"}}
+ROOM = {"type": "ROOM_UPDATED", "payload": {"id": "r1"}}
+
+
+def test_window_sends_one_array_frame_in_priority_order(batched_record):
+    batcher = EventBatcher(window_ms=10)
+    record = batched_record()
+
+    async def scenario():
+        _enqueue(batcher, record, ONLINE)
+        _enqueue(batcher, record, ROOM)
+        _enqueue(batcher, record, LEFT)
+        _enqueue(batcher, record, MESSAGE)
+        # 窗口結束前不發送
+        assert record.websocket.sent == []
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    # 同一用戶的上線和離線合併為最終狀態，保留資料欄位
+    assert record.websocket.sent == [[
+        MESSAGE,
+        ROOM,
+        {"type": "USER_UPDATE", "payload": {"id": "u2", "name": "Bob", "isOnline": False}},
+    ]]
+    assert record.pending is None and batcher._task is None
+
+
+def test_single_event_is_sent_as_object(batched_record):
+    batcher = EventBatcher(window_ms=10)
+    record = batched_record()
+
+    async def scenario():
+        _enqueue(batcher, record, MESSAGE)
+        await batcher.stop()
+
+    asyncio.run(scenario())
+    assert record.websocket.sent == [MESSAGE]
+
+
+def test_discarded_connection_sends_nothing(batched_record):
+    batcher = EventBatcher(window_ms=10)
+    record = batched_record()
+
+    async def scenario():
+        _enqueue(batcher, record, MESSAGE)
+        batcher.discard(record)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert record.websocket.sent == []
+
+
+def test_failed_send_disconnects_only_that_connection(batched_record, fake_manager):
+    batcher = EventBatcher(window_ms=10)
+    manager = fake_manager()
+    batcher.start(manager)
+    broken, healthy = batched_record(fail=True), batched_record()
+
+    async def scenario():
+        _enqueue(batcher, broken, MESSAGE)
+        _enqueue(batcher, healthy, MESSAGE)
+        await batcher.flush()
+
+    asyncio.run(scenario())
+    assert manager.disconnected == [broken]
+    assert healthy.websocket.sent == [MESSAGE]
+    assert not broken.sending
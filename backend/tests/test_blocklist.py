@@ -0,0 +1,137 @@
+import asyncio
+
+from sqlalchemy import event
+
+from app import blocklist
+from app.blocklist import EMPTY, BlockedCache, blocked_cache, mark_changed
+from app.database import SessionLocal
+from app.models import UserRelationship
+from app.websocket import ConnectionManager
+
+
+def _block(client, user, headers, target):
+    response = client.post(f"/api/users/{user['id']}/block/{target['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_load_many_queries_only_missing_users(client, register, db):
+    user, headers = register()
+    target, _ = register()
+    other, _ = register()
+    _block(client, user, headers, target)
+    cache = BlockedCache(max_users=10, ttl_seconds=60)
+    cache._store(other["id"], EMPTY)
+
+    statements = []
+    engine = db.get_bind()
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = cache.load_many(db, [user["id"], other["id"]])
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert result == {user["id"]: frozenset({target["id"]}), other["id"]: EMPTY}
+    assert len(statements) == 1
+
+
+def test_entries_expire_and_are_evicted_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(blocklist.time, "monotonic", lambda: now[0])
+    cache = BlockedCache(max_users=2, ttl_seconds=10)
+    cache._store("a", EMPTY)
+    cache._store("b", EMPTY)
+    assert cache.peek("a") == EMPTY
+    cache._store("c", EMPTY)
+    # b 最久未使用，被淘汰
+    assert cache.peek("b") is None and cache.peek("a") == EMPTY
+
+    now[0] += 11
+    assert cache.peek("a") is None and cache.peek("c") is None
+
+
+def test_block_invalidates_cache_and_filters_history(client, register):
+    user, headers = register()
+    target, target_headers = register()
+    room = client.post("/api/rooms", json={"name": "blocklist"}, headers=headers).json()
+    client.post(f"/api/rooms/{room['id']}/join", json={}, headers=target_headers)
+    client.post("/api/messages", json={"room_id": room["id"], "content": "hi"}, headers=target_headers)
+
+    def contents():
+        response = client.get(f"/api/messages/rooms/{room['id']}", headers=headers)
+        return [message["content"] for message in response.json()]
+
+    assert contents() == ["hi"]
+    assert blocked_cache.peek(user["id"]) == EMPTY
+    _block(client, user, headers, target)
+    assert blocked_cache.peek(user["id"]) is None
+    assert contents() == []
+
+
+def test_room_fan_out_skips_receivers_who_blocked_sender(client, register, fake_websocket):
+    user, headers = register()
+    sender, _ = register()
+    bystander, _ = register()
+    _block(client, user, headers, sender)
+    manager = ConnectionManager()
+    sockets = {user["id"]: fake_websocket(), bystander["id"]: fake_websocket()}
+
+    async def scenario():
+        for user_id, websocket in sockets.items():
+            await manager.connect(websocket, user_id)
+            await manager.join_room(user_id, "room-b")
+        await manager.broadcast_to_room({"type": "NEW_MESSAGE", "payload": {}}, "room-b", sender_id=sender["id"])
+
+    asyncio.run(scenario())
+    assert sockets[user["id"]].sent == []
+    assert sockets[bystander["id"]].sent == [{"type": "NEW_MESSAGE", "payload": {}}]
+
+
+def _block_on_other_worker(user, target):
+    """另一個 worker 處理的封鎖：直接寫資料庫，不經過本進程的快取"""
+    db = SessionLocal()
+    try:
+        db.add(UserRelationship(user_id=user["id"], target_id=target["id"], relationship_type="blocked"))
+        mark_changed(db, user["id"])
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_block_on_other_worker_is_seen_by_next_request(client, register):
+    user, headers = register()
+    target, target_headers = register()
+    room = client.post("/api/rooms", json={"name": "blocklist-workers"}, headers=headers).json()
+    client.post(f"/api/rooms/{room['id']}/join", json={}, headers=target_headers)
+    client.post("/api/messages", json={"room_id": room["id"], "content": "hi"}, headers=target_headers)
+
+    def contents():
+        response = client.get(f"/api/messages/rooms/{room['id']}", headers=headers)
+        return [message["content"] for message in response.json()]
+
+    assert contents() == ["hi"] and blocked_cache.peek(user["id"]) == EMPTY
+    _block_on_other_worker(user, target)
+    assert contents() == []
+    assert blocked_cache.peek(user["id"]) == frozenset({target["id"]})
+
+
+def test_sync_drops_entries_changed_on_other_workers(register, db):
+    user, _ = register()
+    target, _ = register()
+    other, _ = register()
+    cache = BlockedCache(max_users=10, ttl_seconds=60)
+    cache.load_many(db, [user["id"], other["id"]])
+    db.rollback()
+
+    async def scenario():
+        await cache.sync()
+        _block_on_other_worker(user, target)
+        await cache.sync()
+
+    asyncio.run(scenario())
+    # 扇出時重新載入，其他用戶的條目不受影響
+    assert cache.peek(user["id"]) is None and cache.peek(other["id"]) == EMPTY
+    assert cache.ensure_loaded([user["id"]]) == {user["id"]: frozenset({target["id"]})}
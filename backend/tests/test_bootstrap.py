@@ -0,0 +1,49 @@
+from app.websocket import load_messages_after
+
+
+def _send(client, headers, room_id, content):
+    response = client.post("/api/messages", json={"room_id": room_id, "content": content}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_bootstrap_returns_everything_for_startup(client, register):
+    user, headers = register()
+    blocked, _ = register()
+    friend, _ = register()
+    assert client.post(f"/api/users/{user['id']}/block/{blocked['id']}", headers=headers).status_code == 200
+    assert client.post(f"/api/users/{user['id']}/favorites/{friend['id']}", headers=headers).status_code == 200
+    room = client.post("/api/rooms", json={"name": "bootstrap"}, headers=headers).json()
+    for index in range(3):
+        last = _send(client, headers, room["id"], f"m{index}")
+
+    response = client.get("/api/bootstrap", params={"roomId": room["id"], "limit": 2}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+
+    assert data["user"]["id"] == user["id"]
+    assert data["user"]["blocked"] == [blocked["id"]]
+    assert data["user"]["favorites"] == [friend["id"]]
+    assert data["users"][0]["id"] == user["id"]
+    user_ids = {entry["id"] for entry in data["users"]}
+    assert friend["id"] in user_ids and blocked["id"] not in user_ids
+    assert room["id"] in {entry["id"] for entry in data["rooms"]}
+    assert [message["content"] for message in data["messages"]] == ["m1", "m2"]
+    assert data["cursor"]["last_message_id"] == last["id"]
+
+
+def test_cursor_resumes_without_gaps(client, register, db):
+    _, headers = register()
+    room = client.post("/api/rooms", json={"name": "resume"}, headers=headers).json()
+    _send(client, headers, room["id"], "before")
+    cursor = client.get("/api/bootstrap", headers=headers).json()["cursor"]
+
+    after = [_send(client, headers, room["id"], f"after{index}")["id"] for index in range(2)]
+    resumed = load_messages_after(db, cursor["last_message_id"], room_ids=[room["id"]])
+    assert [message.id for message in resumed] == after
+
+
+def test_unknown_room_is_not_found(client, register):
+    _, headers = register()
+    response = client.get("/api/bootstrap", params={"roomId": "missing-room"}, headers=headers)
+    assert response.status_code == 404
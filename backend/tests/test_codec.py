@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from websockets.frames import OP_TEXT, Frame
+
+from app import codec
+from app.codec import ENCODING_JSON, ENCODING_MSGPACK, encode_event, join_frames, negotiate_encoding
+from app.config import settings
+from app.metrics import metrics
+from app.ws_protocol import TimedPerMessageDeflate, build_deflate_factory
+
+# msgpack 是可選依賴（pip install .[msgpack]）
+requires_msgpack = pytest.mark.skipif(codec.msgpack is None, reason="msgpack is not installed")
+
+EVENT = {"type": "NEW_MESSAGE", "payload": {"id": "m1", "content": "你好"}}
+
+
+def test_negotiation_falls_back_to_json(monkeypatch):
+    assert negotiate_encoding(None) == ENCODING_JSON
+    assert negotiate_encoding("xml") == ENCODING_JSON
+    monkeypatch.setattr(codec, "msgpack", None)
+    assert negotiate_encoding("msgpack") == ENCODING_JSON
+
+
+def test_json_frame_is_compact_text():
+    frame = encode_event(EVENT, ENCODING_JSON)
+    assert frame == '{"type":"NEW_MESSAGE","payload":{"id":"m1","content":"你好"}}'
+    assert json.loads(frame) == EVENT
+
+
+@requires_msgpack
+def test_msgpack_frame_is_binary_and_smaller():
+    assert negotiate_encoding("msgpack") == ENCODING_MSGPACK
+    frame = encode_event(EVENT, ENCODING_MSGPACK)
+    assert isinstance(frame, bytes)
+    assert codec.msgpack.unpackb(frame, raw=False) == EVENT
+    assert len(frame) < len(encode_event(EVENT, ENCODING_JSON).encode())
+
+
+def test_joined_frames_decode_as_arrays():
+    other = {"type": "TYPING", "payload": {"userId": "u1"}}
+    joined = join_frames([encode_event(EVENT, ENCODING_JSON), encode_event(other, ENCODING_JSON)], ENCODING_JSON)
+    assert json.loads(joined) == [EVENT, other]
+
+
+@requires_msgpack
+def test_joined_msgpack_frames_decode_as_arrays():
+    other = {"type": "TYPING", "payload": {"userId": "u1"}}
+    joined = join_frames([encode_event(EVENT, ENCODING_MSGPACK), encode_event(other, ENCODING_MSGPACK)], ENCODING_MSGPACK)
+    assert codec.msgpack.unpackb(joined, raw=False) == [EVENT, other]
+
+
+def test_deflate_uses_tuned_window_and_records_ratio():
+    response, extension = build_deflate_factory().process_request_params([("client_max_window_bits", None)], [])
+    assert isinstance(extension, TimedPerMessageDeflate)
+    assert ("server_max_window_bits", str(settings.WS_COMPRESSION_SERVER_MAX_WINDOW_BITS)) in response
+    assert ("client_max_window_bits", str(settings.WS_COMPRESSION_CLIENT_MAX_WINDOW_BITS)) in response
+
+    before_in = metrics.counters.get("websocket.deflate.bytes_in", 0)
+    before_out = metrics.counters.get("websocket.deflate.bytes_out", 0)
+    data = encode_event(EVENT, ENCODING_JSON).encode() * 20
+    encoded = extension.encode(Frame(OP_TEXT, data))
+    assert encoded.rsv1 and len(encoded.data) < len(data)
+    assert metrics.counters["websocket.deflate.bytes_in"] - before_in == len(data)
+    assert metrics.counters["websocket.deflate.bytes_out"] - before_out == len(encoded.data)
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.connections import append_record, remove_record
+from app.metrics import metrics
+from app.websocket import ConnectionManager
+
+
+def test_record_has_no_instance_dict(make_record):
+    record = make_record()
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(AttributeError):
+        record.extra = 1
+
+
+def test_swap_remove_keeps_indexes_consistent(make_record):
+    records = []
+    first, second, third, fourth = (make_record() for _ in range(4))
+    for record in (first, second, third, fourth):
+        append_record(records, record)
+
+    assert remove_record(records, second)
+    # 最後一個記錄填補空位
+    assert records == [first, fourth, third]
+    assert [record.index for record in records] == [0, 1, 2]
+    assert second.index == -1
+
+    assert remove_record(records, third)
+    assert records == [first, fourth]
+    assert remove_record(records, first) and remove_record(records, fourth)
+    assert records == []
+
+
+def test_remove_rejects_records_not_in_list(make_record):
+    records, others = [], []
+    mine, foreign = make_record(), make_record()
+    append_record(records, mine)
+    append_record(others, foreign)
+    # 下標相同但屬於另一個列表
+    assert not remove_record(records, foreign)
+    assert remove_record(records, mine)
+    assert not remove_record(records, mine)
+    assert others == [foreign] and foreign.index == 0
+
+
+def test_manager_disconnect_is_idempotent_and_cleans_up_user(fake_websocket):
+    manager = ConnectionManager()
+
+    async def connect_tabs():
+        return [await manager.connect(fake_websocket(), "u1") for _ in range(3)]
+
+    tabs = asyncio.run(connect_tabs())
+    manager.restore_user_rooms("u1", ["room-a"])
+    assert manager.connection_count == 3
+    assert all(record.slot >= 0 for record in tabs)
+
+    manager.disconnect(tabs[0])
+    manager.disconnect(tabs[0])
+    assert manager.connection_count == 2
+    assert metrics.gauges["websocket.connections"] == 2
+    assert manager.active_connections["u1"] == [tabs[2], tabs[1]]
+    assert tabs[0].slot == -1
+    assert "u1" in manager.room_users["room-a"]
+
+    manager.disconnect(tabs[1])
+    manager.disconnect(tabs[2])
+    assert manager.connection_count == 0
+    assert "u1" not in manager.active_connections
+    assert "u1" not in manager.user_rooms and "room-a" not in manager.room_users
+    assert not any("u1" in subscribers for subscribers in manager.topic_subscribers.values())
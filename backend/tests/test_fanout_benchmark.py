@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fanout import COMPARED_METRICS, SCENARIOS, compare
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(*extra: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [
+            sys.executable, "benchmarks/fanout.py", "--connections", "40", "--tabs", "2",
+            "--slow-fraction", "0.1", "--slow-delay", "0.0005", "--fail-fraction", "0.05",
+            "--events", "2", "--burst", "4", "--storm", "5", *extra
+        ],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120,
+        env={key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    )
+
+
+def test_every_scenario_reports_metrics():
+    output = os.path.join(tempfile.mkdtemp(prefix="chat-fanout-"), "fanout.json")
+    result = _run("--json", output)
+    assert result.returncode == 0, result.stderr
+    with open(output, encoding="utf-8") as f:
+        data = json.load(f)
+
+    results = {entry["scenario"]: entry for entry in data["results"]}
+    assert list(results) == list(SCENARIOS)
+    for entry in results.values():
+        for metric in COMPARED_METRICS:
+            assert metric in entry
+        # 發送失敗的連接不算接收者
+        assert 0 < entry["recipients_per_event"] < 40
+    assert results["room"]["message_p50_ms"] > 0
+    assert results["burst"]["frames_per_recipient"] > results["room"]["frames_per_recipient"]
+
+
+def test_baseline_regression_fails_the_run():
+    directory = tempfile.mkdtemp(prefix="chat-fanout-")
+    baseline = os.path.join(directory, "baseline.json")
+    with open(baseline, "w", encoding="utf-8") as f:
+        json.dump({"results": [{"scenario": "room", "frames_per_recipient": 0.1}]}, f)
+    result = _run("--scenarios", "room", "--baseline", baseline)
+    assert result.returncode == 1
+    assert "[Regression] room.frames_per_recipient" in result.stdout
+
+
+def test_compare_only_flags_metrics_beyond_tolerance():
+    baseline = {"results": [{"scenario": "room", "event_p50_ms": 10.0, "frames_per_recipient": 1.0}]}
+    current = {"results": [
+        {"scenario": "room", "event_p50_ms": 11.9, "frames_per_recipient": 1.5,
+         "cpu_us_per_recipient": 5.0, "bytes_per_connection": 900},
+        {"scenario": "storm", "event_p50_ms": 99.0, "frames_per_recipient": 9.0,
+         "cpu_us_per_recipient": 5.0, "bytes_per_connection": 900},
+    ]}
+    assert compare(current, baseline, 0.2) == [("room", "frames_per_recipient", 1.0, 1.5)]
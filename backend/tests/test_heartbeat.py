@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.heartbeat import HeartbeatScheduler
+
+
+@pytest.fixture
+def scheduler():
+    return HeartbeatScheduler(interval_seconds=30, timeout_seconds=75, wheel_slots=4)
+
+
+def test_register_goes_to_last_checked_slot_and_unregister_swaps(scheduler, make_record):
+    records = [make_record() for _ in range(3)]
+    for record in records:
+        scheduler.register(record)
+    assert all(record.slot == 3 for record in records)
+    assert scheduler.tracked == 3
+
+    scheduler.unregister(records[0])
+    slot = scheduler.slots[3]
+    assert slot == [records[2], records[1]]
+    assert [record.slot_index for record in slot] == [0, 1]
+    assert records[0].slot == -1 and scheduler.tracked == 2
+    # 重複移除無副作用
+    scheduler.unregister(records[0])
+    assert scheduler.tracked == 2
+
+
+def test_idle_connection_is_pinged_and_dead_one_reaped(scheduler, make_record, fake_manager):
+    manager = fake_manager()
+    scheduler._manager = manager
+    active, idle, dead = make_record(), make_record(), make_record()
+    for record in (active, idle, dead):
+        scheduler.register(record)
+    idle.last_seen -= 40
+    dead.last_seen -= 80
+
+    asyncio.run(scheduler._check_slot(scheduler.slots[3]))
+    assert [(record, message) for record, message in manager.sent] == [(idle, {"type": "ping"})]
+    assert manager.disconnected == [dead]
+    assert dead.websocket.closed == (1001, "Heartbeat timeout")
+    assert dead.slot == -1 and scheduler.tracked == 2
+
+
+def test_failed_ping_reaps_connection(scheduler, make_record, fake_manager):
+    class BrokenManager(fake_manager):
+        async def send_event(self, record, message):
+            raise ConnectionResetError()
+
+    manager = scheduler._manager = BrokenManager()
+    record = make_record()
+    scheduler.register(record)
+    record.last_seen -= 40
+
+    asyncio.run(scheduler._check_slot(scheduler.slots[record.slot]))
+    assert manager.disconnected == [record]
+
+
+def test_each_connection_is_checked_once_per_round(make_record, fake_manager):
+    scheduler = HeartbeatScheduler(interval_seconds=0.08, timeout_seconds=0.01, wheel_slots=4)
+    manager = fake_manager()
+    record = make_record()
+
+    async def scenario():
+        scheduler.start(manager)
+        scheduler.register(record)
+        # 新連接放在剛檢查過的槽位：一輪之內不會被檢查
+        await asyncio.sleep(scheduler.interval * 0.5)
+        assert manager.disconnected == []
+        await asyncio.sleep(scheduler.interval * 1.5)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert manager.disconnected == [record]
@@ -0,0 +1,57 @@
+import time
+import uuid
+
+from sqlalchemy import String
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import ids
+from app.config import settings
+from app.ids import CompactUUID, generate_id, id_type, uuid7
+
+
+def _timestamp_ms(value: uuid.UUID) -> int:
+    return value.int >> 80
+
+
+def test_uuid7_layout():
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before <= _timestamp_ms(value) <= before + 1000
+
+
+def test_ids_sort_in_generation_order():
+    generated = [generate_id() for _ in range(5000)]
+    assert sorted(generated) == generated
+    assert len(set(generated)) == len(generated)
+
+
+def test_counter_overflow_borrows_next_millisecond(monkeypatch):
+    frozen = (time.time_ns() // 1_000_000 + 10_000) * 1_000_000
+    monkeypatch.setattr(ids.time, "time_ns", lambda: frozen)
+    # 測試結束後恢復生成器狀態，避免之後的 ID 帶上未來的時間戳
+    monkeypatch.setattr(ids, "_last_ms", ids._last_ms)
+    monkeypatch.setattr(ids, "_counter", ids._counter)
+    generated = [uuid7() for _ in range(5000)]
+    # 同一毫秒最多 4096 個，之後借用下一毫秒，仍然嚴格遞增
+    assert [value.int for value in generated] == sorted(value.int for value in generated)
+    assert _timestamp_ms(generated[-1]) > _timestamp_ms(generated[0])
+
+
+def test_compact_uuid_is_binary_on_mysql_only():
+    column = CompactUUID()
+    value = generate_id()
+    stored = column.process_bind_param(value, mysql.dialect())
+    assert stored == uuid.UUID(value).bytes and len(stored) == 16
+    assert column.process_result_value(stored, mysql.dialect()) == value
+    # 非法 ID 不匹配任何記錄，而不是報錯
+    assert column.process_bind_param("not-a-uuid", mysql.dialect()) == b""
+    assert column.process_bind_param(value, sqlite.dialect()) == value
+
+
+def test_id_type_follows_storage_setting(monkeypatch):
+    monkeypatch.setattr(settings, "DB_ID_STORAGE", "binary16")
+    assert isinstance(id_type(), CompactUUID)
+    monkeypatch.setattr(settings, "DB_ID_STORAGE", "char36")
+    assert isinstance(id_type(), String) and id_type().length == 36
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from app import loop_monitor as loop_monitor_module
+from app.loop_monitor import LoadSheddingMiddleware, LoopLagMonitor, shed_route
+from app.config import settings
+from app.metrics import metrics
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("GET", "/api/messages/search", "search"),
+    ("GET", "/api/users", "user_list"),
+    ("GET", "/api/users/", "user_list"),
+    ("GET", "/api/users/u1", None),
+    ("POST", "/api/messages/search", None),
+    ("GET", "/api/debug/queries", "debug"),
+    ("GET", "/api/debug/metrics", None),
+    ("POST", "/api/messages", None),
+])
+def test_only_expensive_routes_are_shed(method, path, expected):
+    assert shed_route(method, path) == expected
+
+
+def test_blocked_loop_is_recorded_and_held(monkeypatch):
+    monitor = LoopLagMonitor(interval_seconds=0.01, shed_lag_ms=50, shed_hold_seconds=5)
+    stalls = metrics.counters.get("loop.stalls", 0)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.02)
+        assert not monitor.overloaded()
+        # 同步阻塞事件循環（例如在循環上執行 bcrypt）
+        time.sleep(0.1)
+        # 採樣任務還沒喚醒，但預期喚醒時間已經過了閾值
+        assert monitor.overloaded()
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert metrics.counters["loop.stalls"] - stalls == 1
+    assert metrics.summaries["loop.lag_seconds"]["max"] >= 0.05
+
+    # 保持期內持續削減，之後恢復
+    assert monitor.overloaded()
+    now = time.monotonic() + 6
+    monkeypatch.setattr(loop_monitor_module.time, "monotonic", lambda: now)
+    assert not monitor.overloaded()
+    assert monitor.retry_after == 5
+
+
+class Overloaded:
+    retry_after = 3
+
+    def overloaded(self):
+        return True
+
+
+def _call(middleware, scope):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+def test_middleware_rejects_only_shed_routes_when_overloaded():
+    passed = []
+
+    async def app(scope, receive, send):
+        passed.append(scope["path"])
+
+    middleware = LoadSheddingMiddleware(app, monitor=Overloaded())
+    before = metrics.counters.get("loadshed.rejected.search", 0)
+    sent = _call(middleware, {"type": "http", "method": "GET", "path": "/api/messages/search"})
+    assert sent[0]["status"] == 503
+    assert (b"retry-after", b"3") in sent[0]["headers"]
+    assert metrics.counters["loadshed.rejected.search"] - before == 1
+
+    _call(middleware, {"type": "http", "method": "POST", "path": "/api/messages"})
+    _call(middleware, {"type": "websocket", "path": "/ws"})
+    assert passed == ["/api/messages", "/ws"]
+
+
+def test_metrics_endpoint_requires_debug_token(client, monkeypatch):
+    assert client.get("/api/debug/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "DEBUG_TOKEN", "secret")
+    assert client.get("/api/debug/metrics").status_code == 403
+    assert client.get("/api/debug/metrics", headers={"X-Debug-Token": "wrong"}).status_code == 403
+    response = client.get("/api/debug/metrics", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 200 and "db_pool" in response.json()
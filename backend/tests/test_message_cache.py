@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from app.message_cache import MessageTailCache, estimate_size, to_response
+from app.models import Message, Room, utcnow
+
+
+def _cache(room_capacity=3, max_bytes=10 ** 6, ttl_seconds=60):
+    return MessageTailCache(room_capacity=room_capacity, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+
+def _room_with_messages(client, register, db, count):
+    user, headers = register()
+    room = client.post("/api/rooms", json={"name": "cache"}, headers=headers).json()
+    for index in range(count):
+        response = client.post("/api/messages", json={"room_id": room["id"], "content": f"m{index}"}, headers=headers)
+        assert response.status_code == 200, response.text
+    return user, headers, room
+
+
+def _insert_elsewhere(db, room_id, user, content, delay_seconds=1):
+    """模擬其他 worker 寫入的消息（不經過本進程的快取）；delay_seconds 為 None 時使用資料庫的默認時間戳"""
+    message = Message(
+        room_id=room_id, sender_id=user["id"], sender_name=user["name"], sender_avatar="", content=content
+    )
+    if delay_seconds is not None:
+        message.timestamp = utcnow() + timedelta(seconds=delay_seconds)
+    db.add(message)
+    db.commit()
+    return message.id
+
+
+def test_tail_keeps_latest_messages_and_completeness(client, register, db):
+    _, _, room = _room_with_messages(client, register, db, 4)
+    cache = _cache(room_capacity=3)
+
+    assert [msg.content for msg in cache.get_recent(db, room["id"], 2)] == ["m2", "m3"]
+    # 需要全部歷史但快取不完整時交給調用方查詢資料庫
+    assert cache.get_recent(db, room["id"]) is None
+    assert cache.get_recent(db, room["id"], 5) is None
+
+
+def test_append_rolls_tail_and_tracks_bytes(client, register, db):
+    _, _, room = _room_with_messages(client, register, db, 2)
+    cache = _cache(room_capacity=2)
+    cache.get_recent(db, room["id"], 2)
+
+    newest = db.query(Message).filter(Message.room_id == room["id"]).first()
+    appended = to_response(newest).model_copy(update={"id": "appended", "content": "m9"})
+    cache.append(appended, cache._rooms[room["id"]].messages[-1].id)
+
+    tail = cache._rooms[room["id"]]
+    assert [msg.content for msg in tail.messages][-1] == "m9"
+    assert len(tail.messages) == 2 and not tail.complete
+    assert cache.total_bytes == tail.size == sum(estimate_size(msg) for msg in tail.messages)
+
+
+def test_lru_evicts_least_recently_used_room(client, register, db):
+    _, _, first = _room_with_messages(client, register, db, 1)
+    _, _, second = _room_with_messages(client, register, db, 1)
+    probe = _cache()
+    probe.get_recent(db, first["id"], 1)
+    one_room = probe.total_bytes
+
+    cache = _cache(max_bytes=one_room + 1)
+    cache.get_recent(db, first["id"], 1)
+    cache.get_recent(db, second["id"], 1)
+    assert list(cache._rooms) == [second["id"]]
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_message_from_another_worker_is_visible_immediately(client, register, db):
+    user, _, room = _room_with_messages(client, register, db, 2)
+    cache = _cache(room_capacity=10)
+    assert [msg.content for msg in cache.get_recent(db, room["id"], 10)] == ["m0", "m1"]
+
+    _insert_elsewhere(db, room["id"], user, "from-worker-b")
+    assert [msg.content for msg in cache.get_recent(db, room["id"], 10)] == ["m0", "m1", "from-worker-b"]
+    assert cache.stale == 1
+
+
+def test_cache_ahead_of_database_is_served(client, register, db):
+    _, _, room = _room_with_messages(client, register, db, 1)
+    cache = _cache(room_capacity=10)
+    cache.get_recent(db, room["id"], 10)
+    # 本 worker 剛追加、資料庫（唯讀副本）尚未看到的消息不會因校驗被丟棄
+    tail_message = cache._rooms[room["id"]].messages[-1]
+    cache.append(tail_message.model_copy(update={"id": "local-only"}), tail_message.id)
+
+    assert cache.get_recent(db, room["id"], 10)[-1].id == "local-only"
+    assert cache.stale == 0
+
+
+def test_send_after_unseen_message_from_another_worker(client, register, db):
+    user, headers, room = _room_with_messages(client, register, db, 1)
+    history = lambda: [msg["content"] for msg in client.get(f"/api/messages/rooms/{room['id']}", headers=headers).json()]
+    assert history() == ["m0"]
+
+    # 其他 worker 寫入的消息還不在本 worker 的快取中，隨後本 worker 發送一條新消息
+    _insert_elsewhere(db, room["id"], user, "from-other-worker", delay_seconds=None)
+    response = client.post("/api/messages", json={"room_id": room["id"], "content": "mine-later"}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    assert history() == ["m0", "from-other-worker", "mine-later"]
+
+
+def test_append_drops_tail_with_gap(client, register, db):
+    _, _, room = _room_with_messages(client, register, db, 1)
+    cache = _cache(room_capacity=10)
+    cache.get_recent(db, room["id"], 10)
+    tail_message = cache._rooms[room["id"]].messages[-1]
+
+    cache.append(tail_message.model_copy(update={"id": "after-gap"}), "unseen")
+    assert not cache.has_room(room["id"]) and cache.total_bytes == 0
+    assert cache.stale == 1
+
+
+def test_room_deleted_on_another_worker_is_not_served_from_cache(client, register, db):
+    _, headers, room = _room_with_messages(client, register, db, 1)
+    assert client.get(f"/api/messages/rooms/{room['id']}", headers=headers).status_code == 200
+
+    # 另一個 worker 軟刪除了房間：本 worker 的快取沒有被清除
+    db.query(Room).filter(Room.id == room["id"]).update({Room.deleted_at: utcnow()})
+    db.commit()
+
+    assert client.get(f"/api/messages/rooms/{room['id']}", headers=headers).status_code == 404
+    response = client.get("/api/bootstrap", params={"roomId": room["id"]}, headers=headers)
+    assert response.status_code == 404
@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import Base
+from app.migrations import current_version, discover, head_version, run_migrations
+import app.models  # noqa: F401  註冊所有模型
+
+
+def _fresh_engine():
+    path = os.path.join(tempfile.mkdtemp(prefix="chat-migrations-"), "fresh.db")
+    return create_engine(f"sqlite:///{path}")
+
+
+def test_versions_are_unique_and_contiguous():
+    versions = [version for version, _, _ in discover()]
+    assert versions == list(range(1, len(versions) + 1))
+    assert head_version() == versions[-1]
+
+
+def test_fresh_database_reaches_head_in_order():
+    engine = _fresh_engine()
+    executed = run_migrations(engine)
+    assert executed == [version for version, _, _ in discover()]
+    with engine.connect() as conn:
+        recorded = [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+    assert recorded == executed
+    assert current_version(engine) == head_version()
+    # 已是最新版本時不再執行任何遷移
+    assert run_migrations(engine) == []
+
+
+def test_partial_upgrade_stops_at_target():
+    engine = _fresh_engine()
+    assert run_migrations(engine, target=3) == [1, 2, 3]
+    insp = inspect(engine)
+    assert "deleted_at" in {column["name"] for column in insp.get_columns("rooms")}
+    assert "ix_messages_room_timestamp" not in {index["name"] for index in insp.get_indexes("messages")}
+    assert current_version(engine) == 3
+
+    run_migrations(engine)
+    assert "ix_messages_room_timestamp" in {index["name"] for index in inspect(engine).get_indexes("messages")}
+
+
+def test_migrated_schema_matches_models():
+    engine = _fresh_engine()
+    run_migrations(engine)
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        assert insp.has_table(table.name), table.name
+        columns = {column["name"] for column in insp.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}, table.name
+        indexes = {index["name"] for index in insp.get_indexes(table.name)}
+        indexes |= {constraint["name"] for constraint in insp.get_unique_constraints(table.name)}
+        expected = {index.name for index in table.indexes}
+        expected |= {constraint.name for constraint in table.constraints if constraint.name and constraint.name.startswith("uq_")}
+        assert expected <= indexes, (table.name, expected - indexes)
+
+
+def test_migrations_do_not_depend_on_models():
+    # 遷移是固定快照：引用模型會讓已發布的遷移隨模型修改而改變
+    for _, name, module in discover():
+        with open(module.__file__, encoding="utf-8") as source:
+            code = source.read()
+        assert "from app.models" not in code and "import app.models" not in code and ".metadata" not in code, name
+
+
+def test_redo_reruns_an_applied_migration():
+    engine = _fresh_engine()
+    run_migrations(engine)
+    # ID 轉換只在 MySQL 且 DB_ID_STORAGE=binary16 時生效，SQLite 上重新執行不做任何修改
+    assert run_migrations(engine, redo=11) == [11]
+    assert current_version(engine) == head_version()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import pytest
+
+from app.codec import ENCODING_JSON, encode_event
+from app.config import settings
+from app.connections import ConnectionRecord
+from app.metrics import metrics
+from app.outbound import OutboundQueueFull, deliver, queue_event
+from app.websocket import ConnectionManager
+
+
+class SlowWebSocket:
+    """send 在 gate 打開前一直等待（模擬緩衝區已滿的慢連接）"""
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.sent = []
+        self.closed = None
+        self.fail_after = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        await self.gate.wait()
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise RuntimeError("socket closed")
+        self.sent.append(json.loads(frame)["type"])
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+def _deliver(record, message, errors=None):
+    errors = [] if errors is None else errors
+    return deliver(record, message, encode_event(message, ENCODING_JSON), lambda record, error: errors.append(error))
+
+
+def _event(event_type, user_id="u2"):
+    if event_type == "USER_LEFT":
+        return {"type": event_type, "payload": {"userId": user_id}}
+    return {"type": event_type, "payload": {"id": user_id, "isOnline": True}}
+
+
+def test_backlog_is_sent_by_priority():
+    async def scenario():
+        record = ConnectionRecord(SlowWebSocket(), "u1")
+        first = asyncio.create_task(_deliver(record, _event("USER_UPDATE", "u0")))
+        await asyncio.sleep(0)
+        assert record.sending
+        # 連接正在發送：後續事件直接入隊返回，扇出不等待慢連接
+        for event_type in ("USER_UPDATE", "ROOM_UPDATED", "TYPING", "NEW_MESSAGE"):
+            await _deliver(record, _event(event_type))
+        record.websocket.gate.set()
+        await first
+        while record.sending:
+            await asyncio.sleep(0)
+        return record
+
+    record = asyncio.run(scenario())
+    assert record.websocket.sent == ["USER_UPDATE", "NEW_MESSAGE", "ROOM_UPDATED", "USER_UPDATE", "TYPING"]
+    assert record.pending is None
+
+
+def test_presence_lane_drops_beyond_limit(monkeypatch):
+    monkeypatch.setattr(settings, "WS_OUTBOUND_MAX_LOW_PRIORITY", 2)
+    record = ConnectionRecord(SlowWebSocket(), "u1")
+    before = metrics.counters.get("websocket.outbound.dropped", 0)
+    for user_id in ("a", "b", "c"):
+        message = _event("USER_UPDATE", user_id)
+        queue_event(record, message, encode_event(message, ENCODING_JSON))
+    # 已在隊列中的用戶仍然合併，不算丟棄
+    message = _event("USER_LEFT", "a")
+    queue_event(record, message, encode_event(message, ENCODING_JSON))
+    assert len(record.pending[2]) == 2
+    assert metrics.counters["websocket.outbound.dropped"] - before == 1
+
+
+def test_message_overflow_closes_connection(monkeypatch):
+    monkeypatch.setattr(settings, "WS_OUTBOUND_MAX_QUEUED", 2)
+    manager = ConnectionManager()
+    websocket = SlowWebSocket()
+
+    async def scenario():
+        record = await manager.connect(websocket, "u1")
+        record.sending = True
+        for index in range(3):
+            await manager.send_personal_message({"type": "NEW_MESSAGE", "payload": {"id": index}}, "u1")
+        await asyncio.sleep(0)
+        return record
+
+    record = asyncio.run(scenario())
+    assert websocket.closed == (1013, "Outbound queue full")
+    assert "u1" not in manager.active_connections
+    assert record.pending is None
+
+
+def test_backlog_failure_reports_error():
+    errors = []
+
+    async def scenario():
+        record = ConnectionRecord(SlowWebSocket(), "u1")
+        record.websocket.fail_after = 1
+        first = asyncio.create_task(_deliver(record, _event("NEW_MESSAGE"), errors))
+        await asyncio.sleep(0)
+        await _deliver(record, _event("NEW_MESSAGE"), errors)
+        record.websocket.gate.set()
+        await first
+        while record.sending:
+            await asyncio.sleep(0)
+        return record
+
+    record = asyncio.run(scenario())
+    assert record.websocket.sent == ["NEW_MESSAGE"]
+    assert len(errors) == 1 and not record.sending
+
+
+def test_cancelled_send_releases_connection():
+    async def scenario():
+        record = ConnectionRecord(SlowWebSocket(), "u1")
+        # 扇出的發送超時（wait_for）會取消卡住的 deliver
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(_deliver(record, _event("NEW_MESSAGE")), timeout=0.01)
+        assert not record.sending
+        record.websocket.gate.set()
+        await _deliver(record, _event("NEW_MESSAGE"))
+        return record
+
+    record = asyncio.run(scenario())
+    assert record.websocket.sent == ["NEW_MESSAGE"] and not record.sending
+
+
+def test_queue_full_is_raised_for_messages(monkeypatch):
+    monkeypatch.setattr(settings, "WS_OUTBOUND_MAX_QUEUED", 1)
+    record = ConnectionRecord(SlowWebSocket(), "u1")
+    message = {"type": "ROOM_CREATED", "payload": {"id": "r1"}}
+    queue_event(record, message, encode_event(message, ENCODING_JSON))
+    with pytest.raises(OutboundQueueFull):
+        queue_event(record, _event("NEW_MESSAGE"), "{}")
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import tempfile
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.config import settings
+from app.metrics import metrics
+from app.pool_monitor import InstrumentedQueuePool, instrument_engine, per_worker_pool_limits
+
+
+def _pool(pool_size):
+    """連接數固定的連接池，借出等待 50ms 後超時"""
+    name = f"test-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(tempfile.mkdtemp(prefix="chat-pool-"), "pool.db")
+    engine = create_engine(
+        f"sqlite:///{path}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=0.05,
+        connect_args={"check_same_thread": False}
+    )
+    instrument_engine(engine, name)
+    return engine, name
+
+
+@pytest.fixture
+def small_pool():
+    engine, name = _pool(1)
+    yield engine, name
+    engine.dispose()
+
+
+def _count(name: str) -> int:
+    return metrics.counters.get(name, 0)
+
+
+@pytest.mark.parametrize("budget, workers, expected", [
+    (0, 4, (5, 10)),
+    (24, 4, (5, 1)),
+    (8, 4, (2, 0)),
+    (2, 4, (1, 0)),
+])
+def test_connection_budget_is_split_across_workers(monkeypatch, budget, workers, expected):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 5)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 10)
+    monkeypatch.setattr(settings, "DB_CONNECTION_BUDGET", budget)
+    monkeypatch.setattr(settings, "DB_WORKERS", workers)
+    assert per_worker_pool_limits() == expected
+
+
+def test_exhausted_pool_times_out_and_is_counted(small_pool):
+    engine, name = small_pool
+    held = engine.connect()
+    try:
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    finally:
+        held.close()
+    assert _count(f"db.pool.{name}.exhausted") == 1
+    assert _count(f"db.pool.{name}.timeouts") == 1
+    assert metrics.summaries[f"db.pool.{name}.checkout_wait_seconds"]["max"] >= 0.05
+
+
+def test_connection_held_across_await_is_flagged():
+    engine, name = _pool(2)
+
+    async def holder(started: asyncio.Event):
+        with engine.connect():
+            started.set()
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        started = asyncio.Event()
+        task = asyncio.create_task(holder(started))
+        await started.wait()
+        # 持有者仍在 await：本協程借出連接時檢測到
+        with engine.connect():
+            assert metrics.gauges[f"db.pool.{name}.checked_out"] == 2
+        await task
+
+    asyncio.run(scenario())
+    engine.dispose()
+    assert _count(f"db.pool.{name}.held_across_await") == 1
+
+
+def test_long_hold_is_counted(small_pool, monkeypatch):
+    engine, name = small_pool
+    monkeypatch.setattr(settings, "DB_POOL_HOLD_WARN_SECONDS", 0.0)
+    with engine.connect():
+        pass
+    assert _count(f"db.pool.{name}.long_held") == 1
+    assert metrics.gauges[f"db.pool.{name}.checked_out"] == 0
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from sqlalchemy import delete, insert
+
+from app.database import SessionLocal
+from app.models import PresenceConnection, PresenceWorker
+from app.presence import PresenceService, worker_id
+
+
+def _service(grace_seconds=0.0):
+    return PresenceService(grace_seconds=grace_seconds, flush_interval_ms=250, persist_interval_seconds=5, worker_stale_seconds=30)
+
+
+def _other_worker_connection(user_id, heartbeat_at=None):
+    db = SessionLocal()
+    db.execute(delete(PresenceWorker).where(PresenceWorker.worker_id == "other-host:1"))
+    db.execute(insert(PresenceWorker).values(worker_id="other-host:1", heartbeat_at=heartbeat_at or time.time()))
+    db.execute(insert(PresenceConnection).values(worker_id="other-host:1", user_id=user_id, connections=1))
+    db.commit()
+    db.close()
+
+
+def test_tabs_are_counted_once_and_last_close_starts_grace(engine):
+    presence = _service(grace_seconds=60)
+    presence.connected("u1")
+    presence.connected("u1")
+    presence.disconnected("u1")
+    assert presence.is_online("u1") and "u1" not in presence._offline_deadlines
+    presence.disconnected("u1")
+    assert presence.is_online("u1") and "u1" in presence._offline_deadlines
+    # 寬限期內重連取消離線
+    presence.connected("u1")
+    assert "u1" not in presence._offline_deadlines
+
+
+def test_flapping_within_one_flush_is_not_broadcast(engine, monkeypatch):
+    presence = _service()
+    sent = []
+
+    async def fake_broadcast(changes):
+        sent.append(dict(changes))
+
+    from app.websocket import websocket_manager
+    monkeypatch.setattr(websocket_manager, "broadcast_presence_batch", fake_broadcast)
+
+    async def scenario():
+        presence.connected("u2")
+        await presence.flush_broadcasts()
+        presence.disconnected("u2")
+        await presence._expire_deadlines()
+        presence.connected("u2")
+        await presence.flush_broadcasts()
+
+    asyncio.run(scenario())
+    assert sent == [{"u2": True}, {}]
+
+
+def test_offline_suppressed_while_connected_on_another_worker(engine):
+    presence = _service()
+    _other_worker_connection("u3")
+
+    async def scenario():
+        presence.connected("u3")
+        presence.disconnected("u3")
+        await presence._expire_deadlines()
+
+    asyncio.run(scenario())
+    assert not presence.is_online("u3")
+    # 只有上線事件，沒有離線事件
+    assert presence._pending_broadcast.get("u3") is True and presence._pending_persist.get("u3") is True
+
+
+def test_stale_worker_connections_are_ignored(engine):
+    presence = _service()
+    _other_worker_connection("u4", heartbeat_at=time.time() - 3600)
+
+    async def scenario():
+        presence.connected("u4")
+        presence.disconnected("u4")
+        await presence._expire_deadlines()
+
+    asyncio.run(scenario())
+    assert presence._pending_broadcast["u4"] is False
+
+
+def test_connection_counts_are_written_per_worker(engine):
+    presence = _service()
+
+    async def scenario():
+        presence.connected("u5")
+        presence.connected("u5")
+        await presence.flush_connection_counts()
+
+    asyncio.run(scenario())
+    db = SessionLocal()
+    row = db.query(PresenceConnection).filter(PresenceConnection.user_id == "u5").one()
+    assert row.worker_id == worker_id() and row.connections == 2
+    db.close()
+    # 本 worker 的記錄不算「其他 worker」
+    assert "u5" not in presence.connected_elsewhere(["u5"])
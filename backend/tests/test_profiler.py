@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import profiler as profiler_module
+from app.profiler import PROFILE_FILE_HEADER, Profiler, ProfilingMiddleware, StackSampler
+
+
+def busy_spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def _spin_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_spin, args=(stop,), name="spinner", daemon=True)
+    thread.start()
+    return thread, stop
+
+
+def _parse(folded: str) -> dict:
+    stacks = {}
+    for line in folded.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    return stacks
+
+
+def test_sampler_folds_stacks_of_selected_thread():
+    thread, stop = _spin_thread()
+    sampler = StackSampler(0.001, thread_ids=[thread.ident])
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    thread.join()
+
+    stacks = _parse(sampler.folded())
+    assert sampler.samples > 0 and sum(stacks.values()) == sampler.samples
+    # 根在前、葉在後；只採樣指定線程時不加線程名
+    assert all(stack.split(";")[-1].startswith("busy_spin (tests/test_profiler.py:") for stack in stacks)
+    assert not any(stack.startswith("thread ") for stack in stacks)
+
+
+def test_sampler_labels_threads_and_skips_itself():
+    thread, stop = _spin_thread()
+    sampler = StackSampler(0.001)
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    stop.set()
+    thread.join()
+
+    roots = {stack.split(";")[0] for stack in _parse(sampler.folded())}
+    assert "thread spinner" in roots and "thread profiler" not in roots
+
+
+def test_token_and_single_active_sampler(tmp_path):
+    assert not Profiler("", 5, 60, tmp_path).authorized("")
+    profiler = Profiler("secret", 1, 60, tmp_path)
+    assert not profiler.authorized(None) and not profiler.authorized("wrong")
+    assert profiler.authorized("secret")
+
+    sampler = profiler.start()
+    assert profiler.start() is None and profiler.busy
+    filename = profiler.finish(sampler, "request", "GET /api/messages/rooms/{id}")
+    assert not profiler.busy
+    assert filename.startswith("request-") and filename.endswith("-GET__api_messages_rooms__id.folded")
+    assert (tmp_path / filename).is_file()
+
+
+def _call(middleware, headers):
+    sent = []
+
+    async def app(scope, receive, send):
+        time.sleep(0.02)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        sent.append(message)
+
+    middleware.app = app
+    scope = {"type": "http", "method": "GET", "path": "/api/rooms", "headers": headers}
+    asyncio.run(middleware(scope, None, send))
+    return dict(sent[0]["headers"])
+
+
+def test_middleware_profiles_only_authorized_requests(tmp_path):
+    middleware = ProfilingMiddleware(None, Profiler("secret", 1, 60, tmp_path))
+    assert PROFILE_FILE_HEADER not in _call(middleware, [])
+    assert PROFILE_FILE_HEADER not in _call(middleware, [(b"x-profile-token", b"wrong")])
+
+    headers = _call(middleware, [(b"x-profile-token", b"secret")])
+    folded = (tmp_path / headers[PROFILE_FILE_HEADER].decode()).read_text(encoding="utf-8")
+    assert "app (tests/test_profiler.py:" in folded
+
+
+@pytest.fixture
+def worker_profiler(monkeypatch, tmp_path):
+    profiler = profiler_module.profiler
+    monkeypatch.setattr(profiler, "output_dir", tmp_path)
+    return profiler
+
+
+def test_worker_profile_endpoint(client, worker_profiler, monkeypatch):
+    assert client.post("/api/debug/profile", params={"seconds": 0.05}).status_code == 404
+
+    monkeypatch.setattr(worker_profiler, "token", "secret")
+    monkeypatch.setattr(worker_profiler, "max_seconds", 0.05)
+    assert client.post("/api/debug/profile", headers={"X-Profile-Token": "wrong"}).status_code == 403
+
+    response = client.post("/api/debug/profile", params={"seconds": 30}, headers={"X-Profile-Token": "secret"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    # 時長被限制在 PROFILING_MAX_SECONDS 內
+    assert data["seconds"] < 1 and data["samples"] > 0
+    assert (worker_profiler.output_dir / data["file"]).is_file()
@@ -0,0 +1,58 @@
+import re
+
+from app.config import settings
+from app.metrics import metrics
+from app.query_stats import ROUTE_QUERIES_PREFIX, ROUTE_SECONDS_PREFIX, route_summary
+
+HISTORY_ROUTE = "GET /api/messages/rooms/{room_id}"
+
+
+def _history(client, register):
+    _, headers = register()
+    room = client.post("/api/rooms", json={"name": "query-stats"}, headers=headers).json()
+    return lambda: client.get(f"/api/messages/rooms/{room['id']}", headers=headers)
+
+
+def test_server_timing_reports_request_queries(client, register, monkeypatch):
+    history = _history(client, register)
+    before = metrics.summaries.get(ROUTE_QUERIES_PREFIX + HISTORY_ROUTE, {}).get("count", 0)
+    response = history()
+    assert response.status_code == 200
+    match = re.fullmatch(r'db;dur=(\d+\.\d);desc="(\d+) queries"', response.headers["server-timing"])
+    assert match and int(match.group(2)) > 0
+
+    assert client.get("/api/debug/queries").status_code == 404
+    monkeypatch.setattr(settings, "DEBUG_TOKEN", "secret")
+    response = client.get("/api/debug/queries", headers={"X-Debug-Token": "secret"})
+    # 按路由模板記錄，而不是具體的房間 ID
+    summary = {route["route"]: route for route in response.json()["routes"]}
+    assert summary[HISTORY_ROUTE]["requests"] == before + 1
+    assert summary[HISTORY_ROUTE]["queries_max"] >= int(match.group(2))
+
+
+def test_server_timing_can_be_disabled(client, register, monkeypatch):
+    history = _history(client, register)
+    monkeypatch.setattr(settings, "DB_SERVER_TIMING", False)
+    assert "server-timing" not in history().headers
+
+
+def test_slow_queries_are_logged_with_route(client, register, monkeypatch, capsys):
+    history = _history(client, register)
+    monkeypatch.setattr(settings, "DB_SLOW_QUERY_MS", 0.0)
+    before = metrics.counters.get("db.slow_queries", 0)
+    history()
+    assert metrics.counters["db.slow_queries"] > before
+    assert f"({HISTORY_ROUTE}): SELECT" in capsys.readouterr().out
+
+
+def test_route_summary_orders_by_total_db_time():
+    for route, queries, seconds in (("GET /t/cheap", 1, 0.001), ("GET /t/heavy", 5, 0.2), ("GET /t/heavy", 3, 0.1)):
+        metrics.observe(ROUTE_QUERIES_PREFIX + route, queries)
+        metrics.observe(ROUTE_SECONDS_PREFIX + route, seconds)
+
+    routes = [route for route in route_summary() if route["route"].startswith("GET /t/")]
+    assert [route["route"] for route in routes] == ["GET /t/heavy", "GET /t/cheap"]
+    assert routes[0] == {
+        "route": "GET /t/heavy", "requests": 2, "queries_avg": 4.0, "queries_max": 5,
+        "db_ms_avg": 150.0, "db_ms_max": 200.0, "db_ms_total": 300.0,
+    }
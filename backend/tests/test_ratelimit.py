@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from app import ratelimit
+from app.ratelimit import DatabaseRateLimitBackend, MemoryRateLimitBackend, refill, retry_after
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", fake)
+    return fake
+
+
+def test_refill_is_capped_at_burst():
+    assert refill(0.0, 10.0, 12.0, rate=2.0, burst=10) == 4.0
+    assert refill(9.0, 10.0, 100.0, rate=2.0, burst=10) == 10.0
+    # 時鐘回撥不會扣減令牌
+    assert refill(3.0, 10.0, 5.0, rate=2.0, burst=10) == 3.0
+    assert retry_after(0.5, rate=2.0) == 0.25
+
+
+def test_memory_bucket_allows_burst_then_limits(clock):
+    backend = MemoryRateLimitBackend(max_keys=10)
+    assert all(backend.take("k", rate=2.0, burst=3) == 0.0 for _ in range(3))
+    assert backend.take("k", rate=2.0, burst=3) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert backend.take("k", rate=2.0, burst=3) == 0.0
+    assert backend.take("k", rate=2.0, burst=3) > 0
+
+
+def test_memory_backend_evicts_least_recently_used(clock):
+    backend = MemoryRateLimitBackend(max_keys=2)
+    backend.take("a", rate=1.0, burst=1)
+    backend.take("b", rate=1.0, burst=1)
+    backend.take("a", rate=1.0, burst=1)
+    backend.take("c", rate=1.0, burst=1)
+    assert backend.size == 2
+    assert set(backend._buckets) == {"a", "c"}
+
+
+def test_database_bucket_is_shared_and_keeps_sub_second_time(engine):
+    # 兩個後端實例模擬兩個 worker
+    first = DatabaseRateLimitBackend(engine, stale_seconds=3600)
+    second = DatabaseRateLimitBackend(engine, stale_seconds=3600)
+    key = f"test:{time.time()}"
+    assert first.take(key, rate=1.0, burst=2) == 0.0
+    assert second.take(key, rate=1.0, burst=2) == 0.0
+    wait = first.take(key, rate=1.0, burst=2)
+    assert 0 < wait <= 1.0
+
+    table = ratelimit.RateLimitBucket.__table__
+    with engine.connect() as conn:
+        updated_at = conn.execute(table.select().where(table.c.key == key)).first().updated_at
+    assert abs(updated_at - time.time()) < 5
+
+
+def test_route_returns_429_with_retry_after(client, register, monkeypatch):
+    monkeypatch.setitem(ratelimit.LIMITS, "messages.search", (0.5, 2))
+    _, headers = register()
+    for _ in range(2):
+        assert client.get("/api/messages/search", params={"query": "hello"}, headers=headers).status_code == 200
+    response = client.get("/api/messages/search", params={"query": "hello"}, headers=headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
@@ -0,0 +1,141 @@
+"""
+讀寫分離：主庫和只讀副本各用一個 SQLite 文件，副本中放一條主庫沒有的房間記錄，
+查詢結果能區分讀取走了哪個庫
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from app import database
+from app.database import ReadReplica, ReplicaLagMonitor, SessionLocal, build_engine
+from app.migrations import run_migrations
+from app.models import Room, User
+
+REPLICA_ONLY_ROOM = "replica-only-room"
+
+
+@pytest.fixture
+def replica(engine, monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(prefix="chat-replica-"), "replica.db")
+    replica_engine = build_engine(f"sqlite:///{path}", "replica-test")
+    run_migrations(replica_engine)
+    with replica_engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(
+            id="replica-owner", name="owner", email="replica-owner@example.com", password_hash="x", avatar=""
+        ))
+        conn.execute(Room.__table__.insert().values(id=REPLICA_ONLY_ROOM, name="replica", created_by="replica-owner"))
+    replica = ReadReplica("replica-test", replica_engine, max_lag_seconds=2, check_interval_seconds=5)
+    monkeypatch.setattr(database, "read_replicas", [replica])
+    yield replica
+    replica_engine.dispose()
+
+
+def _reads_replica(user_id="reader", last_write_at=None) -> bool:
+    db = SessionLocal()
+    db.info["replica_ok"] = True
+    db.info["user_id"] = user_id
+    db.info["last_write_at"] = last_write_at
+    try:
+        return db.query(Room.id).filter(Room.id == REPLICA_ONLY_ROOM).first() is not None
+    finally:
+        db.close()
+
+
+def test_reads_stay_on_primary_until_lag_is_measured(replica):
+    assert not _reads_replica()
+    replica.refresh()
+    assert _reads_replica()
+
+
+def test_routing_never_measures_lag(replica, monkeypatch):
+    replica.refresh()
+    calls = []
+    monkeypatch.setattr(replica, "measure_lag", lambda: calls.append(1) or 0.0)
+    for _ in range(5):
+        assert _reads_replica()
+    assert calls == []
+
+
+def test_lagging_or_broken_replica_falls_back_to_primary(replica, monkeypatch):
+    monkeypatch.setattr(replica, "measure_lag", lambda: 30.0)
+    replica.refresh()
+    assert not _reads_replica()
+
+    def broken():
+        raise RuntimeError("replica down")
+
+    monkeypatch.setattr(replica, "measure_lag", broken)
+    replica.refresh()
+    assert replica.lag is None and not _reads_replica()
+
+
+def test_stale_measurement_falls_back_to_primary(replica):
+    replica.refresh()
+    replica._checked_at -= replica.check_interval * 3 + 1
+    assert not _reads_replica()
+
+
+def _load_user(user_id) -> User:
+    """另一個 worker 上的請求：get_current_user 從主庫重新載入用戶"""
+    db = SessionLocal()
+    try:
+        return db.get(User, user_id)
+    finally:
+        db.close()
+
+
+def _write_as(user_id):
+    db = SessionLocal()
+    db.info["user_id"] = user_id
+    try:
+        db.add(Room(name="written", created_by=user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_recent_write_is_visible_to_every_worker(replica, register, monkeypatch):
+    replica.refresh()
+    user, _ = register()
+    monkeypatch.setattr(database.settings, "DB_READ_YOUR_WRITES_SECONDS", 0)
+    assert _reads_replica(user["id"], _load_user(user["id"]).last_write_at)
+
+    before = _load_user(user["id"])
+    monkeypatch.setattr(database.settings, "DB_READ_YOUR_WRITES_SECONDS", 5)
+    _write_as(user["id"])
+    after = _load_user(user["id"])
+    # 寫入時間記錄在主庫的用戶行上，不依賴處理寫入的進程
+    assert after.last_write_at > before.last_write_at
+    assert after.updated_at == before.updated_at
+    assert not _reads_replica(user["id"], after.last_write_at)
+    assert _reads_replica("someone-else")
+
+
+def test_read_only_transactions_do_not_stamp(engine, register):
+    user, _ = register()
+    before = _load_user(user["id"]).last_write_at
+    db = SessionLocal()
+    db.info["user_id"] = user["id"]
+    try:
+        db.query(Room.id).all()
+        db.commit()
+    finally:
+        db.close()
+    assert _load_user(user["id"]).last_write_at == before
+
+
+def test_monitor_refreshes_in_background(replica):
+    monitor = ReplicaLagMonitor([replica], interval_seconds=60)
+
+    async def scenario():
+        monitor.start()
+        for _ in range(100):
+            if replica.lag is not None:
+                break
+            await asyncio.sleep(0.01)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert replica.lag == 0.0 and replica.is_usable()
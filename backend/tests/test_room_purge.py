@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import room_purge
+from app.models import Message, Room, utcnow
+from app.room_purge import ClaimLost, RoomPurger
+
+
+def _purger():
+    return RoomPurger(batch_size=2, pause_seconds=0, claim_stale_seconds=60)
+
+
+def _deleted_room(client, register, db, messages=5):
+    _, headers = register()
+    room = client.post("/api/rooms", json={"name": "purge"}, headers=headers).json()
+    for index in range(messages):
+        client.post("/api/messages", json={"room_id": room["id"], "content": f"m{index}"}, headers=headers)
+    # 直接軟刪除，避免應用內的全局清理器參與
+    db.query(Room).filter(Room.id == room["id"]).update({Room.deleted_at: utcnow()})
+    db.commit()
+    return room["id"]
+
+
+def _as_worker(monkeypatch, name):
+    monkeypatch.setattr(room_purge, "worker_id", lambda: name)
+
+
+def _set_claim(db, room_id, owner, claimed_at):
+    db.query(Room).filter(Room.id == room_id).update({Room.purge_claimed_by: owner, Room.purge_claimed_at: claimed_at})
+    db.commit()
+
+
+def test_purge_deletes_messages_in_batches_off_the_loop(client, register, db, monkeypatch):
+    room_id = _deleted_room(client, register, db)
+    purger = _purger()
+    threads = set()
+    delete_batch = purger._delete_batch
+
+    def recording_delete_batch(room_id):
+        threads.add(threading.get_ident())
+        return delete_batch(room_id)
+
+    monkeypatch.setattr(purger, "_delete_batch", recording_delete_batch)
+
+    async def scenario():
+        purger.schedule(room_id)
+        await purger._tasks[room_id]
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    progress = purger.get_progress(room_id)
+    assert progress["status"] == "done"
+    assert progress["total"] == 5 and progress["deleted_messages"] == 5
+    assert db.query(Message).filter(Message.room_id == room_id).count() == 0
+    assert db.query(Room).filter(Room.id == room_id).count() == 0
+    assert threads and loop_thread not in threads
+
+
+def test_only_one_worker_purges_a_room(client, register, db, monkeypatch):
+    room_id = _deleted_room(client, register, db)
+    _as_worker(monkeypatch, "worker-a:1")
+    assert _purger()._claim(room_id)
+
+    # 另一個 worker 啟動時的掃描跳過已被認領的房間，直接調度也不會執行
+    _as_worker(monkeypatch, "worker-b:2")
+    other = _purger()
+    assert room_id not in other._unclaimed_rooms()
+
+    async def scenario():
+        other.schedule(room_id)
+        await other._tasks[room_id]
+
+    asyncio.run(scenario())
+    assert other.get_progress(room_id) is None
+    assert db.query(Message).filter(Message.room_id == room_id).count() == 5
+
+
+def test_stale_claim_is_taken_over(client, register, db, monkeypatch):
+    room_id = _deleted_room(client, register, db, messages=1)
+    _set_claim(db, room_id, "dead-worker:1", time.time() - 120)
+    _as_worker(monkeypatch, "worker-b:2")
+    purger = _purger()
+    assert room_id in purger._unclaimed_rooms()
+
+    async def scenario():
+        await purger.resume_pending()
+        await purger._tasks[room_id]
+
+    asyncio.run(scenario())
+    assert purger.get_progress(room_id)["status"] == "done"
+    assert db.query(Room).filter(Room.id == room_id).count() == 0
+
+
+def test_purge_stops_when_claim_is_lost(client, register, db, monkeypatch):
+    room_id = _deleted_room(client, register, db)
+    _as_worker(monkeypatch, "worker-a:1")
+    purger = _purger()
+    assert purger._claim(room_id)
+    _set_claim(db, room_id, "worker-b:2", time.time())
+
+    with pytest.raises(ClaimLost):
+        purger._delete_batch(room_id)
+    assert db.query(Message).filter(Message.room_id == room_id).count() == 5
+
+
+def test_stop_releases_claims(client, register, db, monkeypatch):
+    room_id = _deleted_room(client, register, db, messages=0)
+    _as_worker(monkeypatch, "worker-a:1")
+    purger = _purger()
+    assert purger._claim(room_id)
+
+    purger._release([room_id])
+    db.expire_all()
+    room = db.query(Room).filter(Room.id == room_id).first()
+    assert room.purge_claimed_by is None and room.purge_claimed_at is None
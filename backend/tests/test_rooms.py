@@ -0,0 +1,45 @@
+from app.models import RoomMember
+from app.routers.rooms import _insert_member
+
+
+def _member_count(db, room_id, user_id):
+    return db.query(RoomMember).filter(RoomMember.room_id == room_id, RoomMember.user_id == user_id).count()
+
+
+def test_join_persists_membership_once(client, register, db):
+    owner, owner_headers = register()
+    member, member_headers = register()
+    room = client.post("/api/rooms", json={"name": "persisted"}, headers=owner_headers).json()
+
+    for _ in range(2):
+        response = client.post(f"/api/rooms/{room['id']}/join", json={}, headers=member_headers)
+        assert response.status_code == 200, response.text
+
+    assert _member_count(db, room["id"], member["id"]) == 1
+    assert _member_count(db, room["id"], owner["id"]) == 1
+
+
+def test_concurrent_insert_is_treated_as_joined(client, register, db, engine, monkeypatch):
+    owner, owner_headers = register()
+    member, _ = register()
+    room = client.post("/api/rooms", json={"name": "race"}, headers=owner_headers).json()
+
+    # 另一個請求在本請求檢查之後、插入之前已經插入了同一行
+    from app.database import SessionLocal
+    other = SessionLocal()
+    other.add(RoomMember(room_id=room["id"], user_id=member["id"]))
+    other.commit()
+    other.close()
+
+    class _Missing:
+        def filter(self, *args):
+            return self
+
+        def first(self):
+            return None
+
+    monkeypatch.setattr(db, "query", lambda *args: _Missing())
+    _insert_member(db, member["id"], room["id"])
+    monkeypatch.undo()
+
+    assert _member_count(db, room["id"], member["id"]) == 1
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from app.auth import verify_password
+from benchmarks.loadtest import percentiles
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _seed(path: str, *extra: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [
+            sys.executable, "benchmarks/seed.py", "--url", f"sqlite:///{path}",
+            "--users", "8", "--rooms", "3", "--messages", "120", "--batch", "25",
+            "--rooms-per-user", "2", "--relationships-per-user", "2",
+            "--base64-avatar-ratio", "0.5", "--base64-avatar-bytes", "300", *extra
+        ],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+
+
+def _dump(path: str) -> dict:
+    with sqlite3.connect(path) as conn:
+        return {
+            "users": conn.execute("SELECT email, password_hash, avatar FROM users ORDER BY email").fetchall(),
+            "messages": conn.execute("SELECT room_id, sender_id, content, timestamp FROM messages ORDER BY id").fetchall(),
+            "outsiders": conn.execute(
+                "SELECT COUNT(*) FROM messages m WHERE NOT EXISTS ("
+                "SELECT 1 FROM room_members rm WHERE rm.room_id = m.room_id AND rm.user_id = m.sender_id)"
+            ).fetchone()[0],
+            "rooms": conn.execute("SELECT COUNT(*) FROM rooms").fetchone()[0],
+        }
+
+
+def test_seed_generates_consistent_data():
+    path = os.path.join(tempfile.mkdtemp(prefix="chat-seed-"), "seed.db")
+    result = _seed(path)
+    assert result.returncode == 0, result.stderr
+    data = _dump(path)
+
+    assert data["rooms"] == 3
+    assert len(data["users"]) == 8
+    assert data["users"][0][0] == "seed0@example.com"
+    # 所有用戶共用同一個密碼哈希，loadtest.py 用同一個密碼登入
+    assert len({row[1] for row in data["users"]}) == 1
+    assert verify_password("password123", data["users"][0][1])
+    assert any(row[2].startswith("data:image/png;base64,") for row in data["users"])
+    # 批量大小不整除時最後一批也要插入；消息時間遞增且發送者都是房間成員
+    assert len(data["messages"]) == 120
+    timestamps = [row[3] for row in data["messages"]]
+    assert timestamps == sorted(timestamps) and len(set(timestamps)) == len(timestamps)
+    assert data["outsiders"] == 0
+
+
+def test_seed_is_reproducible_and_refuses_seeded_database():
+    directory = tempfile.mkdtemp(prefix="chat-seed-")
+    first, second = os.path.join(directory, "a.db"), os.path.join(directory, "b.db")
+    assert _seed(first, "--seed", "3").returncode == 0
+    assert _seed(second, "--seed", "3").returncode == 0
+    assert [row[2] for row in _dump(first)["messages"]] == [row[2] for row in _dump(second)["messages"]]
+
+    again = _seed(first)
+    assert again.returncode != 0
+    assert _dump(first)["rooms"] == 3
+
+
+def test_percentiles_are_reported_in_milliseconds():
+    assert percentiles([]) == {"count": 0}
+    summary = percentiles([index / 1000 for index in range(1, 101)])
+    assert summary == {"count": 100, "p50_ms": 51.0, "p90_ms": 91.0, "p99_ms": 100.0, "max_ms": 100.0}
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app import shutdown
+from app.database import SessionLocal
+from app.models import PresenceHold, User
+from app.presence import PresenceService
+from app.shutdown import CLOSE_SERVICE_RESTART, ShutdownDrain
+
+
+def _service(grace_seconds=60):
+    return PresenceService(grace_seconds=grace_seconds, flush_interval_ms=250, persist_interval_seconds=5, worker_stale_seconds=30)
+
+
+@pytest.fixture
+def presence(monkeypatch):
+    service = _service()
+    monkeypatch.setattr(shutdown, "presence_service", service)
+    return service
+
+
+def test_drain_sends_spread_hints_and_closes_once(presence, fake_websocket, fake_manager):
+    sockets = [fake_websocket() for _ in range(50)]
+    drain = ShutdownDrain(reconnect_min_ms=100, reconnect_max_ms=5000, timeout_seconds=5)
+    asyncio.run(drain.drain(fake_manager(sockets)))
+    # 重複調用不再發送
+    asyncio.run(drain.drain(fake_manager(sockets)))
+
+    delays = []
+    for socket in sockets:
+        assert socket.closed[0] == CLOSE_SERVICE_RESTART
+        assert len(socket.sent) == 1 and socket.sent[0]["type"] == "RECONNECT"
+        delays.append(socket.sent[0]["payload"]["delayMs"])
+    assert all(100 <= delay <= 5000 for delay in delays)
+    assert len(set(delays)) > 1
+    assert drain.draining and presence._holding
+
+
+def test_drain_gives_up_on_stuck_connections(presence, fake_websocket, fake_manager):
+    sockets = [fake_websocket(), fake_websocket(hang=True)]
+    drain = ShutdownDrain(reconnect_min_ms=0, reconnect_max_ms=0, timeout_seconds=0.05)
+    asyncio.run(asyncio.wait_for(drain.drain(fake_manager(sockets)), timeout=2))
+    assert sockets[0].closed[0] == CLOSE_SERVICE_RESTART
+    assert sockets[1].closed is None
+
+
+def test_disconnects_while_holding_keep_users_online(presence):
+    presence.connected("u1")
+    presence.hold_online(reconnect_seconds=15)
+    presence.disconnected("u1")
+    assert presence.is_online("u1") and "u1" not in presence._offline_deadlines
+    assert presence._held_users == {"u1"}
+
+
+def test_reconnect_to_new_process_is_not_rebroadcast(presence):
+    presence.connected("u1", persisted_online=True)
+    assert presence.is_online("u1")
+    assert presence._pending_broadcast == {} and presence._pending_persist == {}
+
+
+def test_new_connections_are_turned_away_while_draining(client, monkeypatch):
+    monkeypatch.setattr(shutdown.shutdown_drain, "draining", True)
+    with client.websocket_connect("/ws?token=anything") as websocket:
+        assert websocket.receive_json()["type"] == "RECONNECT"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == CLOSE_SERVICE_RESTART
+
+
+def _online_in_db(user_id):
+    db = SessionLocal()
+    try:
+        return db.get(User, user_id).is_online, db.get(PresenceHold, user_id) is not None
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def drained_user(register, monkeypatch, fake_websocket, fake_manager):
+    """用戶連接在被排空的 worker 上，排空後斷開，該 worker 隨即停止"""
+    user, _ = register()
+    old = _service(grace_seconds=0)
+    monkeypatch.setattr(shutdown, "presence_service", old)
+    old.connected(user["id"], persisted_online=True)
+    drain = ShutdownDrain(reconnect_min_ms=0, reconnect_max_ms=0, timeout_seconds=1)
+
+    async def scenario():
+        await drain.drain(fake_manager([fake_websocket()]))
+        old.disconnected(user["id"])
+        await old.stop()
+
+    asyncio.run(scenario())
+    return user["id"]
+
+
+def test_user_who_never_reconnects_ends_up_offline(drained_user):
+    user_id = drained_user
+    # 關閉後仍保持在線，等待重連
+    assert _online_in_db(user_id) == (True, True)
+
+    survivor = _service()
+    asyncio.run(survivor.persist())
+    assert _online_in_db(user_id) == (False, False)
+    assert survivor._pending_broadcast == {user_id: False}
+
+
+def test_user_who_reconnected_stays_online(drained_user):
+    user_id = drained_user
+    new_worker = _service()
+
+    async def scenario():
+        new_worker.connected(user_id, persisted_online=True)
+        await new_worker.flush_connection_counts()
+        await new_worker.persist()
+        await new_worker.stop()
+
+    asyncio.run(scenario())
+    assert _online_in_db(user_id) == (True, False)
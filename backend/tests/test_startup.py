@@ -0,0 +1,77 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+import pytest
+
+from app.routers import upload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(script: str, upload_dir: str) -> str:
+    """在乾淨的子進程中執行腳本（模擬 gunicorn master 導入應用）"""
+    workdir = tempfile.mkdtemp(prefix="chat-startup-")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    env["UPLOAD_DIR"] = upload_dir
+    result = subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(script)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_pillow_or_touch_upload_dir():
+    upload_dir = os.path.join(tempfile.mkdtemp(prefix="chat-startup-"), "uploads")
+    output = _run("""
+        import sys
+        import main
+        print("PIL" in sys.modules)
+    """, upload_dir)
+    assert output.splitlines()[-1] == "False"
+    assert not os.path.exists(upload_dir)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="os.fork is not available")
+def test_forked_child_gets_fresh_pool():
+    output = _run("""
+        import os
+        from sqlalchemy import text
+        from app.database import engine
+
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        parent_pool = engine.pool
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # 子進程：繼承的連接池已被替換，新連接屬於自己
+            fresh = engine.pool is not parent_pool
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            os.write(write, b"fresh" if fresh else b"shared")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        print(os.read(read, 16).decode())
+        print(engine.pool is parent_pool)
+    """, os.path.join(tempfile.mkdtemp(prefix="chat-startup-"), "uploads"))
+    assert output.splitlines()[-2:] == ["fresh", "True"]
+
+
+def test_webp_conversion_and_directories_on_demand(tmp_path):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (4000, 10), "red").save(buffer, format="PNG")
+    converted = upload.convert_to_webp(buffer.getvalue(), max_size=1920)
+    image = Image.open(io.BytesIO(converted))
+    assert image.format == "WEBP" and image.size == (1920, 4)
+
+    target = tmp_path / "avatars"
+    upload.ensure_directory(target)
+    assert target.is_dir()
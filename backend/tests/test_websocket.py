@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.outbound import drain, merge_events
+from app.websocket import ConnectionManager
+
+
+def _events(websocket):
+    """展開合併發送的數組幀"""
+    events = []
+    for frame in websocket.sent:
+        events.extend(frame if isinstance(frame, list) else [frame])
+    return events
+
+
+def _own_partial_presence(events, user_id):
+    return [
+        event for event in events
+        if (event["type"] == "USER_UPDATE" and event["payload"]["id"] == user_id and "favorites" not in event["payload"])
+        or (event["type"] == "USER_LEFT" and event["payload"]["userId"] == user_id)
+    ]
+
+
+def test_user_never_receives_own_partial_presence(engine, fake_websocket):
+    manager = ConnectionManager()
+    sockets = {"p1": [fake_websocket(), fake_websocket()], "p2": [fake_websocket()]}
+
+    async def scenario():
+        for user_id, websockets in sockets.items():
+            for websocket in websockets:
+                await manager.connect(websocket, user_id)
+            await manager.join_room(user_id, "room-1")
+        await manager.broadcast_presence_batch({"p1": True, "p2": False})
+
+    asyncio.run(scenario())
+    for user_id, websockets in sockets.items():
+        for websocket in websockets:
+            events = _events(websocket)
+            assert events, f"{user_id} should see the other member's presence"
+            assert _own_partial_presence(events, user_id) == []
+    assert _events(sockets["p2"][0]) == [{"type": "USER_UPDATE", "payload": {"id": "p1", "isOnline": True}}]
+    assert _events(sockets["p1"][0]) == [{"type": "USER_LEFT", "payload": {"userId": "p2"}}]
+
+
+def test_backlogged_own_update_keeps_private_fields(engine, fake_websocket):
+    manager = ConnectionManager()
+    websocket = fake_websocket()
+    user = SimpleNamespace(id="p3", name="P3", email="p3@example.com", avatar="", is_online=True, bio="")
+
+    async def scenario():
+        record = await manager.connect(websocket, user.id)
+        # 模擬慢連接：事件進入待發送通道並按用戶合併
+        record.sending = True
+        await manager.broadcast_user_update(user)
+        await manager.broadcast_presence_batch({user.id: False})
+        await manager.broadcast_presence_batch({user.id: True})
+        record.sending = False
+        await drain(record)
+
+    asyncio.run(scenario())
+    events = _events(websocket)
+    assert len(events) == 1
+    assert events[0]["type"] == "USER_UPDATE"
+    assert events[0]["payload"]["favorites"] == [] and events[0]["payload"]["blocked"] == []
+
+
+def test_merge_events_never_drops_profile_fields():
+    full = {"type": "USER_UPDATE", "payload": {"id": "u", "name": "U", "isOnline": True, "favorites": ["x"]}}
+    left = {"type": "USER_LEFT", "payload": {"userId": "u"}}
+    online = {"type": "USER_UPDATE", "payload": {"id": "u", "isOnline": True}}
+
+    merged = merge_events(full, left)
+    assert merged == {"type": "USER_UPDATE", "payload": {"id": "u", "name": "U", "isOnline": False, "favorites": ["x"]}}
+    # 後一個事件包含所有欄位時直接使用
+    assert merge_events(left, full) is full
+    assert merge_events(left, online) is online
+    assert merge_events(merged, online)["payload"]["favorites"] == ["x"]
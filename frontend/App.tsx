@@ -136,9 +136,13 @@ const App: React.FC = () => {
     setView('LOGIN');
   };
 
-  const handleUserUpdate = (updatedUser: User) => {
-    setUser(updatedUser);
-    localStorage.setItem('chat_current_user', JSON.stringify(updatedUser));
+  // 合併到當前用戶：實時事件可能只包含部分欄位（例如只有 isOnline），不能覆蓋整個對象
+  const handleUserUpdate = (updatedUser: Partial<User>) => {
+    setUser(prev => {
+      const merged = prev ? { ...prev, ...updatedUser } : updatedUser as User;
+      localStorage.setItem('chat_current_user', JSON.stringify(merged));
+      return merged;
+    });
   };
 
   if (user) {
@@ -11,7 +11,7 @@ import { api } from '../services/api';
 interface ChatAppProps {
   currentUser: User;
   onLogout: () => void;
-  onUserUpdate: (user: User) => void;
+  onUserUpdate: (user: Partial<User>) => void;
 }
 
 const ChatApp: React.FC<ChatAppProps> = ({ currentUser, onLogout, onUserUpdate }) => {
@@ -118,10 +118,8 @@ const ChatApp: React.FC<ChatAppProps> = ({ currentUser, onLogout, onUserUpdate }
           return;
         }
         
-        const [loadedRooms, loadedUsers] = await Promise.all([
-          api.getRooms(),
-          api.getUsers()
-        ]);
+        // 一次請求獲取房間和用戶列表
+        const { rooms: loadedRooms, users: loadedUsers } = await api.getBootstrap();
         
         setRooms(loadedRooms);
         setUsers(loadedUsers);
@@ -276,10 +274,7 @@ const ChatApp: React.FC<ChatAppProps> = ({ currentUser, onLogout, onUserUpdate }
           ));
           // 如果離線的是當前用戶，也更新當前用戶狀態
           if (event.payload.userId === currentUser.id) {
-            onUserUpdate({
-              ...currentUser,
-              isOnline: false,
-            });
+            onUserUpdate({ isOnline: false });
           }
           break;
       }
@@ -54,6 +54,14 @@ const apiRequest = async <T>(
         // 如果響應不是 JSON，使用 statusText
       }
       
+      // 被限流時提示多久後可以重試
+      if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After');
+        if (retryAfter) {
+          errorDetail = `${errorDetail} (retry in ${retryAfter}s)`;
+        }
+      }
+      
       // 如果是認證錯誤，清除 token
       if (response.status === 401 || response.status === 403) {
         removeToken();
@@ -426,6 +434,58 @@ export const api = {
     return api.getCurrentUser();
   },
 
+  // 啟動快照：一次獲取當前用戶、房間、用戶列表（可選當前房間最近消息）
+  async getBootstrap(roomId?: string): Promise<{
+    user: User;
+    rooms: Room[];
+    users: User[];
+    messages: Message[];
+    cursor: { lastMessageId: string | null; timestamp: string };
+  }> {
+    const query = roomId ? `?roomId=${encodeURIComponent(roomId)}` : '';
+    const data = await apiRequest<any>(`/bootstrap${query}`);
+    const toUser = (user: any): User => ({
+      id: user.id,
+      name: user.name,
+      email: user.email,
+      avatar: user.avatar,
+      isOnline: user.is_online ?? user.isOnline ?? false,
+      bio: user.bio,
+      favorites: user.favorites || [],
+      blocked: user.blocked || [],
+    });
+    const cursor = {
+      lastMessageId: data.cursor.last_message_id,
+      timestamp: data.cursor.timestamp,
+    };
+    // 讓實時連接從快照游標續接，重連時補發期間的新消息
+    import('./realtimeConnection').then(({ realtimeConnection }) => {
+      realtimeConnection.setCursor(cursor.lastMessageId, cursor.timestamp);
+    });
+    return {
+      user: toUser(data.user),
+      rooms: data.rooms.map((room: any) => ({
+        id: room.id,
+        name: room.name,
+        isPrivate: room.is_private,
+        createdBy: room.created_by,
+        description: room.description,
+      })),
+      users: data.users.map(toUser),
+      messages: data.messages.map((msg: any) => ({
+        id: msg.id,
+        roomId: msg.room_id,
+        senderId: msg.sender_id,
+        senderName: msg.sender_name,
+        senderAvatar: msg.sender_avatar,
+        content: msg.content,
+        type: msg.type,
+        timestamp: new Date(msg.timestamp).getTime(),
+      })),
+      cursor,
+    };
+  },
+
   // 房間
   async getRooms(): Promise<Room[]> {
     const rooms = await apiRequest<any[]>('/rooms');
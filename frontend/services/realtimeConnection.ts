@@ -20,6 +20,12 @@ interface RealtimeEvent {
 
 type EventListener = (event: RealtimeEvent) => void;
 
+// 服務端以 1012（Service Restart）關閉連接時沒有收到重連提示，使用的最大隨機延遲
+const RESTART_RECONNECT_MAX_MS = 15000;
+
+// 0 ~ maxMs 之間的隨機延遲，避免所有客戶端同時重連
+const jitter = (maxMs: number): number => Math.floor(Math.random() * maxMs);
+
 class RealtimeConnectionManager {
   private connectionType: ConnectionType = 'disconnected';
   private status: ConnectionStatus = 'disconnected';
@@ -29,9 +35,12 @@ class RealtimeConnectionManager {
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private lastMessageId: string | null = null;
+  private lastTimestamp: string | null = null;
   private token: string | null = null;
   private heartbeatTimer: NodeJS.Timeout | null = null;
   private isManualDisconnect = false;
+  // 服務端重啟前發送的 RECONNECT 提示中的延遲
+  private reconnectHintMs: number | null = null;
 
   /**
    * 連接實時服務
@@ -56,7 +65,10 @@ class RealtimeConnectionManager {
     this.connectionType = 'websocket';
 
     try {
-      this.ws = new WebSocket(`${WS_BASE_URL}/ws?token=${this.token}`);
+      // 帶上最後收到的消息 ID，服務端會補發斷線期間的消息
+      const resume = this.lastMessageId ? `&lastMessageId=${encodeURIComponent(this.lastMessageId)}` : '';
+      // batch=1：服務端開啟合併發送時，同一窗口內的多個事件以數組幀送達
+      this.ws = new WebSocket(`${WS_BASE_URL}/ws?token=${this.token}&batch=1${resume}`);
 
       this.ws.onopen = () => {
         console.log('[Realtime] WebSocket connected');
@@ -70,13 +82,9 @@ class RealtimeConnectionManager {
       this.ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          
-          // 忽略心跳響應
-          if (data.type === 'pong') {
-            return;
-          }
-
-          this.handleEvent(data);
+          // 合併發送的幀是事件數組，按順序逐個處理
+          const events: RealtimeEvent[] = Array.isArray(data) ? data : [data];
+          events.forEach(item => this.handleSocketEvent(item));
         } catch (error) {
           console.error('[Realtime] Error parsing WebSocket message:', error);
         }
@@ -100,6 +108,20 @@ class RealtimeConnectionManager {
           return;
         }
 
+        // 服務端重啟：按提示的隨機延遲重連 WebSocket，不降級到 Long Polling
+        if (this.reconnectHintMs !== null || event.code === 1012) {
+          const delay = this.reconnectHintMs ?? jitter(RESTART_RECONNECT_MAX_MS);
+          this.reconnectHintMs = null;
+          this.scheduleRestartReconnect(delay);
+          return;
+        }
+
+        // 服務端暫時拒絕（1013：連接過於頻繁或 worker 已滿）：退避後重連，不降級到 Long Polling
+        if (event.code === 1013) {
+          this.attemptReconnect();
+          return;
+        }
+
         // 如果 WebSocket 連接失敗，降級到 Long Polling
         if (this.reconnectAttempts === 0) {
           console.log('[Realtime] Falling back to Long Polling');
@@ -115,6 +137,33 @@ class RealtimeConnectionManager {
     }
   }
 
+  /**
+   * 處理 WebSocket 收到的單個事件
+   */
+  private handleSocketEvent(data: RealtimeEvent): void {
+    // 忽略心跳響應
+    if (data.type === 'pong') {
+      return;
+    }
+
+    // 回應服務端心跳
+    if (data.type === 'ping') {
+      this.ws?.send(JSON.stringify({ type: 'pong' }));
+      return;
+    }
+
+    // 服務端即將重啟，連接關閉後按延遲重連
+    if (data.type === 'RECONNECT') {
+      this.reconnectHintMs = data.payload?.delayMs ?? jitter(RESTART_RECONNECT_MAX_MS);
+      return;
+    }
+
+    if (data.type === 'NEW_MESSAGE' && data.payload?.id) {
+      this.lastMessageId = data.payload.id;
+    }
+    this.handleEvent(data);
+  }
+
   /**
    * 降級到 Long Polling
    */
@@ -137,7 +186,11 @@ class RealtimeConnectionManager {
 
     const poll = async () => {
       try {
-        const url = `${API_BASE_URL}/realtime/poll?lastMessageId=${this.lastMessageId || ''}`;
+        let url = `${API_BASE_URL}/realtime/poll?lastMessageId=${this.lastMessageId || ''}`;
+        // 已有快照時帶上時間戳，服務端不再重複返回房間和在線用戶列表
+        if (this.lastTimestamp) {
+          url += `&lastTimestamp=${encodeURIComponent(this.lastTimestamp)}`;
+        }
         const response = await fetch(url, {
           method: 'GET',
           headers: {
@@ -154,11 +207,14 @@ class RealtimeConnectionManager {
             data.events.forEach((event: RealtimeEvent) => {
               this.handleEvent(event);
               // 更新最後的消息 ID
-              if (event.payload?.id) {
+              if (event.type === 'NEW_MESSAGE' && event.payload?.id) {
                 this.lastMessageId = event.payload.id;
               }
             });
           }
+          if (data.timestamp) {
+            this.lastTimestamp = data.timestamp;
+          }
 
           // 立即開始下一次輪詢
           this.pollTimer = setTimeout(poll, 100);
@@ -190,6 +246,20 @@ class RealtimeConnectionManager {
     }
   }
 
+  /**
+   * 服務端重啟後延遲重連；新進程尚未就緒導致連接失敗時按正常流程退避重試
+   */
+  private scheduleRestartReconnect(delay: number): void {
+    console.log(`[Realtime] Server restarting, reconnecting WebSocket in ${delay}ms...`);
+    this.status = 'connecting';
+    this.reconnectAttempts = 1;
+    setTimeout(() => {
+      if (!this.isManualDisconnect) {
+        this.tryConnectWebSocket();
+      }
+    }, delay);
+  }
+
   /**
    * 嘗試重連 WebSocket
    */
@@ -200,7 +270,8 @@ class RealtimeConnectionManager {
 
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++;
-      const delay = Math.min(1000 * this.reconnectAttempts, 10000); // 最多 10 秒
+      // 最多 10 秒，加上隨機抖動避免同時重連
+      const delay = Math.min(1000 * this.reconnectAttempts, 10000) + jitter(1000);
 
       console.log(`[Realtime] Attempting to reconnect WebSocket (${this.reconnectAttempts}/${this.maxReconnectAttempts}) in ${delay}ms...`);
 
@@ -268,6 +339,19 @@ class RealtimeConnectionManager {
     this.listeners.clear();
     this.reconnectAttempts = 0;
     this.lastMessageId = null;
+    this.lastTimestamp = null;
+  }
+
+  /**
+   * 設置續接游標（來自 /api/bootstrap），已收到更新的消息時不回退
+   */
+  setCursor(lastMessageId: string | null, timestamp: string): void {
+    if (!this.lastMessageId) {
+      this.lastMessageId = lastMessageId;
+    }
+    if (!this.lastTimestamp) {
+      this.lastTimestamp = timestamp;
+    }
   }
 
   /**